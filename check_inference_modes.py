@@ -10,6 +10,10 @@ import requests
 import time
 from pathlib import Path
 
+# 项目目录：本脚本所在目录下的 dotsocr/
+DOTSOCR_DIR = Path(__file__).resolve().parent / "dotsocr"
+WEIGHTS_DIR = Path(os.environ.get("DOTS_WEIGHTS_DIR", DOTSOCR_DIR / "weights" / "DotsOCR")).expanduser()
+
 # 颜色定义
 class Colors:
     GREEN = '\033[0;32m'
@@ -141,7 +145,7 @@ def check_hf_mode():
         print_status("GPU支持", "❌", f"GPU检查失败: {e}")
     
     # 3. 检查模型权重
-    model_path = Path("/home/long/mnt/d/AIPJ/013DocAvatar/dotsocr/weights/DotsOCR")
+    model_path = WEIGHTS_DIR
     if model_path.exists():
         config_file = model_path / "config.json"
         if config_file.exists():
@@ -165,9 +169,9 @@ def check_hf_mode():
     try:
         # 切换到正确的工作目录
         original_cwd = os.getcwd()
-        os.chdir("/home/long/mnt/d/AIPJ/013DocAvatar/dotsocr")
+        os.chdir(DOTSOCR_DIR)
         
-        sys.path.insert(0, "/home/long/mnt/d/AIPJ/013DocAvatar/dotsocr")
+        sys.path.insert(0, str(DOTSOCR_DIR))
         from dots_ocr.parser import DotsOCRParser
         
         # 创建HF模式的解析器，只传入必要参数
@@ -200,7 +204,7 @@ def check_cpu_mode():
         print_status("系统信息", "⚠️", f"无法获取系统信息: {e}")
     
     # 2. 检查模型权重（同HF模式）
-    model_path = Path("/home/long/mnt/d/AIPJ/013DocAvatar/dotsocr/weights/DotsOCR")
+    model_path = WEIGHTS_DIR
     if model_path.exists():
         print_status("模型权重", "✅", f"模型文件存在: {model_path}")
     else:
@@ -210,26 +214,29 @@ def check_cpu_mode():
     # 3. 检查依赖
     try:
         import torch
-        # 强制CPU模式
-        import os
-        os.environ['CUDA_VISIBLE_DEVICES'] = ''
-        print_status("CPU模式", "✅", "强制使用CPU模式")
+        print_status("PyTorch", "✅", f"版本: {torch.__version__}，{torch.get_num_threads()} 线程")
     except ImportError:
         print_status("PyTorch", "❌", "PyTorch未安装")
         return False
     
-    # 4. 测试CPU模式加载
+    # 4. 测试CPU模式加载与推理
     try:
         # 切换到正确的工作目录
         original_cwd = os.getcwd()
-        os.chdir("/home/long/mnt/d/AIPJ/013DocAvatar/dotsocr")
+        os.chdir(DOTSOCR_DIR)
         
-        sys.path.insert(0, "/home/long/mnt/d/AIPJ/013DocAvatar/dotsocr")
+        sys.path.insert(0, str(DOTSOCR_DIR))
+        from PIL import Image
         from dots_ocr.parser import DotsOCRParser
+        from dots_ocr.utils.prompts import dict_promptmode_to_prompt
         
-        # 创建CPU模式的解析器，使用HF后端但强制CPU
-        parser = DotsOCRParser(use_hf=True)  # CPU模式也使用HF后端
-        print_status("CPU推理", "✅", "CPU模式可用")
+        # HF 后端放在 CPU 上：float32 + sdpa，而不是 GPU 的 bfloat16 + flash-attention
+        parser = DotsOCRParser(use_hf=True, hf_device="cpu")
+        start = time.time()
+        parser._inference_with_hf(
+            Image.new("RGB", (224, 224), "white"), dict_promptmode_to_prompt["prompt_ocr"], max_completion_tokens=8,
+        )
+        print_status("CPU推理", "✅", f"CPU模式可用，测试推理耗时 {time.time() - start:.1f}s")
         
         # 恢复原来的工作目录
         os.chdir(original_cwd)
@@ -1,15 +1,18 @@
 import os
 import io
+import asyncio
 import sys
 import uvicorn
 from fastapi import FastAPI, UploadFile, File, HTTPException, Query
-from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from typing import Optional
 from pathlib import Path
 from fastapi.concurrency import run_in_threadpool
 import json
+import time
 import hashlib
 import threading
+from contextlib import asynccontextmanager
 
 # Ensure local package is preferred over any installed one
 ROOT_DIR = str(Path(__file__).resolve().parents[1])
@@ -18,7 +21,16 @@ if ROOT_DIR not in sys.path:
 
 from dots_ocr.parser import DotsOCRParser
 
-app = FastAPI(title="dots.ocr API", version="1.0")
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    # load the DOTS_MODE parser in the background as the server starts
+    if PRELOAD:
+        _get_slot(DEFAULT_MODE)
+    yield
+
+
+app = FastAPI(title="dots.ocr API", version="1.0", lifespan=_lifespan)
 
 # Environment configuration
 DEFAULT_MODE = os.getenv("DOTS_MODE", "hf").lower()  # hf | vllm | online
@@ -32,6 +44,16 @@ TOP_P = float(os.getenv("DOTS_TOP_P", "1.0"))
 NUM_THREAD = int(os.getenv("DOTS_NUM_THREAD", "8"))
 DPI = int(os.getenv("DOTS_DPI", "200"))
 ATTN_IMPL = os.getenv("DOTS_ATTN_IMPL", "flash_attention_2")
+# Page level inference cache (directory or sqlite file), complements the whole-file cache below
+PAGE_CACHE = os.getenv("DOTS_PAGE_CACHE")
+PAGE_CACHE_MB = float(os.getenv("DOTS_PAGE_CACHE_MB", "0")) or None
+# Load the DOTS_MODE parser (and warm it up) when the server starts instead of on the first request
+PRELOAD = os.getenv("DOTS_PRELOAD", "1") != "0"
+WARMUP = os.getenv("DOTS_WARMUP", "1") != "0"
+MODES = ("hf", "cpu", "vllm", "online")
+# modes that load the model in this process; requests for them get a 503 until it is loaded and warm
+LOCAL_MODES = ("hf", "cpu")
+RETRY_AFTER_SECONDS = int(os.getenv("DOTS_RETRY_AFTER", "10"))
 
 # Online inference (StepFun) optional envs
 ONLINE_VENDOR = os.getenv("DOTS_ONLINE_VENDOR")
@@ -49,8 +71,8 @@ CACHE_DIR.mkdir(parents=True, exist_ok=True)
 USER_MD_DIR = Path(__file__).resolve().parent / "user_md"
 USER_MD_DIR.mkdir(parents=True, exist_ok=True)
 
-_parser_singleton = None
-_current_mode = None
+_parser_slots = {}
+_parser_slots_lock = threading.Lock()
 _inflight_locks = {}
 _inflight_mutex = threading.Lock()
 
@@ -80,7 +102,8 @@ def _weights_ready() -> bool:
 
 def _create_parser(mode: str) -> DotsOCRParser:
     mode = (mode or DEFAULT_MODE).lower()
-    use_hf = mode == "hf"
+    # cpu: the hf backend placed on the cpu (float32, sdpa)
+    use_hf = mode in ("hf", "cpu")
     # 构建兼容参数集
     kwargs = dict(
         ip=VLLM_IP,
@@ -93,6 +116,9 @@ def _create_parser(mode: str) -> DotsOCRParser:
         dpi=DPI,
         output_dir=OUTPUT_DIR,
         use_hf=use_hf,
+        hf_device="cpu" if mode == "cpu" else None,
+        page_cache=PAGE_CACHE,
+        page_cache_mb=PAGE_CACHE_MB,
     )
     if mode == "online":
         kwargs.update(
@@ -127,13 +153,91 @@ def _create_parser(mode: str) -> DotsOCRParser:
     return parser
 
 
-def get_parser(mode: Optional[str] = None) -> DotsOCRParser:
-    global _parser_singleton, _current_mode
-    desired = (mode or DEFAULT_MODE).lower()
-    if _parser_singleton is None or _current_mode != desired:
-        _parser_singleton = _create_parser(desired)
-        _current_mode = desired
-    return _parser_singleton
+class _ParserSlot:
+    """The parser of one mode, built (and warmed up) in a background thread."""
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.state = "loading"  # loading | warming | ready | failed
+        self.parser = None
+        self.error = None
+        self.status_code = 500
+        self.load_seconds = None
+        self.warmup_seconds = None
+        self.failed_at = None
+        self.ready = threading.Event()
+        threading.Thread(target=self._load, name=f"load-{mode}", daemon=True).start()
+
+    def _load(self):
+        try:
+            t0 = time.perf_counter()
+            parser = _create_parser(self.mode)
+            self.load_seconds = round(time.perf_counter() - t0, 3)
+            if WARMUP and self.mode in LOCAL_MODES:
+                self.state = "warming"
+                self.warmup_seconds = parser.warmup()
+            self.parser = parser
+            self.state = "ready"
+        except HTTPException as e:
+            self.state, self.error, self.status_code = "failed", e.detail, e.status_code
+            self.failed_at = time.monotonic()
+        except Exception as e:
+            self.state, self.error = "failed", f"Failed to initialize parser: {e}"
+            self.failed_at = time.monotonic()
+        finally:
+            self.ready.set()
+
+    def info(self) -> dict:
+        info = {"state": self.state, "load_seconds": self.load_seconds, "warmup_seconds": self.warmup_seconds}
+        if self.parser is not None and self.parser.load_stats:
+            info["model_load_seconds"] = self.parser.load_stats.get("load_seconds")
+        if self.error:
+            info["error"] = self.error
+        return info
+
+
+def _resolve_mode(mode: Optional[str]) -> str:
+    m = (mode or DEFAULT_MODE).lower()
+    if m not in MODES:
+        raise HTTPException(status_code=400, detail=f"unknown mode '{m}', should be one of {', '.join(MODES)}")
+    return m
+
+
+def _get_slot(mode: str) -> _ParserSlot:
+    with _parser_slots_lock:
+        slot = _parser_slots.get(mode)
+        # a failed load is reported as is, and attempted again once Retry-After has passed
+        if slot is None or (slot.state == "failed" and time.monotonic() - slot.failed_at > RETRY_AFTER_SECONDS):
+            if mode in LOCAL_MODES:
+                # one model resident at a time: loading a local mode releases the other one,
+                # its memory is freed once the requests still using it are done
+                for other in LOCAL_MODES:
+                    if other != mode and _parser_slots.pop(other, None) is not None:
+                        print(f"releasing the {other} parser for {mode}")
+            slot = _parser_slots[mode] = _ParserSlot(mode)
+        return slot
+
+
+async def get_parser(mode: Optional[str] = None) -> DotsOCRParser:
+    """
+    The parser of `mode`, one per mode (a 400 for an unknown one). Local model modes that are still loading or warming
+    up raise a 503 with Retry-After instead of holding the request for minutes; remote modes
+    wait for their (short) construction in a worker thread, never on the event loop.
+    """
+    desired = _resolve_mode(mode)
+    slot = _get_slot(desired)
+    if desired in LOCAL_MODES:
+        if not slot.ready.is_set():
+            raise HTTPException(
+                status_code=503,
+                detail=f"{desired} model is {slot.state}, retry later",
+                headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+            )
+    elif not slot.ready.is_set():
+        await asyncio.to_thread(slot.ready.wait)
+    if slot.state == "failed":
+        raise HTTPException(status_code=slot.status_code, detail=slot.error)
+    return slot.parser
 
 
 def _torch_env_info():
@@ -162,11 +266,22 @@ def _torch_env_info():
 
 @app.get("/health")
 def health(mode: Optional[str] = Query(default=None)):
-    m = (mode or DEFAULT_MODE).lower()
-    torch_info = _torch_env_info() if m == "hf" else {}
-    return {
-        "status": "ok",
+    """Readiness: 200 once the parser of the mode is loaded and warmed up, 503 before (or if it failed)."""
+    m = _resolve_mode(mode)
+    torch_info = _torch_env_info() if m in ("hf", "cpu") else {}
+    with _parser_slots_lock:
+        slot = _parser_slots.get(m)
+        parsers = {name: s.info() for name, s in _parser_slots.items()}
+    if slot is not None:
+        state = slot.state
+    else:
+        # a remote backend is built on first use; a local model that was never requested is not loaded
+        state = "not_loaded" if m in LOCAL_MODES else "ready"
+    payload = {
+        "status": "ok" if state == "ready" else state,
+        "ready": state == "ready",
         "mode": m,
+        "parsers": parsers,
         "model_name": MODEL_NAME,
         "weights_present": _weights_ready(),
         "output_dir": str(Path(OUTPUT_DIR).resolve()),
@@ -174,6 +289,31 @@ def health(mode: Optional[str] = Query(default=None)):
         "port": VLLM_PORT,
         **torch_info,
     }
+    return JSONResponse(content=payload, status_code=200 if state == "ready" else 503)
+
+
+def _page_payload(res: dict) -> dict:
+    md_text = None
+    md_path = res.get("md_content_path")
+    if md_path and os.path.exists(md_path):
+        try:
+            with open(md_path, "r", encoding="utf-8") as rf:
+                md_text = rf.read()
+        except Exception:
+            md_text = None
+
+    return {
+        "file_path": res.get("file_path"),
+        "page_no": res.get("page_no"),
+        "input_height": res.get("input_height"),
+        "input_width": res.get("input_width"),
+        "layout_info_path": res.get("layout_info_path"),
+        "layout_image_path": res.get("layout_image_path"),
+        "md_path": md_path,
+        "md": md_text,
+        "filtered": res.get("filtered", False),
+        "output_dir": str(Path(OUTPUT_DIR).resolve()),
+    }
 
 
 @app.post("/predict")
@@ -185,7 +325,7 @@ async def predict(
     user_hint: Optional[str] = Query(default=None, description="附加到基础提示词后，用于用户自定义约束"),
 ):
     try:
-        parser = get_parser(mode)
+        parser = await get_parser(mode)
     except HTTPException as e:
         raise e
     except Exception as e:
@@ -250,28 +390,7 @@ async def predict(
     if not results:
         raise HTTPException(status_code=500, detail="No result returned by parser")
 
-    res0 = results[0]
-    md_text = None
-    md_path = res0.get("md_content_path")
-    if md_path and os.path.exists(md_path):
-        try:
-            with open(md_path, "r", encoding="utf-8") as rf:
-                md_text = rf.read()
-        except Exception:
-            md_text = None
-
-    payload = {
-        "file_path": res0.get("file_path"),
-        "page_no": res0.get("page_no"),
-        "input_height": res0.get("input_height"),
-        "input_width": res0.get("input_width"),
-        "layout_info_path": res0.get("layout_info_path"),
-        "layout_image_path": res0.get("layout_image_path"),
-        "md_path": md_path,
-        "md": md_text,
-        "filtered": res0.get("filtered", False),
-        "output_dir": str(Path(OUTPUT_DIR).resolve()),
-    }
+    payload = _page_payload(results[0])
     # 写入永久缓存
     try:
         CACHE_DIR.mkdir(parents=True, exist_ok=True)
@@ -289,6 +408,55 @@ async def predict(
             except Exception:
                 pass
     return JSONResponse(content=payload)
+
+
+@app.post("/predict_stream")
+async def predict_stream(
+    file: UploadFile = File(...),
+    prompt: str = Query(default="prompt_layout_all_en"),
+    fitz_preprocess: bool = Query(default=True),
+    mode: Optional[str] = Query(default=None),
+    user_hint: Optional[str] = Query(default=None),
+    order: str = Query(default="completion", description="completion | page"),
+):
+    """Streams one json line per page (same fields as /predict) as soon as the page is parsed."""
+    if order not in ("completion", "page"):
+        raise HTTPException(status_code=400, detail="order should be 'completion' or 'page'")
+    try:
+        parser = await get_parser(mode)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to initialize parser: {e}")
+
+    suffix = Path(file.filename).suffix or ".bin"
+    tmp_path = TMP_DIR / f"upload_{os.getpid()}_{os.urandom(4).hex()}{suffix}"
+    content = await file.read()
+    with open(tmp_path, "wb") as f:
+        f.write(content)
+
+    # a sync generator: starlette iterates it in its threadpool
+    def _lines():
+        try:
+            for res in parser.iter_parse_file(
+                str(tmp_path),
+                prompt_mode=prompt,
+                fitz_preprocess=fitz_preprocess,
+                user_hint=user_hint,
+                order=order,
+            ):
+                yield json.dumps(_page_payload(res), ensure_ascii=False) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": f"Inference failed: {e}"}, ensure_ascii=False) + "\n"
+        finally:
+            try:
+                tmp_path.unlink(missing_ok=True)
+            except Exception:
+                pass
+
+    return StreamingResponse(_lines(), media_type="application/x-ndjson")
+
+
 @app.post("/save_markdown")
 async def save_markdown(payload: dict):
     try:
@@ -189,11 +189,10 @@ def process_annotation_data(annotation_data):
                 print(f"Image format conversion failed: {e}")
                 return None, None
     
-    # Get the coordinate information of the box (only one box)
-    box = boxes[0]
-    bbox = [box['xmin'], box['ymin'], box['xmax'], box['ymax']]
+    # Get the coordinate information of the boxes
+    bboxes = [[box['xmin'], box['ymin'], box['xmax'], box['ymax']] for box in boxes]
     
-    return image, bbox
+    return image, bboxes
 
 # ==================== Core Processing Function ====================
 def process_image_inference_with_annotation(annotation_data, test_image_input,
@@ -241,13 +240,15 @@ def process_image_inference_with_annotation(annotation_data, test_image_input,
     # Determine the input source and process annotation data
     image = None
     bbox = None
+    bboxes = None
     
     # Prioritize processing annotation data
     if annotation_data and annotation_data.get('image') is not None:
-        image, bbox = process_annotation_data(annotation_data)
+        image, bboxes = process_annotation_data(annotation_data)
         if image is not None:
             # If there's a bbox, force the use of 'prompt_grounding_ocr' mode
-            assert bbox is not None
+            assert bboxes
+            bbox = bboxes[0]
             prompt_mode = "prompt_grounding_ocr"
     
     # If there's no annotation data, check the test image input
@@ -262,6 +263,33 @@ def process_image_inference_with_annotation(annotation_data, test_image_input,
     if bbox is None:
         return "Please select a bounding box by mouse", "Please select a bounding box by mouse", "", "", gr.update(value=None)
     
+    if len(bboxes) > 1:
+        # Several boxes: the page is preprocessed and encoded once, the regions are recognized concurrently
+        try:
+            regions = dots_parser.parse_regions(image, bboxes, fitz_preprocess=fitz_preprocess)
+        except Exception as e:
+            return f"An error occurred during processing: {e}", f"An error occurred during processing: {e}", "", "", gr.update(value=None), ""
+        md_content = "\n\n".join(
+            f"**Region {i + 1}** `{region['bbox']}`\n\n{region.get('text') or region.get('error', '')}"
+            for i, region in enumerate(regions)
+        )
+        processing_results.update({'original_image': image, 'markdown_content': md_content, 'cells_data': regions})
+        info_text = f"""
+**Image Information:**
+- Original Dimensions: {image.width} x {image.height}
+- Processing Mode: Region OCR, {len(regions)} regions
+- Server: {current_config['ip']}:{current_config['port_vllm']}
+- Failed Regions: {sum(1 for region in regions if 'error' in region)}
+        """
+        return (
+            md_content,
+            info_text,
+            md_content,
+            md_content,
+            gr.update(visible=False),
+            json.dumps(regions, ensure_ascii=False, indent=2)
+        )
+    
     try:
         # Process using DotsOCRParser, passing the bbox parameter
         original_image = image
@@ -536,7 +564,7 @@ def create_gradio_interface():
                         - Method 1: Select an example image on the left and click "Load Image to Annotation Area".
                         - Method 2: Upload an image directly in the annotation area below (drag and drop or click to upload).
                         - Use the mouse to draw a box on the image to select the region for recognition.
-                        - Only one box can be drawn. To draw a new one, please delete the old one first.
+                        - Draw one box or several; several boxes are recognized together, one region per box.
                         - **Hotkey: Press the Delete key to remove the selected box.**
                         - After drawing a box, clicking Parse will automatically use the Region OCR mode.
                         """)
@@ -547,7 +575,7 @@ def create_gradio_interface():
                             height=600,
                             show_label=False,
                             elem_id="annotation_component",
-                            single_box=True,  # Only allow one box; a new box will replace the old one
+                            single_box=False,  # Several boxes are recognized together with parse_regions
                             box_min_size=10,
                             interactive=True,
                             disable_edit_boxes=True,  # Disable the edit dialog
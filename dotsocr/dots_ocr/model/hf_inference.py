@@ -0,0 +1,267 @@
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from pathlib import Path
+
+
+MEMORY_HEADROOM = 0.9   # fraction of the free memory a batch may plan to use
+HF_DTYPES = ('auto', 'float32', 'bfloat16', 'float16')
+HF_MAX_NEW_TOKENS = 24000   # default generation cap of a page in hf mode
+
+
+def resolve_hf_device(device=None):
+    """'auto' / None picks cuda when available, cpu otherwise."""
+    if device in (None, 'auto'):
+        import torch
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    return device
+
+
+def resolve_hf_dtype(dtype=None, device="cuda"):
+    """
+    The torch dtype for `device`: bfloat16 on gpus, float32 on cpus, where half precision
+    matmuls are only fast on recent cores and dynamic int8 quantization needs float32 weights.
+    """
+    import torch
+    assert dtype in (None,) + HF_DTYPES, f"dtype should be one of {HF_DTYPES}"
+    if dtype in (None, 'auto'):
+        return torch.float32 if str(device).startswith("cpu") else torch.bfloat16
+    return getattr(torch, dtype)
+
+
+def prefetch_weights(model_dir):
+    """
+    Asks the kernel to read the safetensors shards ahead (POSIX_FADV_WILLNEED), so the
+    memory-mapped tensors are paged in by concurrent readahead instead of one fault at a time.
+
+    Returns:
+        int: The bytes of the shards, 0 when the model has no safetensors files.
+    """
+    total = 0
+    for path in sorted(Path(model_dir).glob("*.safetensors")):
+        size = path.stat().st_size
+        total += size
+        if hasattr(os, "posix_fadvise"):
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                os.posix_fadvise(fd, 0, size, os.POSIX_FADV_WILLNEED)
+            finally:
+                os.close(fd)
+    return total
+
+
+def quantize_int8(model):
+    """Dynamic int8 quantization of the linear layers (weights int8, activations quantized per batch), cpu only."""
+    import torch
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def build_hf_messages(image, prompt, user_hint: str | None = None):
+    """Chat messages of one page for the transformers processor."""
+    messages = []
+    # 将用户提示词作为系统提示加入，不修改基础提示词内容
+    if user_hint:
+        hint = str(user_hint).strip()
+        if hint:
+            messages.append({
+                "role": "system",
+                "content": hint,
+            })
+    messages.append(
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "image",
+                    "image": image
+                },
+                {"type": "text", "text": prompt}
+            ]
+        }
+    )
+    return messages
+
+
+def is_out_of_memory(error):
+    try:
+        import torch
+        if isinstance(error, torch.cuda.OutOfMemoryError):
+            return True
+    except (ImportError, AttributeError):
+        pass
+    return isinstance(error, (RuntimeError, MemoryError)) and "out of memory" in str(error).lower()
+
+
+def generate_hf_batch(model, processor, process_vision_info, messages_list, max_new_tokens, device=None):
+    """
+    Runs one `generate` over several pages.
+
+    The prompts are left padded (the processor's tokenizer must have padding_side='left')
+    so that every sequence ends at the same position and the generated tokens of each page
+    start right after the common input length.
+
+    Args:
+        messages_list: The chat messages of each page, see `build_hf_messages`.
+        max_new_tokens: The token cap of each page; the batch generates up to the largest one
+            and every output is cut to its own cap.
+        device: Where the inputs go, the device of the model (its first layers) by default.
+
+    Returns:
+        list: The decoded response of each page.
+    """
+    texts = [
+        processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+        for messages in messages_list
+    ]
+    image_inputs, video_inputs = process_vision_info(messages_list)
+    # 兼容不同 transformers 版本：有的 Processor 无 video_processor
+    proc_kwargs = dict(
+        text=texts,
+        images=image_inputs,
+        padding=True,
+        return_tensors="pt",
+    )
+    try:
+        has_video = hasattr(processor, "video_processor") and processor.video_processor is not None
+    except Exception:
+        has_video = False
+    if has_video:
+        proc_kwargs["videos"] = video_inputs
+    inputs = processor(**proc_kwargs)
+    inputs = inputs.to(device or model.device)
+
+    generated_ids = model.generate(**inputs, max_new_tokens=max(max_new_tokens))
+    input_length = inputs.input_ids.shape[1]
+    generated_ids_trimmed = [
+        out_ids[input_length:input_length + cap] for out_ids, cap in zip(generated_ids, max_new_tokens)
+    ]
+    return processor.batch_decode(
+        generated_ids_trimmed, skip_special_tokens=True, clean_up_tokenization_spaces=False
+    )
+
+
+class GenerationBatcher:
+    """
+    Gathers the pages submitted by concurrent workers into batches for one generate call.
+
+    A worker thread takes the first waiting request, then collects more for up to `max_wait`
+    seconds or until `batch_size` requests are gathered, and runs `generate_batch` on them.
+    `batch_size` adapts to the memory: a batch that runs out of memory is split in halves
+    and the size stays below the failing one, `limit_by_memory` caps it from the measured
+    per page memory, and it grows back by one after `grow_after` consecutive successful batches.
+
+    Args:
+        generate_batch: Callable taking a list of requests and returning their results in order.
+        max_batch_size: Upper bound of the batch size.
+        max_wait: Seconds to wait for a batch to fill up once its first request arrived.
+        grow_after: Successful batches before the size is raised again.
+    """
+
+    def __init__(self, generate_batch, max_batch_size=8, max_wait=0.05, grow_after=8):
+        assert max_batch_size >= 1, "max_batch_size should be >= 1"
+        self.generate_batch = generate_batch
+        self.max_batch_size = max_batch_size
+        self.batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.grow_after = grow_after
+        self._memory_cap = max_batch_size
+        self._oom_cap = max_batch_size     # largest size below one that ran out of memory
+        self._successes = 0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.stats = {'batches': 0, 'pages': 0, 'oom_splits': 0, 'largest_batch': 0, 'generate_seconds': 0.0}
+
+    def submit(self, request):
+        """Blocks until the batch holding `request` has run, returns its result."""
+        future = Future()
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="hf-batcher", daemon=True)
+                self._thread.start()
+        self._queue.put((request, future))
+        return future.result()
+
+    def limit_by_memory(self, per_request_bytes, free_bytes):
+        """Caps the batch size to what fits in `free_bytes` at `per_request_bytes` a page."""
+        if per_request_bytes <= 0:
+            return
+        with self._lock:
+            self._memory_cap = max(1, min(self.max_batch_size, int(free_bytes * MEMORY_HEADROOM // per_request_bytes)))
+            self.batch_size = min(self.batch_size, self._memory_cap)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    item = self._queue.get(timeout=max(0.0, remaining)) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)  # stop after this batch
+                    break
+                batch.append(item)
+            self._execute(batch)
+
+    def _execute(self, batch):
+        t0 = time.perf_counter()
+        try:
+            results = self.generate_batch([request for request, _ in batch])
+        except Exception as e:
+            if is_out_of_memory(e) and len(batch) > 1:
+                self._shrink(len(batch))
+                half = len(batch) // 2
+                self._execute(batch[:half])
+                self._execute(batch[half:])
+                return
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        with self._lock:
+            self.stats['batches'] += 1
+            self.stats['pages'] += len(batch)
+            self.stats['largest_batch'] = max(self.stats['largest_batch'], len(batch))
+            self.stats['generate_seconds'] += time.perf_counter() - t0
+            self._successes += 1
+            if self._successes >= self.grow_after and self.batch_size < min(self._memory_cap, self._oom_cap):
+                self.batch_size += 1
+                self._successes = 0
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def _shrink(self, failed_size):
+        try:
+            import torch
+            torch.cuda.empty_cache()
+        except (ImportError, AttributeError):
+            pass
+        with self._lock:
+            self.stats['oom_splits'] += 1
+            self._oom_cap = max(1, min(self._oom_cap, failed_size - 1))
+            self.batch_size = max(1, min(self.batch_size, failed_size // 2))
+            self._successes = 0
+        print(f"hf batch of {failed_size} pages ran out of memory, batch size lowered to {self.batch_size}")
+
+    def summary(self):
+        stats = self.stats
+        mean = stats['pages'] / stats['batches'] if stats['batches'] else 0.0
+        return (
+            f"hf batching: {stats['pages']} pages in {stats['batches']} generate calls "
+            f"(mean batch {mean:.1f}, largest {stats['largest_batch']}, current size {self.batch_size}/{self.max_batch_size}), "
+            f"{stats['oom_splits']} out of memory splits, {stats['generate_seconds']:.1f}s generating"
+        )
+
+    def close(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
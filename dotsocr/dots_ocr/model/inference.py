@@ -1,28 +1,66 @@
-import json
-import io
-import base64
-import math
-from PIL import Image
-import requests
-from dots_ocr.utils.image_utils import PILimage_to_base64
-from openai import OpenAI
+import asyncio
+import threading
+import weakref
+import httpx
+from dots_ocr.utils.image_utils import encode_image_for_transport
+from openai import OpenAI, AsyncOpenAI
 import os
 
 
-def inference_with_vllm(
-        image,
-        prompt,
-        ip="localhost",
-        port=8000,
-        temperature=0.1,
-        top_p=0.9,
-        max_completion_tokens=32768,
-        model_name='model',
-        user_hint: str | None = None,
-        ):
-    
-    addr = f"http://{ip}:{port}/v1"
-    client = OpenAI(api_key="{}".format(os.environ.get("API_KEY", "0")), base_url=addr)
+# One client (and therefore one keep-alive connection pool) per endpoint.
+# Sync clients are shared by all threads, async clients are bound to the event loop that created them
+# and are closed by `aclose_async_clients` before that loop ends.
+_clients = {}
+_clients_lock = threading.Lock()
+_async_clients = weakref.WeakKeyDictionary()
+
+DEFAULT_MAX_CONNECTIONS = 1024
+
+
+def get_openai_client(base_url, api_key):
+    key = (base_url, api_key)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = OpenAI(api_key=api_key, base_url=base_url)
+            _clients[key] = client
+    return client
+
+
+def get_async_openai_client(base_url, api_key, max_connections=DEFAULT_MAX_CONNECTIONS):
+    loop = asyncio.get_running_loop()
+    clients = _async_clients.setdefault(loop, {})
+    key = (base_url, api_key)
+    client = clients.get(key)
+    if client is None:
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            http_client=httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(600.0, connect=10.0)),
+        )
+        clients[key] = client
+    return client
+
+
+async def aclose_async_clients():
+    """Closes the async clients of the running event loop, and their connection pools."""
+    clients = _async_clients.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        await client.close()
+
+
+def with_request_options(client, timeout=None, max_retries=None):
+    """Per-request timeout / retry overrides on a shared client (the connection pool is reused)."""
+    options = {}
+    if timeout is not None:
+        options['timeout'] = timeout
+    if max_retries is not None:
+        options['max_retries'] = max_retries
+    return client.with_options(**options) if options else client
+
+
+def build_messages(image, prompt, user_hint: str | None = None, image_encoding='png'):
     messages = []
     if user_hint:
         hint = str(user_hint).strip()
@@ -36,23 +74,179 @@ def inference_with_vllm(
         "content": [
             {
                 "type": "image_url",
-                "image_url": {"url":  PILimage_to_base64(image)},
+                "image_url": {"url": encode_image_for_transport(image, image_encoding)},
             },
-            {"type": "text", "text": f"<|img|><|imgpad|><|endofimg|>{prompt}"}
+            {"type": "text", "text": prompt}
         ],
     })
+    return messages
+
+
+def inference_with_vllm(
+        image,
+        prompt,
+        ip="localhost",
+        port=8000,
+        temperature=0.1,
+        top_p=0.9,
+        max_completion_tokens=32768,
+        model_name='model',
+        user_hint: str | None = None,
+        image_encoding='png',
+        timeout=None,
+        max_retries=None,
+        ):
+    """
+    Args:
+        timeout: Optional per-request timeout in seconds.
+        max_retries: Optional override of the client's own retries (0 when a RequestPolicy retries).
+    """
+    addr = f"http://{ip}:{port}/v1"
+    client = get_openai_client(addr, "{}".format(os.environ.get("API_KEY", "0")))
+    client = with_request_options(client, timeout, max_retries)
+    messages = build_messages(image, f"<|img|><|imgpad|><|endofimg|>{prompt}", user_hint=user_hint, image_encoding=image_encoding)
+    response = client.chat.completions.create(
+        messages=messages,
+        model=model_name,
+        max_completion_tokens=max_completion_tokens,
+        temperature=temperature,
+        top_p=top_p)
+    return response.choices[0].message.content
+
+
+def _stream_usage_tokens(chunk):
+    usage = getattr(chunk, "usage", None)
+    return getattr(usage, "completion_tokens", None) if usage is not None else None
+
+
+def stream_inference_with_vllm(
+        image,
+        prompt,
+        ip="localhost",
+        port=8000,
+        temperature=0.1,
+        top_p=0.9,
+        max_completion_tokens=32768,
+        model_name='model',
+        user_hint: str | None = None,
+        image_encoding='png',
+        detector=None,
+        timeout=None,
+        max_retries=None,
+        ):
+    """
+    Streaming variant of `inference_with_vllm` that can stop a degenerate generation early.
+
+    Every content delta is fed to `detector.feed`; when it returns True the stream is closed,
+    which makes vLLM abort the request and free its batch slot.
+
+    Returns:
+        tuple: (response text, possibly partial; {'completion_tokens': int, 'aborted': bool})
+    """
+    addr = f"http://{ip}:{port}/v1"
+    client = get_openai_client(addr, "{}".format(os.environ.get("API_KEY", "0")))
+    client = with_request_options(client, timeout, max_retries)
+    messages = build_messages(image, f"<|img|><|imgpad|><|endofimg|>{prompt}", user_hint=user_hint, image_encoding=image_encoding)
+    stream = client.chat.completions.create(
+        messages=messages,
+        model=model_name,
+        max_completion_tokens=max_completion_tokens,
+        temperature=temperature,
+        top_p=top_p,
+        stream=True,
+        # vLLM reports the running token count in every chunk
+        stream_options={"include_usage": True, "continuous_usage_stats": True})
+    parts, chunks, usage_tokens, aborted = [], 0, None, False
     try:
-        response = client.chat.completions.create(
-            messages=messages, 
-            model=model_name, 
-            max_completion_tokens=max_completion_tokens,
-            temperature=temperature,
-            top_p=top_p)
-        response = response.choices[0].message.content
-        return response
-    except requests.exceptions.RequestException as e:
-        print(f"request error: {e}")
-        return None
+        for chunk in stream:
+            usage_tokens = _stream_usage_tokens(chunk) or usage_tokens
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if not delta:
+                continue
+            chunks += 1
+            parts.append(delta)
+            if detector is not None and detector.feed(delta):
+                aborted = True
+                break
+    finally:
+        stream.close()
+    return "".join(parts), {'completion_tokens': usage_tokens or chunks, 'aborted': aborted}
+
+
+async def astream_inference_with_vllm(
+        image,
+        prompt,
+        ip="localhost",
+        port=8000,
+        temperature=0.1,
+        top_p=0.9,
+        max_completion_tokens=32768,
+        model_name='model',
+        user_hint: str | None = None,
+        image_encoding='png',
+        detector=None,
+        timeout=None,
+        max_retries=None,
+        max_connections=DEFAULT_MAX_CONNECTIONS,
+        ):
+    """Async version of `stream_inference_with_vllm`."""
+    addr = f"http://{ip}:{port}/v1"
+    client = get_async_openai_client(addr, "{}".format(os.environ.get("API_KEY", "0")), max_connections=max_connections)
+    client = with_request_options(client, timeout, max_retries)
+    messages = await asyncio.to_thread(build_messages, image, f"<|img|><|imgpad|><|endofimg|>{prompt}", user_hint, image_encoding)
+    stream = await client.chat.completions.create(
+        messages=messages,
+        model=model_name,
+        max_completion_tokens=max_completion_tokens,
+        temperature=temperature,
+        top_p=top_p,
+        stream=True,
+        stream_options={"include_usage": True, "continuous_usage_stats": True})
+    parts, chunks, usage_tokens, aborted = [], 0, None, False
+    try:
+        async for chunk in stream:
+            usage_tokens = _stream_usage_tokens(chunk) or usage_tokens
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if not delta:
+                continue
+            chunks += 1
+            parts.append(delta)
+            if detector is not None and detector.feed(delta):
+                aborted = True
+                break
+    finally:
+        await stream.close()
+    return "".join(parts), {'completion_tokens': usage_tokens or chunks, 'aborted': aborted}
+
+
+async def ainference_with_vllm(
+        image,
+        prompt,
+        ip="localhost",
+        port=8000,
+        temperature=0.1,
+        top_p=0.9,
+        max_completion_tokens=32768,
+        model_name='model',
+        user_hint: str | None = None,
+        image_encoding='png',
+        timeout=None,
+        max_retries=None,
+        max_connections=DEFAULT_MAX_CONNECTIONS,
+        ):
+    """Async version of `inference_with_vllm`, sharing one pooled AsyncOpenAI client per endpoint."""
+    addr = f"http://{ip}:{port}/v1"
+    client = get_async_openai_client(addr, "{}".format(os.environ.get("API_KEY", "0")), max_connections=max_connections)
+    client = with_request_options(client, timeout, max_retries)
+    # base64 encoding is CPU bound, keep it off the event loop
+    messages = await asyncio.to_thread(build_messages, image, f"<|img|><|imgpad|><|endofimg|>{prompt}", user_hint, image_encoding)
+    response = await client.chat.completions.create(
+        messages=messages,
+        model=model_name,
+        max_completion_tokens=max_completion_tokens,
+        temperature=temperature,
+        top_p=top_p)
+    return response.choices[0].message.content
 
 
 def inference_with_stepfun(
@@ -64,38 +258,54 @@ def inference_with_stepfun(
         temperature=0.1,
         top_p=0.9,
         max_tokens=32768,
+        user_hint: str | None = None,
+        image_encoding='png',
+        timeout=None,
+        max_retries=None,
     ):
     """
     Call StepFun (阶跃星辰) OpenAI-compatible chat completions API with vision input.
     """
     # Ensure base_url has no trailing spaces
     base_url = (base_url or "https://api.stepfun.com/v1").strip()
-    client = OpenAI(api_key=api_key, base_url=base_url)
-
-    messages = [
-        {
-            "role": "user",
-            "content": [
-                {
-                    "type": "image_url",
-                    "image_url": {"url": PILimage_to_base64(image)},
-                },
-                {"type": "text", "text": prompt},
-            ],
-        }
-    ]
+    client = get_openai_client(base_url, api_key)
+    client = with_request_options(client, timeout, max_retries)
+    messages = build_messages(image, prompt, user_hint=user_hint, image_encoding=image_encoding)
 
-    try:
-        response = client.chat.completions.create(
-            messages=messages,
-            model=model_name,
-            max_tokens=max_tokens,
-            temperature=temperature,
-            top_p=top_p,
-        )
-        response = response.choices[0].message.content
-        return response
-    except requests.exceptions.RequestException as e:
-        print(f"request error: {e}")
-        return None
+    response = client.chat.completions.create(
+        messages=messages,
+        model=model_name,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        top_p=top_p,
+    )
+    return response.choices[0].message.content
 
+
+async def ainference_with_stepfun(
+        image,
+        prompt,
+        api_key,
+        base_url="https://api.stepfun.com/v1",
+        model_name="step-1o-turbo-vision",
+        temperature=0.1,
+        top_p=0.9,
+        max_tokens=32768,
+        user_hint: str | None = None,
+        image_encoding='png',
+        timeout=None,
+        max_retries=None,
+    ):
+    """Async version of `inference_with_stepfun`."""
+    base_url = (base_url or "https://api.stepfun.com/v1").strip()
+    client = get_async_openai_client(base_url, api_key)
+    client = with_request_options(client, timeout, max_retries)
+    messages = await asyncio.to_thread(build_messages, image, prompt, user_hint, image_encoding)
+    response = await client.chat.completions.create(
+        messages=messages,
+        model=model_name,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        top_p=top_p,
+    )
+    return response.choices[0].message.content
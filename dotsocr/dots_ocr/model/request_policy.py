@@ -0,0 +1,209 @@
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+
+import httpx
+import openai
+
+
+# 408 request timeout, 409 conflict, 429 rate limited, 5xx server side
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+
+class EmptyResponseError(Exception):
+    """The server answered without content."""
+
+
+class RequestFailedError(Exception):
+    """A model request failed after all its attempts; `__cause__` holds the last error."""
+
+
+def is_retryable(error):
+    """Transient errors worth another attempt: timeouts, connection errors, 408/409/429/5xx and empty answers."""
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError, EmptyResponseError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES or error.status_code >= 500
+    return isinstance(error, (httpx.TimeoutException, httpx.TransportError, TimeoutError, ConnectionError))
+
+
+def _is_timeout(error):
+    return isinstance(error, (openai.APITimeoutError, httpx.TimeoutException, TimeoutError))
+
+
+class RequestPolicy:
+    """
+    Timeouts, retries and hedging of model requests, with latency metrics.
+
+    Each attempt gets `timeout` seconds (the read timeout between chunks for streamed
+    requests). Transient errors (see `is_retryable`) are retried up to `max_retries`
+    times after a full-jitter exponential backoff, then raised as `RequestFailedError`;
+    other errors, a 400 answer as well as a bug in `fn`, are raised at once and unchanged.
+
+    With `hedge=True`, once `hedge_min_samples` latencies are known, an `acall` attempt
+    still running after the `hedge_quantile` latency seen so far gets a duplicate request;
+    the first response wins and the loser is cancelled, which closes its connection and
+    frees its server slot. `call` never hedges: a blocked sync request cannot be closed
+    from another thread, and an abandoned loser would hold its slot (and keep generating)
+    until its timeout, worsening the tail hedging is meant to cut.
+
+    Args:
+        timeout: Seconds per attempt, None for the client default.
+        max_retries: Extra attempts after a transient failure.
+        backoff: Base of the exponential backoff in seconds.
+        max_backoff: Upper bound of a single backoff.
+        hedge: Enable hedged requests.
+        hedge_quantile: Latency quantile after which a hedge fires.
+        hedge_min_samples: Latencies to observe before hedging.
+        window: Number of recent latencies kept for the quantiles.
+    """
+
+    def __init__(self, timeout=600.0, max_retries=2, backoff=1.0, max_backoff=30.0,
+                 hedge=False, hedge_quantile=0.95, hedge_min_samples=20, window=1000):
+        assert 0 < hedge_quantile < 1, "hedge_quantile should be in (0, 1)"
+        self.timeout = timeout
+        self.max_retries = max(0, int(max_retries))
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self.stats = {
+            'requests': 0, 'attempts': 0, 'retries': 0, 'timeouts': 0, 'failed': 0,
+            'hedges': 0, 'hedge_wins': 0,
+        }
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self.stats[key] += n
+
+    def _record_latency(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def latency_quantile(self, q):
+        """The q quantile of the recent successful attempt latencies, None without samples."""
+        with self._lock:
+            samples = sorted(self._latencies)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def hedge_delay(self):
+        """Seconds after which a hedge fires, None while hedging is off or still warming up."""
+        if not self.hedge:
+            return None
+        with self._lock:
+            if len(self._latencies) < self.hedge_min_samples:
+                return None
+        return self.latency_quantile(self.hedge_quantile)
+
+    def backoff_seconds(self, retry):
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** retry)))
+
+    def _timed(self, fn):
+        t0 = time.perf_counter()
+        result = fn(self.timeout)
+        if result is None:
+            raise EmptyResponseError("empty response")
+        self._record_latency(time.perf_counter() - t0)
+        return result
+
+    async def _atimed(self, fn):
+        t0 = time.perf_counter()
+        result = await fn(self.timeout)
+        if result is None:
+            raise EmptyResponseError("empty response")
+        self._record_latency(time.perf_counter() - t0)
+        return result
+
+    async def _aattempt(self, fn):
+        delay = self.hedge_delay()
+        if delay is None:
+            return await self._atimed(fn)
+        primary = asyncio.ensure_future(self._atimed(fn))
+        tasks = {primary}
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done:
+            self._count('hedges')
+            tasks.add(asyncio.ensure_future(self._atimed(fn)))
+        error = None
+        try:
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self._count('hedge_wins')
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _failed(self, retry, error):
+        """Counts a failed attempt; returns True if it should be retried, raises what is not a transient error."""
+        if _is_timeout(error):
+            self._count('timeouts')
+        if not is_retryable(error):
+            self._count('failed')
+            raise error
+        if retry < self.max_retries:
+            self._count('retries')
+            print(f"request failed ({type(error).__name__}: {error}), retry {retry + 1}/{self.max_retries}")
+            return True
+        self._count('failed')
+        return False
+
+    def call(self, fn):
+        """
+        Runs `fn(timeout)` under the policy, without hedging (see the class docstring).
+
+        Raises:
+            RequestFailedError: when every attempt failed with a transient error.
+        """
+        self._count('requests')
+        for retry in range(self.max_retries + 1):
+            self._count('attempts')
+            try:
+                return self._timed(fn)
+            except Exception as e:
+                if not self._failed(retry, e):
+                    raise RequestFailedError(f"{type(e).__name__}: {e}") from e
+            time.sleep(self.backoff_seconds(retry))
+
+    async def acall(self, fn):
+        """Async counterpart of `call`, `fn(timeout)` returns an awaitable; attempts are hedged with `hedge`."""
+        self._count('requests')
+        for retry in range(self.max_retries + 1):
+            self._count('attempts')
+            try:
+                return await self._aattempt(fn)
+            except Exception as e:
+                if not self._failed(retry, e):
+                    raise RequestFailedError(f"{type(e).__name__}: {e}") from e
+            await asyncio.sleep(self.backoff_seconds(retry))
+
+    def snapshot(self):
+        """The counters plus the p50/p95/p99 latency of the recent successful attempts."""
+        metrics = dict(self.stats)
+        for q in (0.5, 0.95, 0.99):
+            metrics[f"p{int(q * 100)}_seconds"] = self.latency_quantile(q)
+        return metrics
+
+    def summary(self):
+        m = self.snapshot()
+        latency = ", ".join(
+            f"{key[:-8]} {m[key]:.2f}s" for key in ('p50_seconds', 'p95_seconds', 'p99_seconds') if m[key] is not None
+        )
+        return (
+            f"requests: {m['requests']} pages, {m['attempts']} attempts, {m['retries']} retries, "
+            f"{m['timeouts']} timeouts, {m['failed']} failed, {m['hedges']} hedges ({m['hedge_wins']} won)"
+            + (f", latency {latency}" if latency else "")
+        )
+
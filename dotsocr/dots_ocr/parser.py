@@ -1,18 +1,50 @@
 import os
 import json
+import time
+import asyncio
+import threading
+import weakref
+import fitz
 from tqdm import tqdm
-from multiprocessing.pool import ThreadPool, Pool
+from multiprocessing.pool import ThreadPool
 import argparse
 from pathlib import Path
 
 
-from dots_ocr.model.inference import inference_with_vllm, inference_with_stepfun
-from dots_ocr.utils.consts import image_extensions, MIN_PIXELS, MAX_PIXELS
-from dots_ocr.utils.image_utils import get_image_by_fitz_doc, fetch_image, smart_resize
-from dots_ocr.utils.doc_utils import fitz_doc_to_image, load_images_from_pdf
+from dots_ocr.model.inference import inference_with_vllm, inference_with_stepfun, ainference_with_vllm, ainference_with_stepfun
+from dots_ocr.model.inference import stream_inference_with_vllm, astream_inference_with_vllm, aclose_async_clients
+from dots_ocr.model.request_policy import RequestPolicy, RequestFailedError
+from dots_ocr.model.hf_inference import build_hf_messages, generate_hf_batch, GenerationBatcher, HF_DTYPES, HF_MAX_NEW_TOKENS
+from dots_ocr.model.hf_inference import resolve_hf_device, resolve_hf_dtype, quantize_int8, prefetch_weights
+from dots_ocr.utils.consts import image_extensions, MIN_PIXELS, MAX_PIXELS, REGION_MIN_PIXELS
+from dots_ocr.utils.image_utils import get_image_by_fitz_doc, fetch_image, smart_resize, TRANSPORT_ENCODINGS, encode_image_for_transport, crop_region
+from dots_ocr.utils.doc_utils import fitz_doc_to_image, iter_images_from_pdf, get_pdf_page_count, PdfRasterizer
+from dots_ocr.utils.page_stream import BoundedPageStream, PageReorderBuffer
 from dots_ocr.utils.prompts import dict_promptmode_to_prompt
-from dots_ocr.utils.layout_utils import post_process_output, draw_layout_on_image, pre_process_bboxes
-from dots_ocr.utils.format_transformer import layoutjson2md
+from dots_ocr.utils.output_cleaner import OutputCleaner, StreamingRepetitionDetector, STREAM_MAX_REPEATED_RUN
+from dots_ocr.utils.layout_utils import post_process_output, draw_layout_on_image, draw_layout_on_image_pil, render_layout_image, pre_process_bboxes, offset_cells, post_process_cells
+from dots_ocr.utils.format_transformer import layoutjson2md_variants, encode_pictures
+from dots_ocr.utils.asset_store import PictureAssetStore
+from dots_ocr.utils.page_cache import open_page_cache, make_page_cache_key
+from dots_ocr.utils.text_layer import PdfTextLayer, scale_cells
+from dots_ocr.utils.doc_utils import SupportedPdfParseMethod
+from dots_ocr.utils.page_analysis import PageGroups
+from dots_ocr.utils.resume import ParseManifest
+from dots_ocr.utils.page_budget import estimate_page_budget
+from dots_ocr.utils.batch import is_batch_spec, resolve_batch_inputs, batch_output_dirs, BatchDocument, print_batch_stats
+from dots_ocr.utils.page_recovery import PageRecovery, parse_cells, salvage_cells
+from dots_ocr.utils.tiling import TiledPage, TILE_SIZE, TILE_OVERLAP, TILE_THRESHOLD, TILE_MAX_RENDER_SIZE
+
+
+LAYOUT_IMAGE_MODES = ('eager', 'lazy', 'off')
+PICTURE_MODES = ('inline', 'asset')
+PDF_PARSE_METHODS = ('ocr', 'auto', 'txt')
+# prompt modes whose output can be produced from a pdf text layer
+TEXT_LAYER_PROMPT_MODES = ('prompt_layout_all_en', 'prompt_layout_only_en', 'prompt_ocr')
+# prompt modes answered with a json list of cells, which streaming can watch for repetition loops
+CELL_PROMPT_MODES = ('prompt_layout_all_en', 'prompt_layout_only_en')
+# cell categories whose text prompt_ocr reads back as is (tables, formulas and pictures need their own prompts)
+REOCR_CATEGORIES = ('Text', 'Title', 'Section-header', 'List-item', 'Caption', 'Footnote', 'Page-header', 'Page-footer')
 
 
 class DotsOCRParser:
@@ -26,13 +58,46 @@ class DotsOCRParser:
             model_name='model',
             temperature=0.1,
             top_p=1.0,
-            max_completion_tokens=16384,
+            max_completion_tokens=None,
             num_thread=64,
             dpi = 200, 
             output_dir="./output", 
             min_pixels=None,
             max_pixels=None,
             use_hf=False,
+            hf_batch_size=1,
+            hf_device=None,
+            hf_dtype=None,
+            hf_threads=None,
+            hf_int8=False,
+            render_lookahead=2,
+            max_render_mb=None,
+            render_workers=0,
+            async_concurrency=256,
+            image_encoding='png',
+            picture_encoding='png',
+            picture_mode='inline',
+            asset_url_prefix=None,
+            save_text=False,
+            page_cache=None,
+            page_cache_mb=None,
+            pdf_parse_method='ocr',
+            skip_blank_pages=False,
+            dedup_pages=False,
+            resume=False,
+            stream=False,
+            stream_max_repeats=STREAM_MAX_REPEATED_RUN,
+            page_budget=False,
+            request_timeout=600.0,
+            request_retries=2,
+            hedge=False,
+            region_crop=False,
+            tile_pages=False,
+            tile_size=TILE_SIZE,
+            tile_overlap=TILE_OVERLAP,
+            recover_pages=False,
+            layout_image='eager',
+            layout_renderer='fitz',
             # Online (StepFun) options
             use_online=False,
             online_vendor=None,
@@ -55,8 +120,87 @@ class DotsOCRParser:
         self.output_dir = output_dir
         self.min_pixels = min_pixels
         self.max_pixels = max_pixels
+        # pdf pages are rendered lazily: at most num_thread + render_lookahead pages
+        # are resident, and rendering pauses while they exceed max_render_mb of pixels
+        self.render_lookahead = render_lookahead
+        self.max_render_mb = max_render_mb
+        self.last_render_stats = None
+        # render_workers > 1 rasterizes pdf pages in a process pool instead of the calling thread
+        self.render_workers = render_workers
+        self._rasterizer = None
+        # in-flight page limit of the async api, shared by all documents parsed on the same event loop
+        self.async_concurrency = async_concurrency
+        self._async_semaphores = weakref.WeakKeyDictionary()
+        self._hf_lock = threading.Lock()
+        # hf_batch_size > 1 runs one generate over up to that many pages (fewer when memory is short)
+        assert hf_batch_size >= 1, "hf_batch_size should be >= 1"
+        self.hf_batch_size = hf_batch_size
+        self._hf_batcher = None
+        # hf placement: device 'auto' (cuda when available) / 'cuda' / 'cpu', dtype 'auto' (bfloat16 on
+        # gpu, float32 on cpu) or explicit, torch intra-op threads and dynamic int8 linear layers on cpu
+        assert hf_dtype in (None,) + HF_DTYPES, f"hf_dtype should be one of {HF_DTYPES}"
+        self.hf_device = hf_device
+        self.hf_dtype = hf_dtype
+        self.hf_threads = hf_threads
+        self.hf_int8 = hf_int8
+        # timings of the hf model load and of warmup(), e.g. for a readiness endpoint
+        self.load_stats = {}
+        # transport encoding of page images sent to the model, and of picture crops inlined in markdown
+        assert image_encoding in TRANSPORT_ENCODINGS, f"image_encoding should be one of {list(TRANSPORT_ENCODINGS)}"
+        assert picture_encoding in TRANSPORT_ENCODINGS, f"picture_encoding should be one of {list(TRANSPORT_ENCODINGS)}"
+        self.image_encoding = image_encoding
+        self.picture_encoding = picture_encoding
+        # picture crops in markdown: 'inline' base64 data urls, or 'asset' files under save_dir/assets
+        # referenced by relative path (or by asset_url_prefix when the assets are served elsewhere)
+        assert picture_mode in PICTURE_MODES, f"picture_mode should be one of {PICTURE_MODES}"
+        self.picture_mode = picture_mode
+        self.asset_url_prefix = asset_url_prefix
+        # also write a plain text variant (no header/footer, no pictures) next to the markdown
+        self.save_text = save_text
+        # page level cache of raw model responses: a directory, a sqlite file or a PageCache instance
+        self.page_cache = open_page_cache(page_cache, max_mb=page_cache_mb)
+        # 'ocr' sends every pdf page to the model, 'auto' parses born-digital pages from their
+        # text layer and only scanned ones with the model, 'txt' uses the text layer whenever present
+        assert pdf_parse_method in PDF_PARSE_METHODS, f"pdf_parse_method should be one of {PDF_PARSE_METHODS}"
+        self.pdf_parse_method = pdf_parse_method
+        # pre-inference page analysis of pdfs: skip blank pages, run duplicate pages once and fan out the result
+        self.skip_blank_pages = skip_blank_pages
+        self.dedup_pages = dedup_pages
+        # checkpoint finished pages in save_dir and skip them when the same parse is run again
+        self.resume = resume
+        # stream layout responses from vLLM and cancel a generation once it loops on repeated cells
+        self.stream = stream
+        self.stream_max_repeats = stream_max_repeats
+        # per-page output token cap and max_pixels estimated from the page content,
+        # max_completion_tokens and max_pixels become upper bounds
+        self.page_budget = page_budget
+        # model requests (vLLM and online): per-attempt timeout, jittered retries of transient
+        # errors and, with hedge, a duplicate request once an attempt exceeds the observed p95
+        # (async api only, the sync pipeline cannot close the losing request)
+        self.request_policy = RequestPolicy(timeout=request_timeout, max_retries=request_retries, hedge=hedge)
+        # grounding ocr sends the padded crop of its region with the prompt_ocr prompt instead of
+        # the whole page plus a bbox (parse_regions and reocr_cells can also choose per call)
+        self.region_crop = region_crop
+        # pdf pages beyond TILE_THRESHOLD pixels are rendered at full dpi (instead of 72 dpi) and,
+        # in the layout prompt modes, parsed as overlapping tiles whose cells are merged back
+        assert 0 <= tile_overlap < tile_size, "tile_overlap should be smaller than tile_size"
+        self.tile_pages = tile_pages
+        self.tile_size = tile_size
+        self.tile_overlap = tile_overlap
+        # a layout response that is not valid json keeps the complete cells the cleaner finds, and
+        # the page regions they miss are parsed again as crops (instead of a text-only markdown)
+        self.recover_pages = recover_pages
+        # layout visualization: 'eager' draws it while parsing, 'lazy' only on render_layout_image(), 'off' never
+        assert layout_image in LAYOUT_IMAGE_MODES, f"layout_image should be one of {LAYOUT_IMAGE_MODES}"
+        # 'fitz' (the original drawing) or the opt-in 'pil' renderer, same overlay drawn on the pixels
+        assert layout_renderer in ('fitz', 'pil'), "layout_renderer should be 'fitz' or 'pil'"
+        self.layout_image = layout_image
+        self.layout_renderer = layout_renderer
 
         self.use_hf = use_hf
+        # token cap of a page when none is given: 24000 new tokens with hf, 16384 for the servers
+        if self.max_completion_tokens is None:
+            self.max_completion_tokens = HF_MAX_NEW_TOKENS if use_hf else 16384
         self.use_online = use_online
         self.online_vendor = online_vendor
         self.online_model = online_model
@@ -68,12 +212,41 @@ class DotsOCRParser:
             print(f"use online provider: {self.online_vendor or 'unknown'} with model {self.online_model}")
         elif self.use_hf:
             self._load_hf_model()
-            print(f"use hf model, num_thread will be set to 1")
+            print(f"use hf model, num_thread will be set to {self.hf_batch_size} (hf_batch_size)")
         else:
             print(f"use vllm model, num_thread will be set to {self.num_thread}")
         assert self.min_pixels is None or self.min_pixels >= MIN_PIXELS
         assert self.max_pixels is None or self.max_pixels <= MAX_PIXELS
 
+    def _render_options(self):
+        """Oversized pages: the 72 dpi fallback, or full dpi up to TILE_MAX_RENDER_SIZE when tiling."""
+        return {'max_size': TILE_MAX_RENDER_SIZE, 'fit': True} if self.tile_pages else {}
+
+    def _iter_pdf_pages(self, input_path, page_ids=None):
+        if self.render_workers and self.render_workers > 1:
+            if self._rasterizer is None:
+                self._rasterizer = PdfRasterizer(num_workers=self.render_workers)
+            return self._rasterizer.iter_images(input_path, dpi=self.dpi, page_ids=page_ids, **self._render_options())
+        return iter_images_from_pdf(input_path, dpi=self.dpi, page_ids=page_ids, **self._render_options())
+
+    def close(self):
+        """Releases the rendering worker processes and the page cache, if any."""
+        if self._rasterizer is not None:
+            self._rasterizer.close()
+            self._rasterizer = None
+        if self.page_cache is not None:
+            self.page_cache.close()
+        if self._hf_batcher is not None:
+            self._hf_batcher.close()
+
+    async def aclose(self):
+        """
+        Async counterpart of `close`, also closing the connection pools the async api opened
+        on the running event loop, e.g. at the end of `asyncio.run(...)`.
+        """
+        await aclose_async_clients()
+        await asyncio.to_thread(self.close)
+
     def _resolve_local_weights_dir(self) -> Path:
         """Resolve local weights directory for HF mode with sensible defaults.
         Priority:
@@ -97,7 +270,7 @@ class DotsOCRParser:
 
     def _load_hf_model(self):
         import torch
-        from transformers import AutoModelForCausalLM, AutoProcessor
+        from transformers import AutoConfig, AutoModelForCausalLM, AutoProcessor
         from qwen_vl_utils import process_vision_info
 
         model_dir = self._resolve_local_weights_dir()
@@ -105,89 +278,111 @@ class DotsOCRParser:
             raise RuntimeError(
                 f"HF weights directory not found at {model_dir}. Please download weights to dotsocr/weights/DotsOCR or set DOTS_WEIGHTS_DIR."
             )
-        attn_impl = os.environ.get("DOTS_ATTN_IMPL", "flash_attention_2")
+        t0 = time.perf_counter()
+        # safetensors shards are memory-mapped by from_pretrained; read them ahead while it builds the model
+        weight_bytes = prefetch_weights(model_dir)
+        device = resolve_hf_device(self.hf_device)
+        on_cpu = device == "cpu"
+        dtype = resolve_hf_dtype(self.hf_dtype, device)
+        assert not self.hf_int8 or (on_cpu and dtype == torch.float32), "hf_int8 needs hf_device='cpu' and float32"
+        if on_cpu and self.hf_threads:
+            torch.set_num_threads(self.hf_threads)
+        # flash attention only exists on gpus: on cpu the language model and the vision tower use sdpa
+        # (DOTS_VISION_ATTN_IMPL=eager_v2 trades speed for a smaller attention footprint on large pages)
+        attn_impl = os.environ.get("DOTS_ATTN_IMPL", "sdpa" if on_cpu else "flash_attention_2")
+        config = AutoConfig.from_pretrained(str(model_dir), trust_remote_code=True)
+        vision_attn_impl = os.environ.get("DOTS_VISION_ATTN_IMPL", "sdpa" if on_cpu else None)
+        if vision_attn_impl:
+            config.vision_config.attn_implementation = vision_attn_impl
+        load_kwargs = dict(
+            config=config,
+            torch_dtype=dtype,
+            device_map="cpu" if on_cpu else ("auto" if device == "cuda" else device),
+            # no random init followed by a copy: tensors are materialized straight from the mapped shards
+            low_cpu_mem_usage=True,
+            use_safetensors=True if weight_bytes else None,
+            trust_remote_code=True,
+        )
         try:
-            self.model = AutoModelForCausalLM.from_pretrained(
-                str(model_dir),
-                attn_implementation=attn_impl,
-                torch_dtype=torch.bfloat16,
-                device_map="auto",
-                trust_remote_code=True
-            )
+            self.model = AutoModelForCausalLM.from_pretrained(str(model_dir), attn_implementation=attn_impl, **load_kwargs)
         except Exception as e:
             # If FlashAttention2 is requested but not installed, fallback to SDPA
             if "flash_attn" in str(e) or "FlashAttention2" in str(e) or "Flash Attention 2" in str(e):
-                fallback_impl = "sdpa"
-                self.model = AutoModelForCausalLM.from_pretrained(
-                    str(model_dir),
-                    attn_implementation=fallback_impl,
-                    torch_dtype=torch.bfloat16,
-                    device_map="auto",
-                    trust_remote_code=True
-                )
+                self.model = AutoModelForCausalLM.from_pretrained(str(model_dir), attn_implementation="sdpa", **load_kwargs)
             else:
                 raise
+        self.model.eval()
+        if self.hf_int8:
+            self.model = quantize_int8(self.model)
+        print(f"hf model on {self.model.device}, {str(dtype).replace('torch.', '')}"
+              + (f", {torch.get_num_threads()} threads" if on_cpu else "")
+              + (", int8 linear layers" if self.hf_int8 else ""))
         self.processor = AutoProcessor.from_pretrained(str(model_dir), trust_remote_code=True, use_fast=True)
+        # batched prompts are left padded so that every page's output starts at the same position
+        self.processor.tokenizer.padding_side = "left"
         self.process_vision_info = process_vision_info
+        if self.hf_batch_size > 1:
+            self._hf_batcher = GenerationBatcher(self._inference_with_hf_batch, max_batch_size=self.hf_batch_size)
+        self.load_stats['load_seconds'] = round(time.perf_counter() - t0, 3)
+        self.load_stats['weight_bytes'] = weight_bytes
+        print(f"hf model loaded in {self.load_stats['load_seconds']:.1f}s ({weight_bytes / 1024 ** 3:.2f} GB of safetensors)")
 
-    def _inference_with_hf(self, image, prompt, user_hint: str | None = None):
-        messages = []
-        # 将用户提示词作为系统提示加入，不修改基础提示词内容
-        if user_hint:
-            hint = str(user_hint).strip()
-            if hint:
-                messages.append({
-                    "role": "system",
-                    "content": hint,
-                })
-        messages.append(
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "image",
-                        "image": image
-                    },
-                    {"type": "text", "text": prompt}
-                ]
-            }
-        )
+    def warmup(self, prompt_mode="prompt_layout_all_en", max_completion_tokens=16, size=(1240, 1754)):
+        """
+        Runs one inference on a synthetic text page so that the first real page does not pay
+        for kernel selection / compilation and allocator growth.
 
-        # Preparation for inference
-        text = self.processor.apply_chat_template(
-            messages, 
-            tokenize=False, 
-            add_generation_prompt=True
-        )
-        image_inputs, video_inputs = self.process_vision_info(messages)
-        # 兼容不同 transformers 版本：有的 Processor 无 video_processor
-        proc_kwargs = dict(
-            text=[text],
-            images=image_inputs,
-            padding=True,
-            return_tensors="pt",
-        )
-        try:
-            has_video = hasattr(self.processor, "video_processor") and self.processor.video_processor is not None
-        except Exception:
-            has_video = False
-        if has_video:
-            proc_kwargs["videos"] = video_inputs
-        inputs = self.processor(**proc_kwargs)
-
-        inputs = inputs.to("cuda")
-
-        # Inference: Generation of the output
-        generated_ids = self.model.generate(**inputs, max_new_tokens=24000)
-        generated_ids_trimmed = [
-            out_ids[len(in_ids) :] for in_ids, out_ids in zip(inputs.input_ids, generated_ids)
-        ]
-        response = self.processor.batch_decode(
-            generated_ids_trimmed, skip_special_tokens=True, clean_up_tokenization_spaces=False
-        )[0]
-        return response
+        The page goes through the same resize and prompt as a real one; the output is discarded.
+
+        Returns:
+            float: The warm-up seconds, also stored in `load_stats['warmup_seconds']`.
+        """
+        from PIL import Image, ImageDraw
+
+        image = Image.new("RGB", size, "white")
+        draw = ImageDraw.Draw(image)
+        draw.rectangle((100, 100, size[0] - 100, 160), fill="black")
+        for line in range(30):
+            draw.text((100, 220 + line * 45), "warm-up line %d of a synthetic page 0123456789" % line, fill="black")
+        image = fetch_image(image, min_pixels=self.min_pixels, max_pixels=self.max_pixels)
+        prompt = self.get_prompt(prompt_mode, image=image, min_pixels=self.min_pixels, max_pixels=self.max_pixels)
+        t0 = time.perf_counter()
+        self._inference(image, prompt, max_completion_tokens=max_completion_tokens)
+        self.load_stats['warmup_seconds'] = round(time.perf_counter() - t0, 3)
+        print(f"warm-up inference took {self.load_stats['warmup_seconds']:.1f}s")
+        return self.load_stats['warmup_seconds']
+
+    def _inference_with_hf(self, image, prompt, user_hint: str | None = None, max_completion_tokens=None):
+        return self._inference_with_hf_batch([(image, prompt, user_hint, max_completion_tokens)])[0]
+
+    def _inference_with_hf_batch(self, requests):
+        """
+        One generate over several pages.
+
+        Args:
+            requests: (image, prompt, user_hint, max_completion_tokens) per page.
 
-    def _inference_with_vllm(self, image, prompt, user_hint: str | None = None):
+        Returns:
+            list: The response of each page.
+        """
+        import torch
+
+        messages_list = [build_hf_messages(image, prompt, user_hint) for image, prompt, user_hint, _ in requests]
+        max_new_tokens = [max_completion_tokens or self.max_completion_tokens for *_, max_completion_tokens in requests]
+        with self._hf_lock:
+            measure = self._hf_batcher is not None and self.model.device.type == "cuda"
+            if measure:
+                torch.cuda.reset_peak_memory_stats()
+                baseline = torch.cuda.memory_allocated()
+            responses = generate_hf_batch(self.model, self.processor, self.process_vision_info, messages_list, max_new_tokens)
+            if measure:
+                # activations + kv cache of one page, against what the allocator can still hand out
+                per_page = (torch.cuda.max_memory_allocated() - baseline) / len(requests)
+                free, _ = torch.cuda.mem_get_info()
+                self._hf_batcher.limit_by_memory(per_page, free + torch.cuda.memory_reserved() - baseline)
+        return responses
+
+    def _inference_with_vllm(self, image, prompt, user_hint: str | None = None, max_completion_tokens=None, timeout=None):
         response = inference_with_vllm(
             image,
             prompt, 
@@ -196,12 +391,70 @@ class DotsOCRParser:
             port=self.port,
             temperature=self.temperature,
             top_p=self.top_p,
-            max_completion_tokens=self.max_completion_tokens,
+            max_completion_tokens=max_completion_tokens or self.max_completion_tokens,
             user_hint=user_hint,
+            image_encoding=self.image_encoding,
+            timeout=timeout,
+            max_retries=0,
         )
         return response
 
-    def _inference_with_stepfun(self, image, prompt, user_hint: str | None = None):
+    def _stream_kwargs(self, max_completion_tokens=None):
+        return dict(
+            model_name=self.model_name,
+            ip=self.ip,
+            port=self.port,
+            temperature=self.temperature,
+            top_p=self.top_p,
+            max_completion_tokens=max_completion_tokens or self.max_completion_tokens,
+            image_encoding=self.image_encoding,
+            max_retries=0,
+        )
+
+    def _use_stream(self, page):
+        return self.stream and not (self.use_hf or self.use_online) and page["prompt_mode"] in CELL_PROMPT_MODES
+
+    def _finish_stream(self, response, info, detector, max_completion_tokens=None):
+        """Runs an aborted partial response through the cleaner, returns (response, generation stats)."""
+        stats = {
+            'completion_tokens': info['completion_tokens'],
+            'aborted': info['aborted'],
+            'repeated_cells': detector.repeated_cells,
+        }
+        if info['aborted']:
+            stats['abort_reason'] = detector.reason
+            stats['tokens_saved'] = max(0, (max_completion_tokens or self.max_completion_tokens) - info['completion_tokens'])
+            print(f"generation stopped: {detector.reason}, ~{stats['tokens_saved']} tokens saved")
+            cells = OutputCleaner(verbose=False).clean_model_output(response)
+            if isinstance(cells, list):
+                response = json.dumps(cells, ensure_ascii=False)
+        return response, stats
+
+    def _inference_stream(self, image, prompt, user_hint: str | None = None, max_completion_tokens=None):
+        def _attempt(timeout):
+            # every attempt watches its own stream
+            detector = StreamingRepetitionDetector(max_repeated_run=self.stream_max_repeats)
+            response, info = stream_inference_with_vllm(
+                image, prompt, user_hint=user_hint, detector=detector, timeout=timeout, **self._stream_kwargs(max_completion_tokens)
+            )
+            return response, info, detector
+
+        response, info, detector = self.request_policy.call(_attempt)
+        return self._finish_stream(response, info, detector, max_completion_tokens)
+
+    async def _ainference_stream(self, image, prompt, user_hint: str | None = None, max_completion_tokens=None):
+        async def _attempt(timeout):
+            # every attempt (retry or hedge) watches its own stream
+            detector = StreamingRepetitionDetector(max_repeated_run=self.stream_max_repeats)
+            response, info = await astream_inference_with_vllm(
+                image, prompt, user_hint=user_hint, detector=detector, timeout=timeout, **self._stream_kwargs(max_completion_tokens)
+            )
+            return response, info, detector
+
+        response, info, detector = await self.request_policy.acall(_attempt)
+        return await asyncio.to_thread(self._finish_stream, response, info, detector, max_completion_tokens)
+
+    def _inference_with_stepfun(self, image, prompt, user_hint: str | None = None, max_completion_tokens=None, timeout=None):
         response = inference_with_stepfun(
             image=image,
             prompt=prompt if not self.online_system_prompt else prompt,
@@ -211,6 +464,11 @@ class DotsOCRParser:
             temperature=self.temperature,
             top_p=self.top_p,
             user_hint=user_hint,
+            image_encoding=self.image_encoding,
+            timeout=timeout,
+            max_retries=0,
+            # the online api keeps its own default cap unless a page budget applies
+            **({'max_tokens': max_completion_tokens} if max_completion_tokens else {}),
         )
         return response
 
@@ -218,9 +476,7 @@ class DotsOCRParser:
         prompt = dict_promptmode_to_prompt[prompt_mode]
         if prompt_mode == 'prompt_grounding_ocr':
             assert bbox is not None
-            bboxes = [bbox]
-            bbox = pre_process_bboxes(origin_image, bboxes, input_width=image.width, input_height=image.height, min_pixels=min_pixels, max_pixels=max_pixels)[0]
-            prompt = prompt + str(bbox)
+            prompt = self._grounding_prompts(origin_image, image, [bbox], min_pixels=min_pixels, max_pixels=max_pixels)[0]
         # 针对 layout_all，明确要求排除页眉/页脚
         if prompt_mode == 'prompt_layout_all_en':
             prompt = f"{prompt}\nPlease exclude elements with categories 'Page-header' and 'Page-footer' from the output."
@@ -231,25 +487,44 @@ class DotsOCRParser:
                 prompt = f"{prompt}\n{hint}"
         return prompt
 
-    # def post_process_results(self, response, prompt_mode, save_dir, save_name, origin_image, image, min_pixels, max_pixels)
-    def _parse_single_image(
-        self, 
-        origin_image, 
-        prompt_mode, 
-        save_dir, 
-        save_name, 
-        source="image", 
-        page_idx=0, 
+    def _grounding_prompts(self, origin_image, image, bboxes, min_pixels=None, max_pixels=None):
+        """The grounding prompt of each bbox (origin_image coordinates), all mapped to the model input at once."""
+        input_bboxes = pre_process_bboxes(origin_image, bboxes, input_width=image.width, input_height=image.height, min_pixels=min_pixels, max_pixels=max_pixels)
+        prompt = dict_promptmode_to_prompt['prompt_grounding_ocr']
+        return [prompt + str(bbox) for bbox in input_bboxes]
+
+    def _prepare_page(
+        self,
+        origin_image,
+        prompt_mode,
+        source="image",
         bbox=None,
         fitz_preprocess=False,
         user_hint: str | None = None,
+        text_chars=None,
+        crop=None,
         ):
+        """Preprocesses a page into the model input image and prompt."""
         min_pixels, max_pixels = self.min_pixels, self.max_pixels
         if prompt_mode == "prompt_grounding_ocr":
             min_pixels = min_pixels or MIN_PIXELS  # preprocess image to the final input
             max_pixels = max_pixels or MAX_PIXELS
         if min_pixels is not None: assert min_pixels >= MIN_PIXELS, f"min_pixels should >= {MIN_PIXELS}"
         if max_pixels is not None: assert max_pixels <= MAX_PIXELS, f"max_pixels should <+ {MAX_PIXELS}"
+        if prompt_mode == "prompt_grounding_ocr" and (self.region_crop if crop is None else crop):
+            return self._prepare_region_crop(origin_image, bbox, source=source, fitz_preprocess=fitz_preprocess, max_pixels=max_pixels)
+
+        budget = None
+        if self.page_budget and prompt_mode != "prompt_grounding_ocr":
+            budget = estimate_page_budget(
+                origin_image, text_chars=text_chars, max_completion_tokens=self.max_completion_tokens,
+                min_pixels=min_pixels, max_pixels=max_pixels,
+            )
+            if budget['max_pixels'] < (max_pixels or MAX_PIXELS):
+                max_pixels = budget['max_pixels']
+            if prompt_mode not in CELL_PROMPT_MODES:
+                # a free text answer cut by a lower cap cannot be detected, keep the configured one
+                budget['max_completion_tokens'] = self.max_completion_tokens
 
         if source == 'image' and fitz_preprocess:
             image = get_image_by_fitz_doc(origin_image, target_dpi=self.dpi)
@@ -258,38 +533,170 @@ class DotsOCRParser:
             image = fetch_image(origin_image, min_pixels=min_pixels, max_pixels=max_pixels)
         input_height, input_width = smart_resize(image.height, image.width)
         prompt = self.get_prompt(prompt_mode, bbox, origin_image, image, min_pixels=min_pixels, max_pixels=max_pixels, user_hint=user_hint)
+        return {
+            "image": image,
+            "prompt": prompt,
+            "prompt_mode": prompt_mode,
+            "min_pixels": min_pixels,
+            "max_pixels": max_pixels,
+            "input_height": input_height,
+            "input_width": input_width,
+            "budget": budget,
+        }
+
+    def _prepare_region_crop(self, origin_image, bbox, source="image", fitz_preprocess=False, max_pixels=MAX_PIXELS):
+        """
+        Preprocesses one region as its own model input: the padded crop, read with the prompt_ocr prompt.
+
+        The crop keeps the page resolution, upscaled to REGION_MIN_PIXELS when smaller and
+        bounded by max_pixels, so the vision tower encodes the region only instead of the
+        whole page. page["crop_box"] maps the outputs back to page coordinates.
+        """
+        assert bbox is not None
+        region, crop_box = crop_region(origin_image, bbox)
+        if source == 'image' and fitz_preprocess:
+            region = get_image_by_fitz_doc(region, target_dpi=self.dpi)
+        min_pixels = min(REGION_MIN_PIXELS, max_pixels)
+        image = fetch_image(region, min_pixels=min_pixels, max_pixels=max_pixels)
+        return {
+            "image": image,
+            "prompt": dict_promptmode_to_prompt['prompt_ocr'],
+            "prompt_mode": "prompt_grounding_ocr",
+            "min_pixels": min_pixels,
+            "max_pixels": max_pixels,
+            "input_height": image.height,
+            "input_width": image.width,
+            "budget": None,
+            "crop_box": crop_box,
+        }
+
+    def _page_cache_key(self, page, user_hint: str | None = None):
         if self.use_hf:
-            response = self._inference_with_hf(image, prompt, user_hint=user_hint)
+            backend, model = 'hf', str(self._resolve_local_weights_dir())
         elif self.use_online:
-            response = self._inference_with_stepfun(image, prompt, user_hint=user_hint)
+            backend, model = 'online', f"{self.online_base_url}|{self.online_model}"
         else:
-            response = self._inference_with_vllm(image, prompt, user_hint=user_hint)
+            backend, model = 'vllm', self.model_name
+        budget = page.get("budget")
+        return make_page_cache_key(
+            page["image"],
+            page["prompt"],
+            user_hint=str(user_hint).strip() if user_hint else None,
+            backend=backend,
+            model=model,
+            temperature=self.temperature,
+            top_p=self.top_p,
+            # the cap the page is generated with, its budget when it has one
+            max_completion_tokens=budget['max_completion_tokens'] if budget else self.max_completion_tokens,
+            image_encoding=self.image_encoding,
+        )
+
+    def _inference(self, image, prompt, user_hint: str | None = None, max_completion_tokens=None):
+        if self.use_hf:
+            if self._hf_batcher is not None:
+                return self._hf_batcher.submit((image, prompt, user_hint, max_completion_tokens))
+            return self._inference_with_hf(image, prompt, user_hint=user_hint, max_completion_tokens=max_completion_tokens)
+        elif self.use_online:
+            return self.request_policy.call(lambda timeout: self._inference_with_stepfun(
+                image, prompt, user_hint=user_hint, max_completion_tokens=max_completion_tokens, timeout=timeout
+            ))
+        else:
+            return self.request_policy.call(lambda timeout: self._inference_with_vllm(
+                image, prompt, user_hint=user_hint, max_completion_tokens=max_completion_tokens, timeout=timeout
+            ))
+
+    async def _ainference(self, image, prompt, user_hint: str | None = None, max_completion_tokens=None):
+        if self.use_hf:
+            # local generation is not concurrent, run it in a worker thread to keep the loop free
+            return await asyncio.to_thread(self._inference, image, prompt, user_hint, max_completion_tokens)
+        elif self.use_online:
+            return await self.request_policy.acall(lambda timeout: ainference_with_stepfun(
+                image=image,
+                prompt=prompt,
+                api_key=self.online_api_key,
+                base_url=self.online_base_url or "https://api.stepfun.com/v1",
+                model_name=self.online_model or "step-1o-turbo-vision",
+                temperature=self.temperature,
+                top_p=self.top_p,
+                user_hint=user_hint,
+                image_encoding=self.image_encoding,
+                timeout=timeout,
+                max_retries=0,
+                # the online api keeps its own default cap unless a page budget applies
+                **({'max_tokens': max_completion_tokens} if max_completion_tokens else {}),
+            ))
+        else:
+            return await self.request_policy.acall(lambda timeout: ainference_with_vllm(
+                image,
+                prompt,
+                model_name=self.model_name,
+                ip=self.ip,
+                port=self.port,
+                temperature=self.temperature,
+                top_p=self.top_p,
+                max_completion_tokens=max_completion_tokens or self.max_completion_tokens,
+                user_hint=user_hint,
+                image_encoding=self.image_encoding,
+                timeout=timeout,
+                max_retries=0,
+            ))
+
+    def _finalize_page(
+        self,
+        response,
+        page,
+        origin_image,
+        prompt_mode,
+        save_dir,
+        save_name,
+        source="image",
+        page_idx=0,
+        layout_image=None,
+        recovered=None,
+        ):
+        """
+        Post-processes a model response and writes the page outputs to save_dir.
+
+        Args:
+            recovered: (cells, stats) from `_recover` when the response was not valid json.
+        """
+        layout_image = layout_image or self.layout_image
+        image = page["image"]
+        min_pixels, max_pixels = page["min_pixels"], page["max_pixels"]
+        input_height, input_width = page["input_height"], page["input_width"]
         result = {'page_no': page_idx,
             "input_height": input_height,
             "input_width": input_width
         }
         if source == 'pdf':
             save_name = f"{save_name}_page_{page_idx}"
-        if prompt_mode in ['prompt_layout_all_en', 'prompt_layout_only_en', 'prompt_grounding_ocr']:
+        crop_box = page.get("crop_box")
+        if crop_box:
+            result['crop_box'] = crop_box
+        if recovered is not None:
+            cells, result['recovery'] = recovered
+            self._save_cells(result, cells, origin_image, prompt_mode, save_dir, save_name, layout_image)
+        elif prompt_mode in ['prompt_layout_all_en', 'prompt_layout_only_en', 'prompt_grounding_ocr']:
             cells, filtered = post_process_output(
                 response, 
                 prompt_mode, 
-                origin_image, 
+                origin_image.crop(crop_box) if crop_box else origin_image,
                 image,
                 min_pixels=min_pixels, 
                 max_pixels=max_pixels,
                 )
+            if crop_box and not filtered:
+                # cells read from a region crop, back into page coordinates
+                cells = offset_cells(cells, crop_box[0], crop_box[1])
             if filtered and prompt_mode != 'prompt_layout_only_en':  # model output json failed, use filtered process
                 json_file_path = os.path.join(save_dir, f"{save_name}.json")
                 with open(json_file_path, 'w', encoding="utf-8") as w:
                     json.dump(response, w, ensure_ascii=False)
 
-                image_layout_path = os.path.join(save_dir, f"{save_name}.jpg")
-                origin_image.save(image_layout_path)
                 result.update({
                     'layout_info_path': json_file_path,
-                    'layout_image_path': image_layout_path,
                 })
+                result.update(self._save_layout_image(origin_image, None, save_dir, save_name, layout_image))
 
                 md_file_path = os.path.join(save_dir, f"{save_name}.md")
                 with open(md_file_path, "w", encoding="utf-8") as md_file:
@@ -301,47 +708,9 @@ class DotsOCRParser:
                     'filtered': True
                 })
             else:
-                # 结果后处理：在 layout_all 模式下，过滤掉 Page-header / Page-footer
-                if prompt_mode == 'prompt_layout_all_en':
-                    try:
-                        cells = [c for c in cells if not isinstance(c, dict) or c.get('category') not in ['Page-header', 'Page-footer']]
-                    except Exception:
-                        pass
-                try:
-                    image_with_layout = draw_layout_on_image(origin_image, cells)
-                except Exception as e:
-                    print(f"Error drawing layout on image: {e}")
-                    image_with_layout = origin_image
-
-                json_file_path = os.path.join(save_dir, f"{save_name}.json")
-                with open(json_file_path, 'w', encoding="utf-8") as w:
-                    json.dump(cells, w, ensure_ascii=False)
-
-                image_layout_path = os.path.join(save_dir, f"{save_name}.jpg")
-                image_with_layout.save(image_layout_path)
-                result.update({
-                    'layout_info_path': json_file_path,
-                    'layout_image_path': image_layout_path,
-                })
-                if prompt_mode != "prompt_layout_only_en":  # no text md when detection only
-                    md_content = layoutjson2md(origin_image, cells, text_key='text')
-                    md_content_no_hf = layoutjson2md(origin_image, cells, text_key='text', no_page_hf=True) # used for clean output or metric of omnidocbench、olmbench 
-                    md_file_path = os.path.join(save_dir, f"{save_name}.md")
-                    with open(md_file_path, "w", encoding="utf-8") as md_file:
-                        md_file.write(md_content)
-                    md_nohf_file_path = os.path.join(save_dir, f"{save_name}_nohf.md")
-                    with open(md_nohf_file_path, "w", encoding="utf-8") as md_file:
-                        md_file.write(md_content_no_hf)
-                    result.update({
-                        'md_content_path': md_file_path,
-                        'md_content_nohf_path': md_nohf_file_path,
-                    })
+                self._save_cells(result, cells, origin_image, prompt_mode, save_dir, save_name, layout_image)
         else:
-            image_layout_path = os.path.join(save_dir, f"{save_name}.jpg")
-            origin_image.save(image_layout_path)
-            result.update({
-                'layout_image_path': image_layout_path,
-            })
+            result.update(self._save_layout_image(origin_image, None, save_dir, save_name, layout_image))
 
             md_content = response
             md_file_path = os.path.join(save_dir, f"{save_name}.md")
@@ -353,49 +722,856 @@ class DotsOCRParser:
 
         return result
     
-    def parse_image(self, input_path, filename, prompt_mode, save_dir, bbox=None, fitz_preprocess=False, user_hint: str | None = None):
+    def _parse_text_layer_page(self, origin_image, text_layer, prompt_mode, save_dir, save_name, page_idx=0, layout_image=None):
+        """Writes the outputs of a pdf page parsed from its text layer, in the same schema as a model response."""
+        layout_image = layout_image or self.layout_image
+        save_name = f"{save_name}_page_{page_idx}"
+        result = {'page_no': page_idx,
+            "input_height": origin_image.height,
+            "input_width": origin_image.width,
+            'parse_method': SupportedPdfParseMethod.TXT.value,
+        }
+        cells = scale_cells(text_layer['cells'], text_layer['page_width'], text_layer['page_height'], origin_image.width, origin_image.height)
+        if prompt_mode == 'prompt_layout_only_en':
+            cells = [{k: v for k, v in cell.items() if k != 'text'} for cell in cells]
+        if prompt_mode == 'prompt_ocr':
+            result.update(self._save_layout_image(origin_image, None, save_dir, save_name, layout_image))
+            md_file_path = os.path.join(save_dir, f"{save_name}.md")
+            with open(md_file_path, "w", encoding="utf-8") as md_file:
+                md_file.write(layoutjson2md_variants(origin_image, cells, variants=('text',))['text'])
+            result['md_content_path'] = md_file_path
+        else:
+            self._save_cells(result, cells, origin_image, prompt_mode, save_dir, save_name, layout_image)
+        return result
+
+    def _open_text_layer(self, input_path, prompt_mode):
+        """A PdfTextLayer classifying the pages as they are parsed when the text layer fast path applies, else None."""
+        if self.pdf_parse_method == 'ocr' or prompt_mode not in TEXT_LAYER_PROMPT_MODES:
+            return None
+        return PdfTextLayer(input_path, method=self.pdf_parse_method)
+
+    @staticmethod
+    def _close_text_layer(text_layer):
+        if text_layer is not None:
+            if len(text_layer):
+                print(text_layer.summary())
+            text_layer.close()
+
+    def _new_page_groups(self):
+        if not (self.skip_blank_pages or self.dedup_pages):
+            return None
+        return PageGroups(skip_blank=self.skip_blank_pages, dedup=self.dedup_pages)
+
+    def _save_blank_page(self, origin_image, prompt_mode, save_dir, save_name, page_idx=0, layout_image=None):
+        """Writes empty outputs for a page skipped as blank, so that every page keeps its files."""
+        layout_image = layout_image or self.layout_image
+        save_name = f"{save_name}_page_{page_idx}"
+        result = {'page_no': page_idx,
+            "input_height": origin_image.height,
+            "input_width": origin_image.width,
+        }
+        if prompt_mode in ['prompt_layout_all_en', 'prompt_layout_only_en']:
+            self._save_cells(result, [], origin_image, prompt_mode, save_dir, save_name, layout_image)
+        else:
+            result.update(self._save_layout_image(origin_image, None, save_dir, save_name, layout_image))
+            md_file_path = os.path.join(save_dir, f"{save_name}.md")
+            with open(md_file_path, "w", encoding="utf-8") as md_file:
+                md_file.write("")
+            result['md_content_path'] = md_file_path
+        return result
+
+    def _parse_pdf_page(self, origin_image, prompt_mode, save_dir, save_name, page_idx, user_hint=None, layout_image=None, text_layer=None, page_groups=None):
+        if text_layer is not None and text_layer['method'] == SupportedPdfParseMethod.TXT:
+            return self._parse_text_layer_page(origin_image, text_layer, prompt_mode, save_dir, save_name, page_idx=page_idx, layout_image=layout_image)
+
+        analysis = page_groups.analyze(page_idx, origin_image) if page_groups is not None else None
+        text_chars = text_layer.get('chars') if text_layer is not None else None
+        if analysis is not None and analysis['blank']:
+            result = self._save_blank_page(origin_image, prompt_mode, save_dir, save_name, page_idx=page_idx, layout_image=layout_image)
+            result['skipped'] = True
+        elif analysis is not None and analysis['duplicate_of'] is not None:
+            # same pixels as an earlier page: reuse its response and recovery, but write this page's own outputs
+            page = self._prepare_page(origin_image, prompt_mode, source="pdf", user_hint=user_hint, text_chars=text_chars)
+            response, recovered = page_groups.response_future(analysis['duplicate_of']).result()
+            result = self._finalize_page(response, page, origin_image, prompt_mode, save_dir, save_name, source="pdf", page_idx=page_idx, layout_image=layout_image, recovered=recovered)
+        else:
+            # whatever fails before the response is published must release the duplicates waiting for it
+            try:
+                page = self._prepare_page(origin_image, prompt_mode, source="pdf", user_hint=user_hint, text_chars=text_chars)
+                response, meta = self._infer_page(page, user_hint=user_hint)
+                recovered = self._recover(response, page, origin_image, prompt_mode, user_hint=user_hint)
+            except BaseException as e:
+                if page_groups is not None:
+                    page_groups.set_error(page_idx, e)
+                raise
+            if page_groups is not None:
+                page_groups.set_response(page_idx, (response, recovered))
+            result = self._finalize_page(response, page, origin_image, prompt_mode, save_dir, save_name, source="pdf", page_idx=page_idx, layout_image=layout_image, recovered=recovered)
+            result.update(meta)
+
+        if analysis is not None:
+            result.update(analysis)
+        if text_layer is not None:
+            result.update({'parse_method': SupportedPdfParseMethod.OCR.value, 'text_layer_reason': text_layer['reason']})
+        return result
+
+    async def _aparse_pdf_page(self, origin_image, prompt_mode, save_dir, save_name, page_idx, semaphore, user_hint=None, layout_image=None, text_layer=None, page_groups=None):
+        """Async counterpart of `_parse_pdf_page`; only model requests hold the semaphore."""
+        tiled = self._plan_tiles(origin_image, prompt_mode, text_layer)
+        if tiled is not None:
+            return await self._aparse_tiled_page(
+                tiled, prompt_mode, save_dir, save_name, page_idx, semaphore, user_hint=user_hint, layout_image=layout_image, text_layer=text_layer,
+            )
+        if text_layer is not None and text_layer['method'] == SupportedPdfParseMethod.TXT:
+            return await asyncio.to_thread(
+                self._parse_text_layer_page, origin_image, text_layer, prompt_mode, save_dir, save_name, page_idx, layout_image,
+            )
+
+        analysis = await asyncio.to_thread(page_groups.analyze, page_idx, origin_image) if page_groups is not None else None
+        text_chars = text_layer.get('chars') if text_layer is not None else None
+        if analysis is not None and analysis['blank']:
+            result = await asyncio.to_thread(self._save_blank_page, origin_image, prompt_mode, save_dir, save_name, page_idx, layout_image)
+            result['skipped'] = True
+        else:
+            meta = {}
+            if analysis is not None and analysis['duplicate_of'] is not None:
+                page = await asyncio.to_thread(self._prepare_page, origin_image, prompt_mode, "pdf", None, False, user_hint, text_chars)
+                response, recovered = await asyncio.wrap_future(page_groups.response_future(analysis['duplicate_of']))
+            else:
+                # whatever fails before the response is published must release the duplicates waiting for it
+                try:
+                    page = await asyncio.to_thread(self._prepare_page, origin_image, prompt_mode, "pdf", None, False, user_hint, text_chars)
+                    async with semaphore:
+                        response, meta = await self._ainfer_page(page, user_hint=user_hint)
+                    recovered = await self._arecover(response, page, origin_image, prompt_mode, user_hint=user_hint, semaphore=semaphore)
+                except BaseException as e:
+                    if page_groups is not None:
+                        page_groups.set_error(page_idx, e)
+                    raise
+                if page_groups is not None:
+                    page_groups.set_response(page_idx, (response, recovered))
+            result = await asyncio.to_thread(
+                self._finalize_page, response, page, origin_image, prompt_mode, save_dir, save_name, "pdf", page_idx, layout_image, recovered
+            )
+            result.update(meta)
+
+        if analysis is not None:
+            result.update(analysis)
+        if text_layer is not None:
+            result.update({'parse_method': SupportedPdfParseMethod.OCR.value, 'text_layer_reason': text_layer['reason']})
+        return result
+
+    def _plan_recovery(self, response, page, origin_image, prompt_mode):
+        """A PageRecovery for a layout response that is not valid json (with recover_pages), else None."""
+        if not self.recover_pages or prompt_mode not in CELL_PROMPT_MODES or parse_cells(response) is not None:
+            return None
+        budget = page.get("budget")
+        max_completion_tokens = budget['max_completion_tokens'] if budget else self.max_completion_tokens
+        return PageRecovery(origin_image, page, response, max_completion_tokens)
+
+    def _recover(self, response, page, origin_image, prompt_mode, user_hint=None):
+        """
+        Recovers the cells of a page whose layout response is not valid json: the complete
+        cells are kept and only the regions they miss are sent again.
+
+        Returns:
+            tuple: (cells, stats) for `_finalize_page`, or None when the response needs no recovery.
+        """
+        recovery = self._plan_recovery(response, page, origin_image, prompt_mode)
+        if recovery is None:
+            return None
+
+        def _run(request):
+            try:
+                return self._inference(request['image'], request['prompt'], user_hint=user_hint, max_completion_tokens=request['max_completion_tokens'])
+            except RequestFailedError as e:
+                print(f"recovery request of region {request['crop_box']} failed: {e}")
+                return None
+
+        responses = []
+        if recovery.requests:
+            num_thread = max(1, min(len(recovery.requests), self.hf_batch_size if self.use_hf else self.num_thread))
+            with ThreadPool(num_thread) as pool:
+                responses = pool.map(_run, recovery.requests)
+        cells, stats = recovery.finish(responses)
+        print(f"recovered a page from {stats['salvaged']} salvaged cells and {stats['regions']} re-parsed regions ({stats['recovered']} cells)")
+        return cells, stats
+
+    async def _arecover(self, response, page, origin_image, prompt_mode, user_hint=None, semaphore=None):
+        """Async counterpart of `_recover`; each region request holds `semaphore` when given."""
+        recovery = await asyncio.to_thread(self._plan_recovery, response, page, origin_image, prompt_mode)
+        if recovery is None:
+            return None
+
+        async def _run(request):
+            try:
+                if semaphore is None:
+                    return await self._ainference(request['image'], request['prompt'], user_hint=user_hint, max_completion_tokens=request['max_completion_tokens'])
+                async with semaphore:
+                    return await self._ainference(request['image'], request['prompt'], user_hint=user_hint, max_completion_tokens=request['max_completion_tokens'])
+            except RequestFailedError as e:
+                print(f"recovery request of region {request['crop_box']} failed: {e}")
+                return None
+
+        responses = await asyncio.gather(*(_run(request) for request in recovery.requests))
+        cells, stats = await asyncio.to_thread(recovery.finish, responses)
+        print(f"recovered a page from {stats['salvaged']} salvaged cells and {stats['regions']} re-parsed regions ({stats['recovered']} cells)")
+        return cells, stats
+
+    def _plan_tiles(self, origin_image, prompt_mode, text_layer=None):
+        """A TiledPage for an oversized page to be parsed in tiles, None for an ordinary page."""
+        if not self.tile_pages or prompt_mode not in CELL_PROMPT_MODES:
+            return None
+        if text_layer is not None and text_layer['method'] == SupportedPdfParseMethod.TXT:
+            return None
+        if max(origin_image.size) <= TILE_THRESHOLD:
+            return None
+        return TiledPage(origin_image, tile_size=self.tile_size, overlap=self.tile_overlap)
+
+    def _tile_response_cells(self, response, page, tile_image, prompt_mode):
+        """Returns (cells in tile coordinates, filtered); a response that is not valid json gives no cells (its salvaged ones with recover_pages)."""
+        if response.strip() == '[]':
+            return [], False  # nothing on this tile
+        cells, filtered = post_process_output(
+            response, prompt_mode, tile_image, page["image"], min_pixels=page["min_pixels"], max_pixels=page["max_pixels"],
+        )
+        if not filtered:
+            return cells, False
+        # the complete cells of a broken tile, its neighbours overlap what is lost
+        salvaged = salvage_cells(response) if self.recover_pages else []
+        if salvaged:
+            salvaged = post_process_cells(
+                tile_image, salvaged, page["image"].width, page["image"].height, min_pixels=page["min_pixels"], max_pixels=page["max_pixels"],
+            )
+        return salvaged, True
+
+    def _parse_pdf_tile(self, tiled, tile_idx, prompt_mode, save_dir, save_name, page_idx, user_hint=None, layout_image=None, text_layer=None):
+        """
+        Parses one tile of an oversized pdf page, scheduled like a page.
+
+        The worker completing the last tile merges the page and returns its result,
+        the others return None.
+        """
+        try:
+            tile_image = tiled.tile_image(tile_idx)
+            page = self._prepare_page(tile_image, prompt_mode, source="pdf", user_hint=user_hint)
+            response, _ = self._infer_page(page, user_hint=user_hint)
+            cells, filtered = self._tile_response_cells(response, page, tile_image, prompt_mode)
+        except RequestFailedError as e:
+            print(f"page {page_idx} tile {tile_idx} failed: {e}")
+            last = tiled.add(tile_idx, error=f"{type(e).__name__}: {e}")
+        except BaseException as e:
+            tiled.add(tile_idx, error=f"{type(e).__name__}: {e}", abort=True)
+            raise
+        else:
+            last = tiled.add(tile_idx, cells=cells, filtered=filtered)
+        if not last or tiled.aborted:
+            return None
+        return self._finalize_tiled_page(tiled, prompt_mode, save_dir, save_name, page_idx, layout_image=layout_image, text_layer=text_layer)
+
+    async def _aparse_tiled_page(self, tiled, prompt_mode, save_dir, save_name, page_idx, semaphore, user_hint=None, layout_image=None, text_layer=None):
+        """Async counterpart of `_parse_pdf_tile`: the tiles of the page run concurrently, each request holds the semaphore."""
+        async def _tile(tile_idx):
+            tile_image = await asyncio.to_thread(tiled.tile_image, tile_idx)
+            page = await asyncio.to_thread(self._prepare_page, tile_image, prompt_mode, "pdf", None, False, user_hint)
+            try:
+                async with semaphore:
+                    response, _ = await self._ainfer_page(page, user_hint=user_hint)
+            except RequestFailedError as e:
+                print(f"page {page_idx} tile {tile_idx} failed: {e}")
+                tiled.add(tile_idx, error=f"{type(e).__name__}: {e}")
+                return
+            cells, filtered = await asyncio.to_thread(self._tile_response_cells, response, page, tile_image, prompt_mode)
+            tiled.add(tile_idx, cells=cells, filtered=filtered)
+
+        outcomes = await asyncio.gather(*(_tile(tile_idx) for tile_idx in range(len(tiled))), return_exceptions=True)
+        for outcome in outcomes:
+            if isinstance(outcome, BaseException):
+                raise outcome
+        return await asyncio.to_thread(
+            self._finalize_tiled_page, tiled, prompt_mode, save_dir, save_name, page_idx, layout_image, text_layer
+        )
+
+    def _finalize_tiled_page(self, tiled, prompt_mode, save_dir, save_name, page_idx, layout_image=None, text_layer=None):
+        """Merges the tile cells into the page and writes the page outputs."""
+        if len(tiled.errors) == len(tiled):
+            raise RequestFailedError(f"all {len(tiled)} tiles failed, e.g. {tiled.errors[min(tiled.errors)]}")
+        layout_image = layout_image or self.layout_image
+        cells, stats = tiled.merge()
+        if stats['failed'] or stats['filtered']:
+            print(f"page {page_idx}: tiles {stats['failed']} failed and {stats['filtered']} returned no valid json, merged the other tiles")
+        result = {'page_no': page_idx,
+            "input_height": tiled.image.height,
+            "input_width": tiled.image.width,
+            "tiling": stats,
+        }
+        self._save_cells(result, cells, tiled.image, prompt_mode, save_dir, f"{save_name}_page_{page_idx}", layout_image)
+        if text_layer is not None:
+            result.update({'parse_method': SupportedPdfParseMethod.OCR.value, 'text_layer_reason': text_layer['reason']})
+        return result
+
+    def _save_cells(self, result, cells, origin_image, prompt_mode, save_dir, save_name, layout_image):
+        """Writes the json, layout image and markdown outputs of parsed cells, updates result in place."""
+        # 结果后处理：在 layout_all 模式下，过滤掉 Page-header / Page-footer
+        if prompt_mode == 'prompt_layout_all_en':
+            try:
+                cells = [c for c in cells if not isinstance(c, dict) or c.get('category') not in ['Page-header', 'Page-footer']]
+            except Exception:
+                pass
+        json_file_path = os.path.join(save_dir, f"{save_name}.json")
+        with open(json_file_path, 'w', encoding="utf-8") as w:
+            json.dump(cells, w, ensure_ascii=False)
+
+        result.update({
+            'layout_info_path': json_file_path,
+        })
+        result.update(self._save_layout_image(origin_image, cells, save_dir, save_name, layout_image))
+        if prompt_mode != "prompt_layout_only_en":  # no text md when detection only
+            # crop and encode the pictures once, both markdown variants reference the same crops
+            picture_refs, picture_stats = encode_pictures(
+                origin_image, cells, image_encoding=self.picture_encoding, asset_store=self._get_asset_store(save_dir),
+            )
+            # nohf is used for clean output or metric of omnidocbench、olmbench
+            variants = ('full', 'nohf', 'text') if self.save_text else ('full', 'nohf')
+            contents = layoutjson2md_variants(origin_image, cells, text_key='text', variants=variants, picture_refs=picture_refs)
+            md_file_path = os.path.join(save_dir, f"{save_name}.md")
+            with open(md_file_path, "w", encoding="utf-8") as md_file:
+                md_file.write(contents['full'])
+            md_nohf_file_path = os.path.join(save_dir, f"{save_name}_nohf.md")
+            with open(md_nohf_file_path, "w", encoding="utf-8") as md_file:
+                md_file.write(contents['nohf'])
+            result.update({
+                'md_content_path': md_file_path,
+                'md_content_nohf_path': md_nohf_file_path,
+                'picture_stats': picture_stats,
+            })
+            if self.save_text:
+                text_file_path = os.path.join(save_dir, f"{save_name}.txt")
+                with open(text_file_path, "w", encoding="utf-8") as text_file:
+                    text_file.write(contents['text'])
+                result['text_content_path'] = text_file_path
+
+    def _get_asset_store(self, save_dir):
+        if self.picture_mode != 'asset':
+            return None
+        return PictureAssetStore(os.path.join(save_dir, "assets"), url_prefix=self.asset_url_prefix, encoding=self.picture_encoding)
+
+    def _draw_layout(self, origin_image, cells):
+        if self.layout_renderer == 'pil':
+            return draw_layout_on_image_pil(origin_image, cells)
+        return draw_layout_on_image(origin_image, cells)
+
+    def _save_layout_image(self, origin_image, cells, save_dir, save_name, layout_image):
+        """Writes the layout visualization according to the layout_image mode, returns the result fields."""
+        if layout_image == 'off':
+            return {}
+        image_layout_path = os.path.join(save_dir, f"{save_name}.jpg")
+        if layout_image == 'lazy':
+            return {'layout_image_path': image_layout_path, 'layout_image_lazy': True}
+        image_with_layout = origin_image
+        if cells:
+            try:
+                image_with_layout = self._draw_layout(origin_image, cells)
+            except Exception as e:
+                print(f"Error drawing layout on image: {e}")
+        image_with_layout.save(image_layout_path)
+        return {'layout_image_path': image_layout_path}
+
+    def _load_origin_image(self, file_path, page_no=0):
+        if os.path.splitext(file_path)[1] == '.pdf':
+            with fitz.open(file_path) as doc:
+                return fitz_doc_to_image(doc[page_no], target_dpi=self.dpi, **self._render_options())
+        return fetch_image(file_path)
+
+    def render_layout_image(self, result):
+        """
+        Materializes the layout image of a page parsed with layout_image='lazy'.
+
+        The overlay is drawn from the saved layout json on the page re-rendered from
+        result['file_path'], and written to result['layout_image_path'].
+
+        Returns:
+            str: The path of the layout image.
+        """
+        image_layout_path = result.get('layout_image_path')
+        if not image_layout_path:
+            raise ValueError("no layout image was requested for this page (layout_image='off')")
+        if result.get('layout_image_lazy') or not os.path.exists(image_layout_path):
+            origin_image = self._load_origin_image(result['file_path'], result.get('page_no', 0))
+            layout_info_path = result.get('layout_info_path')
+            if layout_info_path:
+                render_layout_image(origin_image, layout_info_path, image_layout_path, renderer=self.layout_renderer)
+            else:
+                origin_image.save(image_layout_path)
+            result['layout_image_lazy'] = False
+        return image_layout_path
+
+    def _parse_single_image(
+        self, 
+        origin_image, 
+        prompt_mode, 
+        save_dir, 
+        save_name, 
+        source="image", 
+        page_idx=0, 
+        bbox=None,
+        fitz_preprocess=False,
+        user_hint: str | None = None,
+        layout_image=None,
+        ):
+        page = self._prepare_page(origin_image, prompt_mode, source=source, bbox=bbox, fitz_preprocess=fitz_preprocess, user_hint=user_hint)
+        response, meta = self._infer_page(page, user_hint=user_hint)
+        recovered = self._recover(response, page, origin_image, prompt_mode, user_hint=user_hint)
+        result = self._finalize_page(response, page, origin_image, prompt_mode, save_dir, save_name, source=source, page_idx=page_idx, layout_image=layout_image, recovered=recovered)
+        result.update(meta)
+        return result
+
+    def _generate(self, page, user_hint=None, max_completion_tokens=None):
+        """Returns (response, generation stats when streaming else None)."""
+        if self._use_stream(page):
+            return self._inference_stream(page["image"], page["prompt"], user_hint=user_hint, max_completion_tokens=max_completion_tokens)
+        return self._inference(page["image"], page["prompt"], user_hint=user_hint, max_completion_tokens=max_completion_tokens), None
+
+    async def _agenerate(self, page, user_hint=None, max_completion_tokens=None):
+        if self._use_stream(page):
+            return await self._ainference_stream(page["image"], page["prompt"], user_hint=user_hint, max_completion_tokens=max_completion_tokens)
+        return await self._ainference(page["image"], page["prompt"], user_hint=user_hint, max_completion_tokens=max_completion_tokens), None
+
+    def _budget_truncated(self, response, page, generation):
+        """True if a cell list response was cut by a page budget below the configured cap."""
+        if page["budget"]['max_completion_tokens'] >= self.max_completion_tokens or page["prompt_mode"] not in CELL_PROMPT_MODES:
+            return False
+        if response is None or (generation is not None and generation['aborted']):
+            return False
+        return not response.rstrip().endswith(']')
+
+    def _infer_page(self, page, user_hint: str | None = None):
+        """
+        Runs the model on a prepared page through the page cache.
+
+        Returns:
+            tuple: (response, dict of result fields: 'cache_hit' with a page cache, 'generation' when streaming,
+                'budget' with page budgets)
+        """
+        meta = {}
+        cache_key = None
+        if self.page_cache is not None:
+            cache_key = self._page_cache_key(page, user_hint)
+            response = self.page_cache.get(cache_key)
+            if response is not None:
+                return response, {'cache_hit': True}
+            meta['cache_hit'] = False
+        budget = page.get("budget")
+        response, generation = self._generate(page, user_hint, budget and budget['max_completion_tokens'])
+        if budget is not None and self._budget_truncated(response, page, generation):
+            print(f"output reached the page budget of {budget['max_completion_tokens']} tokens, retrying with {self.max_completion_tokens}")
+            budget['retried'] = True
+            response, generation = self._generate(page, user_hint)
+        if generation is not None:
+            meta['generation'] = generation
+        if budget is not None:
+            meta['budget'] = budget
+        # a cancelled loop is not cached, a later run may get a clean generation
+        if cache_key is not None and not meta.get('generation', {}).get('aborted'):
+            self.page_cache.put(cache_key, response)
+        return response, meta
+
+    async def _ainfer_page(self, page, user_hint: str | None = None):
+        meta = {}
+        cache_key = None
+        if self.page_cache is not None:
+            cache_key = await asyncio.to_thread(self._page_cache_key, page, user_hint)
+            response = await asyncio.to_thread(self.page_cache.get, cache_key)
+            if response is not None:
+                return response, {'cache_hit': True}
+            meta['cache_hit'] = False
+        budget = page.get("budget")
+        response, generation = await self._agenerate(page, user_hint, budget and budget['max_completion_tokens'])
+        if budget is not None and self._budget_truncated(response, page, generation):
+            print(f"output reached the page budget of {budget['max_completion_tokens']} tokens, retrying with {self.max_completion_tokens}")
+            budget['retried'] = True
+            response, generation = await self._agenerate(page, user_hint)
+        if generation is not None:
+            meta['generation'] = generation
+        if budget is not None:
+            meta['budget'] = budget
+        if cache_key is not None and not meta.get('generation', {}).get('aborted'):
+            await asyncio.to_thread(self.page_cache.put, cache_key, response)
+        return response, meta
+
+    async def _aparse_single_image(
+        self,
+        origin_image,
+        prompt_mode,
+        save_dir,
+        save_name,
+        source="image",
+        page_idx=0,
+        bbox=None,
+        fitz_preprocess=False,
+        user_hint: str | None = None,
+        layout_image=None,
+        ):
+        page = await asyncio.to_thread(
+            self._prepare_page, origin_image, prompt_mode, source, bbox, fitz_preprocess, user_hint
+        )
+        response, meta = await self._ainfer_page(page, user_hint=user_hint)
+        # the caller holds a slot of the async limit for this image, recovery requests run in it
+        recovered = await self._arecover(response, page, origin_image, prompt_mode, user_hint=user_hint)
+        result = await asyncio.to_thread(
+            self._finalize_page, response, page, origin_image, prompt_mode, save_dir, save_name, source, page_idx, layout_image, recovered
+        )
+        result.update(meta)
+        return result
+
+    def parse_image(self, input_path, filename, prompt_mode, save_dir, bbox=None, fitz_preprocess=False, user_hint: str | None = None, layout_image=None):
         origin_image = fetch_image(input_path)
-        result = self._parse_single_image(origin_image, prompt_mode, save_dir, filename, source="image", bbox=bbox, fitz_preprocess=fitz_preprocess, user_hint=user_hint)
+        result = self._parse_single_image(origin_image, prompt_mode, save_dir, filename, source="image", bbox=bbox, fitz_preprocess=fitz_preprocess, user_hint=user_hint, layout_image=layout_image)
         result['file_path'] = input_path
         return [result]
         
-    def parse_pdf(self, input_path, filename, prompt_mode, save_dir, user_hint: str | None = None):
+    def _prepare_regions(self, origin_image, bboxes, fitz_preprocess=False, crop=False):
+        """
+        Returns the (image, prompt, extra) request of each region, extra holding the fields added to its result.
+
+        Without crop the page is preprocessed once for all its regions; with crop every
+        region gets its own padded crop and reports its 'crop_box'.
+        """
+        assert len(bboxes) > 0, "bboxes should not be empty"
+        # hf takes the PIL images, the other backends the encoded ones
+        encode = (lambda image: image) if self.use_hf else (lambda image: encode_image_for_transport(image, self.image_encoding))
+        if crop:
+            requests = []
+            for bbox in bboxes:
+                page = self._prepare_page(origin_image, "prompt_grounding_ocr", bbox=bbox, fitz_preprocess=fitz_preprocess, crop=True)
+                requests.append((encode(page["image"]), page["prompt"], {'crop_box': page["crop_box"]}))
+            return requests
+        page = self._prepare_page(origin_image, "prompt_grounding_ocr", bbox=bboxes[0], fitz_preprocess=fitz_preprocess, crop=False)
+        prompts = self._grounding_prompts(origin_image, page["image"], bboxes, min_pixels=page["min_pixels"], max_pixels=page["max_pixels"])
+        # every region request shares the page image, encoded once
+        image = encode(page["image"])
+        return [(image, prompt, {}) for prompt in prompts]
+
+    def parse_regions(self, image, bboxes, fitz_preprocess=False, user_hint: str | None = None, crop=None):
+        """
+        Grounding OCR of several regions of one image.
+
+        By default the image is preprocessed and encoded once and every region is grounded
+        on the whole page; in crop mode each region is sent as its own padded crop instead.
+        One request per region runs concurrently (num_thread requests, or hf_batch_size
+        pages per generate in hf mode).
+
+        Args:
+            image: A PIL image, or a path / url of an image.
+            bboxes: [x1, y1, x2, y2] per region, in the coordinates of `image`.
+            crop: Crop mode, region_crop by default.
+
+        Returns:
+            list: {'bbox', 'text'} per region in the order of `bboxes`, with 'error' instead
+                of 'text' for a region whose request failed after its retries. In crop mode
+                'crop_box' is the [x1, y1, x2, y2] of the crop sent for the region.
+        """
+        origin_image = fetch_image(image)
+        crop = self.region_crop if crop is None else crop
+        requests = self._prepare_regions(origin_image, bboxes, fitz_preprocess=fitz_preprocess, crop=crop)
+
+        def _run(request):
+            region_image, prompt, extra = request
+            try:
+                return {**extra, 'text': self._inference(region_image, prompt, user_hint=user_hint)}
+            except RequestFailedError as e:
+                return {**extra, 'error': f"{type(e).__name__}: {e}"}
+
+        num_thread = max(1, min(len(requests), self.hf_batch_size if self.use_hf else self.num_thread))
+        with ThreadPool(num_thread) as pool:
+            outputs = pool.map(_run, requests)
+        return [{'bbox': list(bbox), **output} for bbox, output in zip(bboxes, outputs)]
+
+    def reocr_cells(self, image, cells, categories=REOCR_CATEGORIES, crop=True, fitz_preprocess=False, user_hint: str | None = None):
+        """
+        Reads the text of layout cells again, one region request per cell.
+
+        Args:
+            image: The page (PIL image, path or url) the cell bboxes refer to.
+            cells: Layout cells of the page, e.g. loaded from its layout json.
+            categories: Only the cells of these categories are read again, the others are returned unchanged.
+            crop: Send the padded crop of each cell (default) instead of grounding it on the whole page.
+
+        Returns:
+            list: Copies of the cells with their new 'text', or with 'reocr_error' (and the old
+                text) for a cell whose request failed after its retries.
+        """
+        indices = [i for i, cell in enumerate(cells) if cell.get('category') in categories]
+        if not indices:
+            return [dict(cell) for cell in cells]
+        regions = self.parse_regions(image, [cells[i]['bbox'] for i in indices], fitz_preprocess=fitz_preprocess, user_hint=user_hint, crop=crop)
+        return self._merge_reocr(cells, indices, regions)
+
+    @staticmethod
+    def _merge_reocr(cells, indices, regions):
+        cells_out = [dict(cell) for cell in cells]
+        for i, region in zip(indices, regions):
+            if 'text' in region:
+                cells_out[i]['text'] = region['text'].strip()
+            else:
+                cells_out[i]['reocr_error'] = region['error']
+        return cells_out
+
+    def iter_parse_pdf(self, input_path, filename, prompt_mode, save_dir, user_hint: str | None = None, layout_image=None, page_ids=None, catch_errors=False):
+        """
+        Parses the pages of a pdf with the thread pool, yielding each page result as soon as it is post-processed.
+
+        Args:
+            page_ids: Optional list of the page indices to parse, all pages by default.
+            catch_errors: Yield {'page_no', 'error'} for a failing page instead of aborting the document
+                (pages whose model request failed after all its retries always are).
+        """
         print(f"loading pdf: {input_path}")
-        images_origin = load_images_from_pdf(input_path, dpi=self.dpi)
-        total_pages = len(images_origin)
-        tasks = [
-            {
-                "origin_image": image,
-                "prompt_mode": prompt_mode,
-                "save_dir": save_dir,
-                "save_name": filename,
-                "source":"pdf",
-                "page_idx": i,
-                "user_hint": user_hint,
-            } for i, image in enumerate(images_origin)
-        ]
-
-        def _execute_task(task_args):
-            return self._parse_single_image(**task_args)
+        total_pages = get_pdf_page_count(input_path) if page_ids is None else len(page_ids)
+        text_layer = self._open_text_layer(input_path, prompt_mode)
+        page_groups = self._new_page_groups()
+
+        # the tiles of an oversized page are tasks of their own, their number is only known once it is rendered
+        max_tasks = None if self.tile_pages and prompt_mode in CELL_PROMPT_MODES else total_pages
+        # with hf the page workers feed the batcher, one generate runs at a time
+        num_thread = self.hf_batch_size if self.use_hf else self.num_thread
+        if max_tasks is not None:
+            num_thread = max(1, min(max_tasks, num_thread))
+        max_bytes = self.max_render_mb * 1024 * 1024 if self.max_render_mb else None
+        stream = BoundedPageStream(
+            self._iter_pdf_pages(input_path, page_ids=page_ids),
+            max_pages=num_thread + self.render_lookahead,
+            max_bytes=max_bytes,
+        )
+        def _tasks():
+            for i, image in stream:
+                task_args = {
+                    "origin_image": image,
+                    "prompt_mode": prompt_mode,
+                    "save_dir": save_dir,
+                    "save_name": filename,
+                    "page_idx": i,
+                    "user_hint": user_hint,
+                    "layout_image": layout_image,
+                    # classified here, next to rendering, and only for the pages being parsed
+                    "text_layer": text_layer.get(i) if text_layer is not None else None,
+                    "page_groups": page_groups,
+                }
+                # the tiles of an oversized page are queued like pages
+                tiled = self._plan_tiles(image, prompt_mode, task_args["text_layer"])
+                if tiled is None:
+                    yield task_args, None
+                else:
+                    for tile_idx in range(len(tiled)):
+                        yield task_args, (tiled, tile_idx)
+
+        def _execute_task(task):
+            task_args, tile = task
+            try:
+                if tile is not None:
+                    return self._parse_pdf_tile(
+                        *tile, prompt_mode, save_dir, filename, task_args["page_idx"], user_hint=user_hint,
+                        layout_image=layout_image, text_layer=task_args["text_layer"],
+                    )
+                return self._parse_pdf_page(**task_args)
+            except Exception as e:
+                # a request that exhausted its retries fails the page, not the whole document
+                if not catch_errors and not isinstance(e, RequestFailedError):
+                    raise
+                print(f"page {task_args['page_idx']} failed: {e}")
+                return {'page_no': task_args['page_idx'], 'error': f"{type(e).__name__}: {e}"}
+            finally:
+                if tile is None or tile[0].done:
+                    stream.release(task_args["page_idx"])
 
-        if self.use_hf:
-            num_thread =  1
-        else:
-            num_thread = min(total_pages, self.num_thread)
         print(f"Parsing PDF with {total_pages} pages using {num_thread} threads...")
 
-        results = []
         with ThreadPool(num_thread) as pool:
-            with tqdm(total=total_pages, desc="Processing PDF pages") as pbar:
-                for result in pool.imap_unordered(_execute_task, tasks):
-                    results.append(result)
-                    pbar.update(1)
+            try:
+                with tqdm(total=total_pages, desc="Processing PDF pages") as pbar:
+                    for result in pool.imap_unordered(_execute_task, _tasks()):
+                        if result is None:  # a tile of a page still in progress
+                            continue
+                        result['file_path'] = input_path
+                        pbar.update(1)
+                        yield result
+            finally:
+                stream.close()
+                self._close_text_layer(text_layer)
+        self.last_render_stats = stream.stats
+        print(f"render stats: {stream.summary()}")
+        if page_groups is not None:
+            print(page_groups.summary())
 
+    def parse_pdf(self, input_path, filename, prompt_mode, save_dir, user_hint: str | None = None, layout_image=None):
+        results = list(self.iter_parse_pdf(input_path, filename, prompt_mode, save_dir, user_hint=user_hint, layout_image=layout_image))
         results.sort(key=lambda x: x["page_no"])
-        for i in range(len(results)):
-            results[i]['file_path'] = input_path
         return results
 
+    def _print_summaries(self, results):
+        self._print_picture_summary(results)
+        if self.page_cache is not None:
+            hits = sum(1 for r in results if r.get('cache_hit'))
+            print(f"page cache hits in this file: {hits}/{len(results)}; {self.page_cache.summary()}")
+        budgets = [r['budget'] for r in results if r.get('budget')]
+        if budgets:
+            tokens = sorted(b['max_completion_tokens'] for b in budgets)
+            pixels = sorted(b['max_pixels'] for b in budgets)
+            print(f"page budget: max_completion_tokens min {tokens[0]} / median {tokens[len(tokens) // 2]} / max {tokens[-1]} "
+                  f"(cap {self.max_completion_tokens}), max_pixels median {pixels[len(pixels) // 2] / 1e6:.1f} MP, "
+                  f"{sum(1 for b in budgets if b.get('retried'))} pages retried at the cap")
+        generations = [r['generation'] for r in results if r.get('generation')]
+        if generations:
+            aborted = [g for g in generations if g['aborted']]
+            print(f"streaming: {len(aborted)}/{len(generations)} generations stopped on repetition, "
+                  f"{sum(g['completion_tokens'] for g in generations)} tokens generated, "
+                  f"~{sum(g['tokens_saved'] for g in aborted)} tokens saved")
+        if self.request_policy.stats['requests']:
+            print(self.request_policy.summary())
+        if self._hf_batcher is not None and self._hf_batcher.stats['batches']:
+            print(self._hf_batcher.summary())
+
+    def _print_picture_summary(self, results):
+        stats = [r['picture_stats'] for r in results if r.get('picture_stats')]
+        pictures = sum(s['pictures'] for s in stats)
+        if not pictures:
+            return
+        seconds = sum(s['picture_seconds'] for s in stats)
+        if self.picture_mode == 'asset':
+            written = sum(s['assets_written'] for s in stats)
+            print(f"pictures: {pictures} crops, {written} asset files written "
+                  f"({sum(s['asset_bytes_written'] for s in stats) / 1024:.1f} KB), "
+                  f"{pictures - written} reused, {sum(s['inline_bytes_avoided'] for s in stats) / 1024:.1f} KB of inline base64 avoided, "
+                  f"{seconds:.2f}s")
+        else:
+            print(f"pictures: {pictures} crops inlined ({sum(s['picture_inline_bytes'] for s in stats) / 1024:.1f} KB per markdown variant), {seconds:.2f}s")
+
+    def _jsonl_path(self, output_dir, filename):
+        return os.path.join(output_dir, os.path.basename(filename)+'.jsonl')
+
+    def _save_results_jsonl(self, output_dir, filename, results):
+        with open(self._jsonl_path(output_dir, filename), 'w', encoding="utf-8") as w:
+            for result in results:
+                w.write(json.dumps(result, ensure_ascii=False) + '\n')
+
+    def _prepare_output(self, input_path, output_dir):
+        output_dir = output_dir or self.output_dir
+        output_dir = os.path.abspath(output_dir)
+        filename, file_ext = os.path.splitext(os.path.basename(input_path))
+        save_dir = os.path.join(output_dir, filename)
+        os.makedirs(save_dir, exist_ok=True)
+        if file_ext != '.pdf' and file_ext not in image_extensions:
+            raise ValueError(f"file extension {file_ext} not supported, supported extensions are {image_extensions} and pdf")
+        return output_dir, filename, file_ext, save_dir
+
+    def _open_manifest(self, input_path, file_ext, save_dir, prompt_mode, bbox=None, fitz_preprocess=False, user_hint=None, layout_image=None):
+        """
+        Returns (manifest, completed results in page order, page ids still to parse) in resume mode,
+        (None, [], None) otherwise.
+        """
+        if not self.resume:
+            return None, [], None
+        params = {
+            'dpi': self.dpi,
+            'min_pixels': self.min_pixels,
+            'max_pixels': self.max_pixels,
+            'backend': 'hf' if self.use_hf else 'online' if self.use_online else 'vllm',
+            'model_name': self.online_model if self.use_online else self.model_name,
+            'temperature': self.temperature,
+            'top_p': self.top_p,
+            'max_completion_tokens': self.max_completion_tokens,
+            'image_encoding': self.image_encoding,
+            'picture_encoding': self.picture_encoding,
+            'picture_mode': self.picture_mode,
+            'pdf_parse_method': self.pdf_parse_method,
+            'page_budget': self.page_budget,
+            'region_crop': self.region_crop,
+            'tile_pages': self.tile_pages,
+            'tile_size': self.tile_size,
+            'tile_overlap': self.tile_overlap,
+            'recover_pages': self.recover_pages,
+            # what is written per page: a page parsed without them lacks files a resumed run expects
+            'skip_blank_pages': self.skip_blank_pages,
+            'dedup_pages': self.dedup_pages,
+            'save_text': self.save_text,
+            'layout_image': layout_image or self.layout_image,
+            'layout_renderer': self.layout_renderer,
+            'user_hint': str(user_hint).strip() if user_hint else None,
+            'bbox': bbox,
+            'fitz_preprocess': fitz_preprocess,
+        }
+        manifest = ParseManifest(save_dir, input_path, prompt_mode, params)
+        completed = manifest.load()
+        total_pages = get_pdf_page_count(input_path) if file_ext == '.pdf' else 1
+        page_ids = [page_no for page_no in range(total_pages) if page_no not in completed]
+        print(f"resume: {len(completed)}/{total_pages} pages already completed, {len(page_ids)} to parse"
+              + (f" ({len(manifest.failed)} failed last time)" if manifest.failed else ""))
+        return manifest, [completed[page_no] for page_no in sorted(completed)], page_ids
+
+    def iter_parse_file(self,
+        input_path,
+        output_dir="",
+        prompt_mode="prompt_layout_all_en",
+        bbox=None,
+        fitz_preprocess=False,
+        user_hint: str | None = None,
+        layout_image=None,
+        order="completion",
+        ):
+        """
+        Parses a file and yields each page result as soon as it is post-processed.
+
+        The jsonl is appended (and flushed) page by page instead of being written at the end.
+
+        Args:
+            order: 'completion' yields pages as they finish, 'page' yields them in page order,
+                holding back pages that finish before a slower earlier page.
+
+        Yields:
+            dict: the page result, as in the list returned by `parse_file`.
+        """
+        assert order in ('completion', 'page'), "order should be 'completion' or 'page'"
+        output_dir, filename, file_ext, save_dir = self._prepare_output(input_path, output_dir)
+        manifest, completed, page_ids = self._open_manifest(input_path, file_ext, save_dir, prompt_mode, bbox, fitz_preprocess, user_hint, layout_image)
+
+        if file_ext == '.pdf':
+            pages = self.iter_parse_pdf(
+                input_path, filename, prompt_mode, save_dir, user_hint=user_hint, layout_image=layout_image,
+                page_ids=page_ids, catch_errors=manifest is not None,
+            )
+        elif page_ids == []:
+            pages = iter([])
+        else:
+            pages = iter(self.parse_image(input_path, filename, prompt_mode, save_dir, bbox=bbox, fitz_preprocess=fitz_preprocess, user_hint=user_hint, layout_image=layout_image))
+
+        reorder = PageReorderBuffer() if order == 'page' else None
+        results = []
+        finished = False
+        try:
+            with open(self._jsonl_path(output_dir, filename), 'w', encoding="utf-8") as w:
+                def _emit(ready):
+                    for result in ready:
+                        w.write(json.dumps(result, ensure_ascii=False) + '\n')
+                        w.flush()
+                        results.append(result)
+                    return ready
+
+                for result in completed:
+                    yield from _emit(reorder.push(result) if reorder else [result])
+                for result in pages:
+                    if manifest is not None:
+                        manifest.record(result)
+                    yield from _emit(reorder.push(result) if reorder else [result])
+                if reorder:
+                    yield from _emit(reorder.flush())
+            finished = True
+        finally:
+            if manifest is not None:
+                manifest.close(finished=finished)
+
+        print(f"Parsing finished, results saving to {save_dir}")
+        self._print_summaries(results)
+
     def parse_file(self, 
         input_path, 
         output_dir="", 
@@ -403,27 +1579,421 @@ class DotsOCRParser:
         bbox=None,
         fitz_preprocess=False,
         user_hint: str | None = None,
+        layout_image=None,
         ):
-        output_dir = output_dir or self.output_dir
-        output_dir = os.path.abspath(output_dir)
-        filename, file_ext = os.path.splitext(os.path.basename(input_path))
-        save_dir = os.path.join(output_dir, filename)
-        os.makedirs(save_dir, exist_ok=True)
+        return list(self.iter_parse_file(
+            input_path,
+            output_dir=output_dir,
+            prompt_mode=prompt_mode,
+            bbox=bbox,
+            fitz_preprocess=fitz_preprocess,
+            user_hint=user_hint,
+            layout_image=layout_image,
+            order="page",
+        ))
+
+    def _open_batch_document(self, doc_idx, input_path, output_dir, prompt_mode, bbox=None, fitz_preprocess=False, user_hint=None, layout_image=None):
+        output_dir, filename, file_ext, save_dir = self._prepare_output(input_path, output_dir)
+        doc = BatchDocument(doc_idx, input_path, output_dir, filename, file_ext, save_dir)
+        doc.manifest, doc.resumed, page_ids = self._open_manifest(input_path, file_ext, save_dir, prompt_mode, bbox, fitz_preprocess, user_hint, layout_image)
+        if page_ids is None:
+            page_ids = list(range(get_pdf_page_count(input_path))) if doc.is_pdf else [0]
+        doc.page_ids = page_ids
+        doc.pending = len(page_ids)
+        return doc
+
+    def _finish_batch_document(self, doc):
+        """Writes the jsonl of a document whose pages are all done, returns its page results in page order."""
+        doc.finish_time = time.perf_counter()
+        results = doc.page_results()
+        self._save_results_jsonl(doc.output_dir, doc.filename, results)
+        if doc.manifest is not None:
+            doc.manifest.close(finished=doc.error is None)
+        if doc.text_layer is not None:
+            print(f"{doc.filename}: {doc.text_layer.summary()}")
+            doc.text_layer.close()
+        if doc.page_groups is not None:
+            print(f"{doc.filename}: {doc.page_groups.summary()}")
+        print(f"batch: finished {doc.summary()}, results saving to {doc.save_dir}")
+        return results
+
+    def iter_parse_batch(self,
+        inputs,
+        output_dir="",
+        prompt_mode="prompt_layout_all_en",
+        bbox=None,
+        fitz_preprocess=False,
+        user_hint: str | None = None,
+        layout_image=None,
+        ):
+        """
+        Parses many documents through one global page queue.
+
+        The pages of all documents are flattened into a single stream served by `num_thread`
+        workers, so small documents keep the model busy and a large pdf does not hold the
+        workers of the others. Documents are opened in order and rendered lazily (at most
+        `num_thread + render_lookahead` pages resident); each document's outputs and jsonl are
+        written as soon as its last page completes. A failing page does not abort the batch,
+        it is reported as {'page_no', 'error'}; so are the pages of a document that cannot be
+        opened or whose rendering fails, next to its pages already parsed.
+
+        Args:
+            inputs: A directory, a glob pattern, a manifest file or a list of paths, see `resolve_batch_inputs`.
+            output_dir: Root of the outputs; sub directories of the inputs below their common parent are mirrored.
+
+        Yields:
+            tuple: (input_path, page results in page order) for each document, in completion order.
+        """
+        input_paths = resolve_batch_inputs(inputs)
+        output_dirs = batch_output_dirs(input_paths, output_dir or self.output_dir)
+        print(f"batch: {len(input_paths)} documents")
+        start_time = time.perf_counter()
+
+        documents = []
+        for doc_idx, input_path in enumerate(input_paths):
+            try:
+                doc = self._open_batch_document(doc_idx, input_path, output_dirs[input_path], prompt_mode, bbox, fitz_preprocess, user_hint, layout_image)
+            except Exception as e:
+                print(f"batch: cannot open {input_path}: {e}")
+                doc = BatchDocument(doc_idx, input_path, output_dirs[input_path], None, None, None)
+                doc.error = f"{type(e).__name__}: {e}"
+            documents.append(doc)
+        for doc in documents:
+            if doc.error is not None:
+                yield doc.input_path, doc.failed_results()
+            elif doc.pending == 0:
+                yield doc.input_path, self._finish_batch_document(doc)
+        total_pages = sum(doc.pending for doc in documents if doc.error is None)
+
+        def _pages():
+            for doc in documents:
+                if doc.error is not None or doc.pending == 0:
+                    continue
+                try:
+                    if doc.is_pdf:
+                        doc.text_layer = self._open_text_layer(doc.input_path, prompt_mode)
+                        doc.page_groups = self._new_page_groups()
+                        for page_idx, image in self._iter_pdf_pages(doc.input_path, page_ids=doc.page_ids):
+                            yield (doc.doc_idx, page_idx), image
+                    else:
+                        yield (doc.doc_idx, 0), fetch_image(doc.input_path)
+                except Exception as e:
+                    # the pages already queued still complete, the document is closed after the batch
+                    print(f"batch: rendering {doc.input_path} failed: {e}")
+                    doc.error = f"{type(e).__name__}: {e}"
+
+        num_thread = max(1, min(total_pages, self.hf_batch_size if self.use_hf else self.num_thread))
+        max_bytes = self.max_render_mb * 1024 * 1024 if self.max_render_mb else None
+        stream = BoundedPageStream(_pages(), max_pages=num_thread + self.render_lookahead, max_bytes=max_bytes)
+
+        def _tasks():
+            for (doc_idx, page_idx), image in stream:
+                doc = documents[doc_idx]
+                text_layer = doc.text_layer.get(page_idx) if doc.text_layer is not None else None
+                tiled = self._plan_tiles(image, prompt_mode, text_layer) if doc.is_pdf else None
+                if tiled is None:
+                    yield ((doc_idx, page_idx), image), None
+                else:
+                    for tile_idx in range(len(tiled)):
+                        yield ((doc_idx, page_idx), image), (tiled, tile_idx)
+
+        def _execute_task(task):
+            ((doc_idx, page_idx), image), tile = task
+            doc = documents[doc_idx]
+            if doc.first_page_time is None:
+                doc.first_page_time = time.perf_counter()
+            try:
+                if tile is not None:
+                    result = self._parse_pdf_tile(
+                        *tile, prompt_mode, doc.save_dir, doc.filename, page_idx, user_hint=user_hint, layout_image=layout_image,
+                        text_layer=doc.text_layer.get(page_idx) if doc.text_layer is not None else None,
+                    )
+                elif doc.is_pdf:
+                    result = self._parse_pdf_page(
+                        image, prompt_mode, doc.save_dir, doc.filename, page_idx, user_hint=user_hint, layout_image=layout_image,
+                        text_layer=doc.text_layer.get(page_idx) if doc.text_layer is not None else None, page_groups=doc.page_groups,
+                    )
+                else:
+                    result = self._parse_single_image(
+                        image, prompt_mode, doc.save_dir, doc.filename, source="image", bbox=bbox,
+                        fitz_preprocess=fitz_preprocess, user_hint=user_hint, layout_image=layout_image,
+                    )
+            except Exception as e:
+                print(f"{doc.filename} page {page_idx} failed: {e}")
+                result = {'page_no': page_idx, 'error': f"{type(e).__name__}: {e}"}
+            finally:
+                if tile is None or tile[0].done:
+                    stream.release((doc_idx, page_idx))
+            if result is not None:
+                result['file_path'] = doc.input_path
+            return doc_idx, result
+
+        print(f"Parsing {total_pages} pages of {len(documents)} documents using {num_thread} threads...")
+        all_results = [r for doc in documents for r in doc.resumed]
+        with ThreadPool(num_thread) as pool:
+            try:
+                with tqdm(total=total_pages, desc="Processing batch pages") as pbar:
+                    for doc_idx, result in pool.imap_unordered(_execute_task, _tasks()):
+                        if result is None:  # a tile of a page still in progress
+                            continue
+                        pbar.update(1)
+                        all_results.append(result)
+                        doc = documents[doc_idx]
+                        if doc.manifest is not None:
+                            doc.manifest.record(result)
+                        if doc.add_result(result):
+                            yield doc.input_path, self._finish_batch_document(doc)
+            finally:
+                stream.close()
+        # documents whose rendering failed midway, with their pages parsed so far
+        for doc in documents:
+            if doc.error is not None and doc.pending > 0 and doc.save_dir is not None:
+                results = self._finish_batch_document(doc) + doc.failed_results()
+                yield doc.input_path, sorted(results, key=lambda r: r['page_no'])
+
+        self.last_render_stats = stream.stats
+        print(f"render stats: {stream.summary()}")
+        self._print_summaries(all_results)
+        print_batch_stats(documents, start_time)
+
+    def parse_batch(self,
+        inputs,
+        output_dir="",
+        prompt_mode="prompt_layout_all_en",
+        bbox=None,
+        fitz_preprocess=False,
+        user_hint: str | None = None,
+        layout_image=None,
+        ):
+        """
+        Parses many documents through one global page queue, see `iter_parse_batch`.
+
+        Returns:
+            dict: {input_path: page results in page order}, in input order.
+        """
+        results = dict(self.iter_parse_batch(
+            inputs,
+            output_dir=output_dir,
+            prompt_mode=prompt_mode,
+            bbox=bbox,
+            fitz_preprocess=fitz_preprocess,
+            user_hint=user_hint,
+            layout_image=layout_image,
+        ))
+        return {input_path: results[input_path] for input_path in resolve_batch_inputs(inputs)}
+
+    def _get_async_semaphore(self):
+        loop = asyncio.get_running_loop()
+        semaphore = self._async_semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.async_concurrency)
+            self._async_semaphores[loop] = semaphore
+        return semaphore
+
+    async def aparse_image(self, input_path, filename, prompt_mode, save_dir, bbox=None, fitz_preprocess=False, user_hint: str | None = None, layout_image=None):
+        origin_image = await asyncio.to_thread(fetch_image, input_path)
+        async with self._get_async_semaphore():
+            result = await self._aparse_single_image(origin_image, prompt_mode, save_dir, filename, source="image", bbox=bbox, fitz_preprocess=fitz_preprocess, user_hint=user_hint, layout_image=layout_image)
+        result['file_path'] = input_path
+        return [result]
+
+    async def aparse_regions(self, image, bboxes, fitz_preprocess=False, user_hint: str | None = None, crop=None):
+        """Async counterpart of `parse_regions`, the region requests share the async_concurrency limit."""
+        origin_image = await asyncio.to_thread(fetch_image, image)
+        crop = self.region_crop if crop is None else crop
+        requests = await asyncio.to_thread(self._prepare_regions, origin_image, bboxes, fitz_preprocess, crop)
+        semaphore = self._get_async_semaphore()
+
+        async def _run(request):
+            region_image, prompt, extra = request
+            async with semaphore:
+                try:
+                    return {**extra, 'text': await self._ainference(region_image, prompt, user_hint=user_hint)}
+                except RequestFailedError as e:
+                    return {**extra, 'error': f"{type(e).__name__}: {e}"}
+
+        outputs = await asyncio.gather(*(_run(request) for request in requests))
+        return [{'bbox': list(bbox), **output} for bbox, output in zip(bboxes, outputs)]
+
+    async def areocr_cells(self, image, cells, categories=REOCR_CATEGORIES, crop=True, fitz_preprocess=False, user_hint: str | None = None):
+        """Async counterpart of `reocr_cells`."""
+        indices = [i for i, cell in enumerate(cells) if cell.get('category') in categories]
+        if not indices:
+            return [dict(cell) for cell in cells]
+        regions = await self.aparse_regions(image, [cells[i]['bbox'] for i in indices], fitz_preprocess=fitz_preprocess, user_hint=user_hint, crop=crop)
+        return self._merge_reocr(cells, indices, regions)
+
+    async def aiter_parse_pdf(self, input_path, filename, prompt_mode, save_dir, user_hint: str | None = None, layout_image=None, page_ids=None, catch_errors=False):
+        """Async counterpart of `iter_parse_pdf`, yields page results in completion order."""
+        print(f"loading pdf: {input_path}")
+        total_pages = await asyncio.to_thread(get_pdf_page_count, input_path) if page_ids is None else len(page_ids)
+        text_layer = self._open_text_layer(input_path, prompt_mode)
+        page_groups = self._new_page_groups()
+        semaphore = self._get_async_semaphore()
+        max_bytes = self.max_render_mb * 1024 * 1024 if self.max_render_mb else None
+        stream = BoundedPageStream(
+            self._iter_pdf_pages(input_path, page_ids=page_ids),
+            max_pages=min(max(total_pages, 1), self.async_concurrency) + self.render_lookahead,
+            max_bytes=max_bytes,
+        )
+        pages = iter(stream)
+
+        async def _execute_task(page_idx, origin_image):
+            try:
+                # the page is classified by its own task, off the event loop
+                page_text_layer = await asyncio.to_thread(text_layer.get, page_idx) if text_layer is not None else None
+                return await self._aparse_pdf_page(
+                    origin_image, prompt_mode, save_dir, filename, page_idx, semaphore, user_hint=user_hint, layout_image=layout_image,
+                    text_layer=page_text_layer, page_groups=page_groups,
+                )
+            except Exception as e:
+                if not catch_errors and not isinstance(e, RequestFailedError):
+                    raise
+                print(f"page {page_idx} failed: {e}")
+                return {'page_no': page_idx, 'error': f"{type(e).__name__}: {e}"}
+            finally:
+                stream.release(page_idx)
+
+        # finished page tasks are put on the queue; the producer ends with None (or its exception)
+        done = asyncio.Queue()
+        tasks = []
+
+        async def _produce():
+            try:
+                while True:
+                    page = await asyncio.to_thread(next, pages, None)
+                    if page is None:
+                        break
+                    task = asyncio.create_task(_execute_task(*page))
+                    task.add_done_callback(done.put_nowait)
+                    tasks.append(task)
+                done.put_nowait(None)
+            except BaseException as e:
+                done.put_nowait(e)
+                raise
+
+        print(f"Parsing PDF with {total_pages} pages using up to {self.async_concurrency} concurrent requests...")
+        producer = asyncio.create_task(_produce())
+        produced, finished = False, 0
+        try:
+            while not produced or finished < len(tasks):
+                item = await done.get()
+                if item is None:
+                    produced = True
+                elif isinstance(item, BaseException):
+                    raise item
+                else:
+                    finished += 1
+                    result = item.result()
+                    result['file_path'] = input_path
+                    yield result
+        finally:
+            stream.close()
+            producer.cancel()
+            for task in tasks:
+                task.cancel()
+            self._close_text_layer(text_layer)
+        self.last_render_stats = stream.stats
+        print(f"render stats: {stream.summary()}")
+        if page_groups is not None:
+            print(page_groups.summary())
+
+    async def aparse_pdf(self, input_path, filename, prompt_mode, save_dir, user_hint: str | None = None, layout_image=None):
+        results = [result async for result in self.aiter_parse_pdf(input_path, filename, prompt_mode, save_dir, user_hint=user_hint, layout_image=layout_image)]
+        results.sort(key=lambda x: x["page_no"])
+        return results
+
+    async def aiter_parse_file(self,
+        input_path,
+        output_dir="",
+        prompt_mode="prompt_layout_all_en",
+        bbox=None,
+        fitz_preprocess=False,
+        user_hint: str | None = None,
+        layout_image=None,
+        order="completion",
+        ):
+        """Async counterpart of `iter_parse_file`."""
+        assert order in ('completion', 'page'), "order should be 'completion' or 'page'"
+        output_dir, filename, file_ext, save_dir = self._prepare_output(input_path, output_dir)
+        manifest, completed, page_ids = await asyncio.to_thread(
+            self._open_manifest, input_path, file_ext, save_dir, prompt_mode, bbox, fitz_preprocess, user_hint, layout_image
+        )
 
         if file_ext == '.pdf':
-            results = self.parse_pdf(input_path, filename, prompt_mode, save_dir, user_hint=user_hint)
-        elif file_ext in image_extensions:
-            results = self.parse_image(input_path, filename, prompt_mode, save_dir, bbox=bbox, fitz_preprocess=fitz_preprocess, user_hint=user_hint)
+            pages = self.aiter_parse_pdf(
+                input_path, filename, prompt_mode, save_dir, user_hint=user_hint, layout_image=layout_image,
+                page_ids=page_ids, catch_errors=manifest is not None,
+            )
         else:
-            raise ValueError(f"file extension {file_ext} not supported, supported extensions are {image_extensions} and pdf")
-        
+            async def _single_image():
+                if page_ids == []:
+                    return
+                for result in await self.aparse_image(input_path, filename, prompt_mode, save_dir, bbox=bbox, fitz_preprocess=fitz_preprocess, user_hint=user_hint, layout_image=layout_image):
+                    yield result
+            pages = _single_image()
+
+        reorder = PageReorderBuffer() if order == 'page' else None
+        results = []
+        finished = False
+        try:
+            with open(self._jsonl_path(output_dir, filename), 'w', encoding="utf-8") as w:
+                def _emit(ready):
+                    for result in ready:
+                        w.write(json.dumps(result, ensure_ascii=False) + '\n')
+                        w.flush()
+                        results.append(result)
+                    return ready
+
+                try:
+                    for result in completed:
+                        for ready in _emit(reorder.push(result) if reorder else [result]):
+                            yield ready
+                    async for result in pages:
+                        if manifest is not None:
+                            manifest.record(result)
+                        for ready in _emit(reorder.push(result) if reorder else [result]):
+                            yield ready
+                    if reorder:
+                        for ready in _emit(reorder.flush()):
+                            yield ready
+                finally:
+                    await pages.aclose()
+            finished = True
+        finally:
+            if manifest is not None:
+                manifest.close(finished=finished)
+
         print(f"Parsing finished, results saving to {save_dir}")
-        with open(os.path.join(output_dir, os.path.basename(filename)+'.jsonl'), 'w', encoding="utf-8") as w:
-            for result in results:
-                w.write(json.dumps(result, ensure_ascii=False) + '\n')
+        self._print_summaries(results)
 
-        return results
+    async def aparse_file(self,
+        input_path,
+        output_dir="",
+        prompt_mode="prompt_layout_all_en",
+        bbox=None,
+        fitz_preprocess=False,
+        user_hint: str | None = None,
+        layout_image=None,
+        ):
+        """
+        Async counterpart of `parse_file`.
 
+        Pages are sent as coroutines over one pooled connection per endpoint instead of
+        a thread per page; at most `async_concurrency` pages are in flight across all
+        documents parsed concurrently on the same event loop. Await `aclose()` before the
+        loop ends to close its connections.
+        """
+        return [result async for result in self.aiter_parse_file(
+            input_path,
+            output_dir=output_dir,
+            prompt_mode=prompt_mode,
+            bbox=bbox,
+            fitz_preprocess=fitz_preprocess,
+            user_hint=user_hint,
+            layout_image=layout_image,
+            order="page",
+        )]
 
 
 def main():
@@ -434,7 +2004,11 @@ def main():
     
     parser.add_argument(
         "input_path", type=str,
-        help="Input PDF/image file path"
+        help="Input PDF/image file path, or a directory, glob pattern or manifest file (one path per line, with --batch) to parse in batch mode"
+    )
+    parser.add_argument(
+        "--batch", action='store_true',
+        help="parse input_path in batch mode, required for a manifest file (.txt/.lst/.list/.jsonl)"
     )
     
     parser.add_argument(
@@ -478,13 +2052,117 @@ def main():
         help=""
     )
     parser.add_argument(
-        "--max_completion_tokens", type=int, default=16384,
-        help=""
+        "--max_completion_tokens", type=int, default=None,
+        help="token cap of a page, 16384 by default (24000 new tokens with --use_hf); --page_budget only lowers it"
     )
     parser.add_argument(
         "--num_thread", type=int, default=16,
         help=""
     )
+    parser.add_argument(
+        "--render_lookahead", type=int, default=2,
+        help="number of pdf pages rendered ahead of the inference threads"
+    )
+    parser.add_argument(
+        "--max_render_mb", type=int, default=None,
+        help="soft limit on the memory (MB) held by rendered pdf pages waiting for inference"
+    )
+    parser.add_argument(
+        "--render_workers", type=int, default=0,
+        help="number of processes used to rasterize pdf pages, 0 renders in the calling thread"
+    )
+    parser.add_argument(
+        "--image_encoding", choices=list(TRANSPORT_ENCODINGS), type=str, default="png",
+        help="encoding of the page images sent to the model"
+    )
+    parser.add_argument(
+        "--picture_encoding", choices=list(TRANSPORT_ENCODINGS), type=str, default="png",
+        help="encoding of the picture crops in markdown"
+    )
+    parser.add_argument(
+        "--picture_mode", choices=list(PICTURE_MODES), type=str, default="inline",
+        help="inline: base64 data urls in markdown, asset: content-addressed files under <save_dir>/assets"
+    )
+    parser.add_argument(
+        "--asset_url_prefix", type=str, default=None,
+        help="url prefix of the picture assets in markdown, relative paths if not set"
+    )
+    parser.add_argument(
+        "--save_text", action='store_true',
+        help="also save a plain text variant of each page (no header/footer, no pictures)"
+    )
+    parser.add_argument(
+        "--page_cache", type=str, default=None,
+        help="page level inference cache: a directory, or a sqlite file (sqlite:<path> or *.db)"
+    )
+    parser.add_argument(
+        "--page_cache_mb", type=float, default=None,
+        help="size bound of the page cache in MB, least recently used pages are evicted first"
+    )
+    parser.add_argument(
+        "--pdf_parse_method", choices=list(PDF_PARSE_METHODS), type=str, default="ocr",
+        help="ocr: every pdf page goes to the model, auto: born-digital pages are parsed from the text layer, txt: text layer whenever present"
+    )
+    parser.add_argument(
+        "--skip_blank_pages", action='store_true',
+        help="do not send blank pdf pages to the model"
+    )
+    parser.add_argument(
+        "--dedup_pages", action='store_true',
+        help="run visually identical pdf pages through the model once and reuse the result"
+    )
+    parser.add_argument(
+        "--resume", action='store_true',
+        help="checkpoint finished pages in the output dir and only parse the missing or failed ones when run again"
+    )
+    parser.add_argument(
+        "--stream", action='store_true',
+        help="stream layout responses from vllm and stop a generation early once it loops on repeated cells"
+    )
+    parser.add_argument(
+        "--stream_max_repeats", type=int, default=STREAM_MAX_REPEATED_RUN,
+        help="consecutive repeated cells (duplicate bbox or category/text pair) that stop a streamed generation"
+    )
+    parser.add_argument(
+        "--page_budget", action='store_true',
+        help="estimate max_completion_tokens and max_pixels per page from its content (ink, text lines, text layer), the configured values become upper bounds"
+    )
+    parser.add_argument(
+        "--request_timeout", type=float, default=600.0,
+        help="seconds per model request attempt (between chunks when streaming)"
+    )
+    parser.add_argument(
+        "--request_retries", type=int, default=2,
+        help="retries of a model request after a timeout, connection error, 429 or 5xx, with jittered exponential backoff"
+    )
+    parser.add_argument(
+        "--region_crop", action='store_true',
+        help="prompt_grounding_ocr sends the padded crop of the bbox with the ocr prompt instead of the whole page"
+    )
+    parser.add_argument(
+        "--tile_pages", action='store_true',
+        help=f"render pdf pages larger than {TILE_THRESHOLD}px at full dpi instead of 72 dpi and parse them as overlapping tiles"
+    )
+    parser.add_argument(
+        "--tile_size", type=int, default=TILE_SIZE,
+        help="side of a tile in rendered pixels"
+    )
+    parser.add_argument(
+        "--tile_overlap", type=int, default=TILE_OVERLAP,
+        help="overlap of neighbouring tiles in rendered pixels, cells seen by two tiles are kept once"
+    )
+    parser.add_argument(
+        "--recover_pages", action='store_true',
+        help="when a layout response is not valid json, keep its complete cells and parse only the page regions they miss again"
+    )
+    parser.add_argument(
+        "--layout_image", choices=list(LAYOUT_IMAGE_MODES), type=str, default="eager",
+        help="eager: draw the layout image while parsing, lazy: only record its path, off: no layout image"
+    )
+    parser.add_argument(
+        "--layout_renderer", choices=['fitz', 'pil'], type=str, default="fitz",
+        help="renderer of the layout image: fitz (default) or pil, which draws with NumPy/PIL directly on the pixels"
+    )
     parser.add_argument(
         "--no_fitz_preprocess", action='store_true',
         help="False will use tikz dpi upsample pipeline, good for images which has been render with low dpi, but maybe result in higher computational costs"
@@ -501,6 +2179,26 @@ def main():
         "--use_hf", type=bool, default=False,
         help="use to choose the inference method: vllm-server or transformers"
     )
+    parser.add_argument(
+        "--hf_batch_size", type=int, default=1,
+        help="pages per generate call with --use_hf (left padded), lowered automatically when memory runs short"
+    )
+    parser.add_argument(
+        "--hf_device", type=str, default=None,
+        help="device of the hf model: auto (cuda when available), cuda, cuda:N or cpu"
+    )
+    parser.add_argument(
+        "--hf_dtype", choices=list(HF_DTYPES), type=str, default=None,
+        help="dtype of the hf model, auto is bfloat16 on gpu and float32 on cpu"
+    )
+    parser.add_argument(
+        "--hf_threads", type=int, default=None,
+        help="torch intra-op threads on cpu, torch's default (the physical cores) if unset"
+    )
+    parser.add_argument(
+        "--hf_int8", action='store_true',
+        help="dynamic int8 quantization of the linear layers of the hf model on cpu"
+    )
 
     args = parser.parse_args()
 
@@ -523,6 +2221,37 @@ def main():
         min_pixels=min_pixels,
         max_pixels=max_pixels,
         use_hf=use_hf,
+        hf_batch_size=args.hf_batch_size,
+        hf_device=args.hf_device,
+        hf_dtype=args.hf_dtype,
+        hf_threads=args.hf_threads,
+        hf_int8=args.hf_int8,
+        render_lookahead=args.render_lookahead,
+        max_render_mb=args.max_render_mb,
+        render_workers=args.render_workers,
+        image_encoding=args.image_encoding,
+        picture_encoding=args.picture_encoding,
+        picture_mode=args.picture_mode,
+        asset_url_prefix=args.asset_url_prefix,
+        save_text=args.save_text,
+        page_cache=args.page_cache,
+        page_cache_mb=args.page_cache_mb,
+        pdf_parse_method=args.pdf_parse_method,
+        skip_blank_pages=args.skip_blank_pages,
+        dedup_pages=args.dedup_pages,
+        resume=args.resume,
+        stream=args.stream,
+        stream_max_repeats=args.stream_max_repeats,
+        page_budget=args.page_budget,
+        request_timeout=args.request_timeout,
+        request_retries=args.request_retries,
+        region_crop=args.region_crop,
+        tile_pages=args.tile_pages,
+        tile_size=args.tile_size,
+        tile_overlap=args.tile_overlap,
+        recover_pages=args.recover_pages,
+        layout_image=args.layout_image,
+        layout_renderer=args.layout_renderer,
     )
 
     filepath = args.input_path
@@ -532,13 +2261,26 @@ def main():
     else:
         fitz_preprocess = True
 
+    if args.batch or is_batch_spec(filepath):
+        # batch mode: per-document and aggregate stats are printed by parse_batch
+        dots_ocr_parser.parse_batch(
+            filepath,
+            output_dir=output_dir,
+            prompt_mode=args.prompt,
+            fitz_preprocess=fitz_preprocess
+            )
+        dots_ocr_parser.close()
+        return
+
     # result = dots_ocr_parser.get_prompt(prompt_mode=args.prompt, image=image_input)
     results = dots_ocr_parser.parse_file(
         filepath, 
         output_dir=output_dir, 
         prompt_mode=args.prompt,
+        bbox=args.bbox,
         fitz_preprocess=fitz_preprocess
         )
+    dots_ocr_parser.close()
 
     print(results)
 
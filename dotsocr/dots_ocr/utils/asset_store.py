@@ -0,0 +1,81 @@
+import os
+import hashlib
+import tempfile
+from io import BytesIO
+
+from PIL import Image
+from dots_ocr.utils.image_utils import to_rgb, TRANSPORT_ENCODINGS
+
+
+ASSET_EXTENSIONS = {'PNG': 'png', 'JPEG': 'jpg', 'WEBP': 'webp', 'BMP': 'bmp'}
+
+
+def inline_data_url_length(nbytes, format='PNG'):
+    """Length of the base64 data url `PILimage_to_base64` would produce for an nbytes payload."""
+    return len(f"data:image/{format.lower()};base64,") + 4 * ((nbytes + 2) // 3)
+
+
+class PictureAssetStore:
+    """
+    Writes picture crops once to content-addressed files instead of inlining them as base64.
+
+    A crop is stored as `<asset_dir>/<sha1 of the pixels>.<ext>`, so identical pictures
+    (repeated logos, the same figure on several pages) share one file and are encoded only
+    once. Files are written to a temporary name and renamed, which makes concurrent page
+    workers and re-runs on the same save_dir safe.
+
+    Args:
+        asset_dir: Directory the assets are written to.
+        url_prefix: Optional prefix used in the markdown references, e.g. a CDN url. When
+            None, references are relative to the parent of asset_dir (the save_dir of the md files).
+        encoding: One of TRANSPORT_ENCODINGS.
+    """
+
+    def __init__(self, asset_dir, url_prefix=None, encoding='png'):
+        if encoding not in TRANSPORT_ENCODINGS:
+            raise ValueError(f"unknown image encoding {encoding}, supported encodings are {list(TRANSPORT_ENCODINGS)}")
+        self.asset_dir = asset_dir
+        self.url_prefix = url_prefix
+        self.encoding = encoding
+
+    def _key(self, image):
+        h = hashlib.sha1()
+        h.update(f"{image.mode}:{image.width}x{image.height}:{self.encoding}:".encode())
+        h.update(image.tobytes())
+        return h.hexdigest()
+
+    def reference(self, file_name):
+        if self.url_prefix:
+            return f"{self.url_prefix.rstrip('/')}/{file_name}"
+        return f"{os.path.basename(os.path.normpath(self.asset_dir))}/{file_name}"
+
+    def put(self, image: Image.Image):
+        """
+        Stores a picture crop.
+
+        Returns:
+            tuple: (reference for the markdown, encoded size in bytes, True if the file was written by this call)
+        """
+        format, save_kwargs = TRANSPORT_ENCODINGS[self.encoding]
+        file_name = f"{self._key(image)}.{ASSET_EXTENSIONS[format]}"
+        path = os.path.join(self.asset_dir, file_name)
+        if os.path.exists(path):
+            return self.reference(file_name), os.path.getsize(path), False
+
+        if format in ('JPEG', 'BMP') and image.mode not in ('RGB', 'L'):
+            image = to_rgb(image)
+        buffered = BytesIO()
+        image.save(buffered, format=format, **save_kwargs)
+        data = buffered.getvalue()
+
+        os.makedirs(self.asset_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.asset_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return self.reference(file_name), len(data), True
@@ -0,0 +1,178 @@
+import os
+import glob
+import json
+import time
+
+from dots_ocr.utils.consts import image_extensions
+
+
+SUPPORTED_EXTENSIONS = {'.pdf'} | image_extensions
+MANIFEST_EXTENSIONS = ('.txt', '.lst', '.list', '.jsonl')
+
+
+def _is_supported(path):
+    return os.path.splitext(path)[1].lower() in SUPPORTED_EXTENSIONS
+
+
+def is_batch_spec(spec):
+    """
+    True if `spec` names several documents: a list, a directory or a glob pattern. An existing
+    file is one document; a manifest file is only read as such when asked for (`--batch`),
+    its extensions are those of the jsonl outputs and of plain text documents too.
+    """
+    if isinstance(spec, (list, tuple)):
+        return True
+    if os.path.isdir(spec):
+        return True
+    if os.path.isfile(spec):
+        return False
+    return glob.has_magic(spec)
+
+
+def _read_manifest(manifest_path):
+    """One document per line, either a path or a json object with a "path" key; relative paths are relative to the manifest."""
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    paths = []
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            path = json.loads(line)['path'] if line.startswith('{') else line
+            paths.append(os.path.join(base_dir, os.path.expanduser(path)))
+    return paths
+
+
+def resolve_batch_inputs(spec):
+    """
+    Expands a batch spec into the list of documents to parse.
+
+    Args:
+        spec: A directory (searched recursively), a glob pattern (`**` allowed), a manifest
+            file (.txt/.lst/.list/.jsonl, one document per line), a single file, or a list of those.
+
+    Returns:
+        list: Absolute paths of the pdf/image documents, without duplicates, in a stable order.
+    """
+    if isinstance(spec, (list, tuple)):
+        candidates = [path for item in spec for path in resolve_batch_inputs(item)]
+    elif os.path.isdir(spec):
+        candidates = sorted(
+            os.path.join(root, name)
+            for root, _, files in os.walk(spec)
+            for name in files
+            if _is_supported(name)
+        )
+    elif os.path.isfile(spec) and spec.lower().endswith(MANIFEST_EXTENSIONS):
+        candidates = _read_manifest(spec)
+        missing = [path for path in candidates if not os.path.isfile(path)]
+        if missing:
+            raise FileNotFoundError(f"{len(missing)} documents of manifest {spec} not found, e.g. {missing[0]}")
+    elif os.path.isfile(spec):
+        candidates = [spec]
+    else:
+        candidates = sorted(path for path in glob.glob(spec, recursive=True) if os.path.isfile(path))
+
+    inputs, seen = [], set()
+    for path in candidates:
+        path = os.path.abspath(path)
+        if path in seen:
+            continue
+        if not _is_supported(path):
+            print(f"batch: skipping {path}, unsupported file type")
+            continue
+        seen.add(path)
+        inputs.append(path)
+    return inputs
+
+
+def batch_output_dirs(input_paths, output_dir):
+    """
+    Maps each document to its output dir, mirroring the sub directories below the common
+    parent of the inputs so that documents with the same file name do not collide.
+    """
+    output_dir = os.path.abspath(output_dir)
+    if not input_paths:
+        return {}
+    root = os.path.commonpath([os.path.dirname(path) for path in input_paths])
+    return {
+        path: os.path.normpath(os.path.join(output_dir, os.path.relpath(os.path.dirname(path), root)))
+        for path in input_paths
+    }
+
+
+class BatchDocument:
+    """
+    Book-keeping of one document of a batch: its output location, the pages still in
+    flight, the collected page results and the timings used for the throughput stats.
+    """
+
+    def __init__(self, doc_idx, input_path, output_dir, filename, file_ext, save_dir):
+        self.doc_idx = doc_idx
+        self.input_path = input_path
+        self.output_dir = output_dir
+        self.filename = filename
+        self.file_ext = file_ext
+        self.save_dir = save_dir
+        self.is_pdf = file_ext == '.pdf'
+        self.manifest = None
+        self.page_ids = None
+        self.text_layer = None
+        self.page_groups = None
+        self.resumed = []      # results of pages completed by a previous run (resume mode)
+        self.results = []      # results of the pages parsed in this run
+        self.pending = 0
+        self.first_page_time = None
+        self.finish_time = None
+        self.error = None
+
+    def add_result(self, result):
+        self.results.append(result)
+        self.pending -= 1
+        return self.pending == 0
+
+    def page_results(self):
+        """All the page results of the document in page order."""
+        return sorted(self.resumed + self.results, key=lambda r: r['page_no'])
+
+    def failed_results(self):
+        """
+        {'page_no', 'error'} entries for the pages a failed document will not get: those not
+        rendered when its rendering failed midway, its first page when it could not be opened.
+        """
+        done = {r['page_no'] for r in self.resumed + self.results}
+        page_ids = self.page_ids if self.page_ids is not None else [0]
+        return [
+            {'page_no': page_idx, 'error': self.error, 'file_path': self.input_path}
+            for page_idx in page_ids if page_idx not in done
+        ]
+
+    def summary(self):
+        parsed = self.results
+        errors = sum(1 for r in parsed if 'error' in r)
+        seconds = (self.finish_time - self.first_page_time) if self.first_page_time and self.finish_time else 0.0
+        rate = f"{len(parsed) / seconds:6.2f} pages/s" if seconds > 0 else "     - pages/s"
+        resumed = len(self.resumed)
+        return (
+            f"{os.path.basename(self.input_path)}: {resumed + len(parsed)} pages, {len(parsed)} parsed in {seconds:.2f}s ({rate})"
+            + (f", {resumed} resumed" if resumed else "")
+            + (f", {errors} failed" if errors else "")
+        )
+
+
+def print_batch_stats(documents, start_time, end_time=None):
+    """Prints one line per document and the aggregate throughput of the batch."""
+    end_time = end_time or time.perf_counter()
+    print("batch stats:")
+    for doc in documents:
+        print(f"  {doc.summary() if doc.error is None else f'{os.path.basename(doc.input_path)}: failed, {doc.error}'}")
+    parsed = [r for doc in documents for r in doc.results]
+    errors = sum(1 for r in parsed if 'error' in r)
+    failed_docs = sum(1 for doc in documents if doc.error is not None)
+    seconds = end_time - start_time
+    print(
+        f"batch total: {len(documents) - failed_docs}/{len(documents)} documents, {len(parsed)} pages parsed in {seconds:.2f}s "
+        f"({len(parsed) / seconds if seconds > 0 else 0.0:.2f} pages/s, "
+        f"{(len(documents) - failed_docs) / seconds if seconds > 0 else 0.0:.2f} documents/s)"
+        + (f", {errors} pages failed" if errors else "")
+    )
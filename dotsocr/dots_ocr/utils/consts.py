@@ -3,3 +3,6 @@ MAX_PIXELS=11289600
 IMAGE_FACTOR=28
 
 image_extensions = {'.jpg', '.jpeg', '.png'}
+
+# region crops (grounding ocr / cell re-ocr in crop mode) are upscaled to at least this many pixels
+REGION_MIN_PIXELS = 256 * 28 * 28
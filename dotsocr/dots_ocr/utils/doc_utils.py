@@ -1,10 +1,17 @@
 import fitz
-import numpy as np
 import enum
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from multiprocessing import shared_memory
 from pydantic import BaseModel, Field
 from PIL import Image
 
 
+# rendered pages larger than this (in either dimension) fall back to 72 dpi
+MAX_RENDER_SIZE = 4500
+
+
 class SupportedPdfParseMethod(enum.Enum):
     OCR = 'ocr'
     TXT = 'txt'
@@ -17,44 +24,185 @@ class PageInfo(BaseModel):
     h: float = Field(description='the height of page')
 
 
-def fitz_doc_to_image(doc, target_dpi=200, origin_dpi=None) -> dict:
+def fitz_doc_to_image(doc, target_dpi=200, origin_dpi=None, max_size=MAX_RENDER_SIZE, fit=False) -> dict:
     """Convert fitz.Document to image, Then convert the image to numpy array.
 
     Args:
         doc (_type_): pymudoc page
         dpi (int, optional): reset the dpi of dpi. Defaults to 200.
+        max_size, fit: Handling of oversized pages, see `fitz_doc_to_pixmap`.
 
     Returns:
         dict:  {'img': numpy array, 'width': width, 'height': height }
     """
     from PIL import Image
-    mat = fitz.Matrix(target_dpi / 72, target_dpi / 72)
+    pm = fitz_doc_to_pixmap(doc, target_dpi=target_dpi, max_size=max_size, fit=fit)
+    image = Image.frombytes('RGB', (pm.width, pm.height), pm.samples)
+    return image
+
+
+def fitz_doc_to_pixmap(doc, target_dpi=200, max_size=MAX_RENDER_SIZE, fit=False):
+    """
+    Render a pymupdf page to an RGB pixmap.
+
+    A page larger than max_size (in either dimension) at target_dpi falls back to 72 dpi,
+    or, with fit, is rendered at the highest dpi that keeps it within max_size.
+    """
+    zoom = target_dpi / 72
+    if fit:
+        longest = max(doc.rect.width, doc.rect.height) * zoom
+        if longest > max_size:
+            zoom *= max_size / longest
+        return doc.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+    mat = fitz.Matrix(zoom, zoom)
     pm = doc.get_pixmap(matrix=mat, alpha=False)
 
-    if pm.width > 4500 or pm.height > 4500:
+    if pm.width > max_size or pm.height > max_size:
         mat = fitz.Matrix(72 / 72, 72 / 72)  # use fitz default dpi
         pm = doc.get_pixmap(matrix=mat, alpha=False)
+    return pm
 
-    image = Image.frombytes('RGB', (pm.width, pm.height), pm.samples)
-    return image
+
+def get_pdf_page_range(doc, start_page_id=0, end_page_id=None) -> range:
+    pdf_page_num = doc.page_count
+    end_page_id = (
+        end_page_id
+        if end_page_id is not None and end_page_id >= 0
+        else pdf_page_num - 1
+    )
+    if end_page_id > pdf_page_num - 1:
+        print('end_page_id is out of range, use images length')
+        end_page_id = pdf_page_num - 1
+    return range(max(start_page_id, 0), end_page_id + 1)
+
+
+def get_pdf_page_count(pdf_file, start_page_id=0, end_page_id=None) -> int:
+    with fitz.open(pdf_file) as doc:
+        return len(get_pdf_page_range(doc, start_page_id, end_page_id))
+
+
+def iter_images_from_pdf(pdf_file, dpi=200, start_page_id=0, end_page_id=None, page_ids=None, max_size=MAX_RENDER_SIZE, fit=False):
+    """Render pdf pages lazily, one page at a time.
+
+    Args:
+        page_ids: Optional explicit list of page indices to render, overrides the page range.
+        max_size, fit: Handling of oversized pages, see `fitz_doc_to_pixmap`.
+
+    Yields:
+        tuple: (page index, PIL image)
+    """
+    with fitz.open(pdf_file) as doc:
+        for index in (page_ids if page_ids is not None else get_pdf_page_range(doc, start_page_id, end_page_id)):
+            page = doc[index]
+            yield index, fitz_doc_to_image(page, target_dpi=dpi, max_size=max_size, fit=fit)
 
 
 def load_images_from_pdf(pdf_file, dpi=200, start_page_id=0, end_page_id=None) -> list:
-    images = []
+    return [
+        img for _, img in iter_images_from_pdf(pdf_file, dpi=dpi, start_page_id=start_page_id, end_page_id=end_page_id)
+    ]
+
+
+def _render_pages_to_shared_memory(pdf_file, page_ids, dpi, max_size=MAX_RENDER_SIZE, fit=False):
+    """Worker entry of PdfRasterizer: render a page range into shared memory blocks.
+
+    Returns:
+        list: [(page index, shared memory name, width, height), ...]
+    """
+    rendered = []
     with fitz.open(pdf_file) as doc:
-        pdf_page_num = doc.page_count
-        end_page_id = (
-            end_page_id
-            if end_page_id is not None and end_page_id >= 0
-            else pdf_page_num - 1
-        )
-        if end_page_id > pdf_page_num - 1:
-            print('end_page_id is out of range, use images length')
-            end_page_id = pdf_page_num - 1
-
-        for index in range(0, doc.page_count):
-            if start_page_id <= index <= end_page_id:
-                page = doc[index]
-                img = fitz_doc_to_image(page, target_dpi=dpi)
-                images.append(img)
-    return images
\ No newline at end of file
+        for index in page_ids:
+            pm = fitz_doc_to_pixmap(doc[index], target_dpi=dpi, max_size=max_size, fit=fit)
+            samples = pm.samples_mv if hasattr(pm, 'samples_mv') else pm.samples
+            shm = shared_memory.SharedMemory(create=True, size=len(samples))
+            shm.buf[:len(samples)] = samples
+            rendered.append((index, shm.name, pm.width, pm.height))
+            shm.close()
+            del samples, pm
+    return rendered
+
+
+def _image_from_shared_memory(name, width, height):
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        buf = shm.buf[:width * height * 3]
+        image = Image.frombytes('RGB', (width, height), buf)
+        buf.release()
+    finally:
+        shm.close()
+        shm.unlink()
+    return image
+
+
+def _discard_shared_memory(rendered):
+    for _, name, _, _ in rendered:
+        try:
+            shm = shared_memory.SharedMemory(name=name)
+            shm.close()
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class PdfRasterizer:
+    """
+    Multi-process pdf rasterizer.
+
+    Each worker process opens the document itself, renders a range of `chunk_size`
+    pages and hands the pixels back through `multiprocessing.shared_memory`, so the
+    parent only copies each page once instead of unpickling `pm.samples`. At most
+    `num_workers * 2` page ranges are outstanding, which keeps the memory bound of
+    the consumer intact. The worker processes are reused across documents; as with
+    any spawn-based pool, the entry script needs an `if __name__ == '__main__':` guard.
+
+    Args:
+        num_workers: Number of rendering processes.
+        chunk_size: Number of pages rendered per worker task.
+    """
+
+    def __init__(self, num_workers=4, chunk_size=2):
+        self.num_workers = max(1, int(num_workers))
+        self.chunk_size = max(1, int(chunk_size))
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            # spawn: never fork a process that is already running inference threads
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.num_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return self._executor
+
+    def iter_images(self, pdf_file, dpi=200, start_page_id=0, end_page_id=None, page_ids=None, max_size=MAX_RENDER_SIZE, fit=False):
+        """Same contract as `iter_images_from_pdf`: yields (page index, PIL image) in page order."""
+        if page_ids is None:
+            with fitz.open(pdf_file) as doc:
+                page_ids = list(get_pdf_page_range(doc, start_page_id, end_page_id))
+        page_ids = list(page_ids)
+        chunks = deque(page_ids[i:i + self.chunk_size] for i in range(0, len(page_ids), self.chunk_size))
+        executor = self._get_executor()
+        pending = deque()
+        rendered = []
+        try:
+            while chunks or pending or rendered:
+                if not rendered:
+                    while chunks and len(pending) < self.num_workers * 2:
+                        pending.append(executor.submit(_render_pages_to_shared_memory, pdf_file, chunks.popleft(), dpi, max_size, fit))
+                    rendered = pending.popleft().result()
+                    continue
+                index, name, width, height = rendered.pop(0)
+                yield index, _image_from_shared_memory(name, width, height)
+        finally:
+            _discard_shared_memory(rendered)
+            for future in pending:
+                if not future.cancel():
+                    try:
+                        _discard_shared_memory(future.result())
+                    except Exception:
+                        pass
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
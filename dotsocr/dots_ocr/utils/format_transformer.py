@@ -2,9 +2,11 @@ import os
 import sys
 import json
 import re
+import time
 
 from PIL import Image
-from dots_ocr.utils.image_utils import PILimage_to_base64
+from dots_ocr.utils.image_utils import PILimage_to_base64, encode_image_for_transport, TRANSPORT_ENCODINGS
+from dots_ocr.utils.asset_store import inline_data_url_length
 
 
 def has_latex_markdown(text: str) -> bool:
@@ -142,42 +144,143 @@ def clean_text(text: str) -> str:
     return text
 
 
-def layoutjson2md(image: Image.Image, cells: list, text_key: str = 'text', no_page_hf: bool = False) -> str:
+def encode_pictures(image: Image.Image, cells: list, image_encoding: str = 'png', asset_store=None):
+    """
+    Crops and encodes every Picture cell once, so that several markdown variants can share them.
+
+    Args:
+        image: A PIL Image object.
+        cells: A list of dictionaries, each representing a layout cell.
+        image_encoding: Encoding of the inlined picture crops, one of TRANSPORT_ENCODINGS.
+        asset_store: Optional PictureAssetStore; when given the crops are written to files
+            and referenced by path/url instead of being inlined as data urls.
+
+    Returns:
+        tuple: ({cell index: image reference}, stats dict)
+    """
+    t0 = time.perf_counter()
+    picture_refs = {}
+    stats = {'pictures': 0, 'picture_seconds': 0.0}
+    if asset_store is None:
+        stats['picture_inline_bytes'] = 0
+    else:
+        stats.update({'assets_written': 0, 'assets_reused': 0, 'asset_bytes_written': 0, 'inline_bytes_avoided': 0})
+    for i, cell in enumerate(cells):
+        if cell.get('category') != 'Picture':
+            continue
+        x1, y1, x2, y2 = [int(coord) for coord in cell['bbox']]
+        image_crop = image.crop((x1, y1, x2, y2))
+        stats['pictures'] += 1
+        if asset_store is None:
+            picture_refs[i] = encode_image_for_transport(image_crop, image_encoding)
+            stats['picture_inline_bytes'] += len(picture_refs[i])
+        else:
+            picture_refs[i], nbytes, written = asset_store.put(image_crop)
+            stats['assets_written' if written else 'assets_reused'] += 1
+            stats['asset_bytes_written'] += nbytes if written else 0
+            stats['inline_bytes_avoided'] += inline_data_url_length(nbytes, TRANSPORT_ENCODINGS[asset_store.encoding][0]) - len(picture_refs[i])
+    stats['picture_seconds'] = time.perf_counter() - t0
+    return picture_refs, stats
+
+
+MARKDOWN_VARIANTS = ('full', 'nohf', 'text')
+
+
+def layoutjson2md_variants(
+        image: Image.Image,
+        cells: list,
+        text_key: str = 'text',
+        variants=('full', 'nohf'),
+        image_encoding: str = 'png',
+        picture_refs: dict = None,
+    ) -> dict:
+    """
+    Converts a layout JSON format to several Markdown variants in one traversal.
+
+    Every cell is rendered at most once (formula detection, text cleaning, picture
+    crop and encode) and the result is shared by all variants that include it.
+
+    Variants:
+        full: all cells, the historical `layoutjson2md` output.
+        nohf: skips page headers and footers.
+        text: like nohf, without pictures; plain text suitable for indexing.
+
+    Args:
+        image: A PIL Image object.
+        cells: A list of dictionaries, each representing a layout cell.
+        text_key: The key for the text field in the cell dictionary.
+        variants: The variants to produce, a subset of MARKDOWN_VARIANTS.
+        image_encoding: Encoding of the inlined picture crops, one of TRANSPORT_ENCODINGS.
+        picture_refs: Optional {cell index: image reference} from `encode_pictures`; when
+            given, pictures are not cropped again.
+
+    Returns:
+        dict: {variant: text}
+    """
+    for variant in variants:
+        if variant not in MARKDOWN_VARIANTS:
+            raise ValueError(f"unknown markdown variant {variant}, supported variants are {MARKDOWN_VARIANTS}")
+    items = {variant: [] for variant in variants}
+    want_full = 'full' in items
+    want_nohf = 'nohf' in items
+    want_text = 'text' in items
+
+    for i, cell in enumerate(cells):
+        category = cell['category']
+        is_hf = category in ['Page-header', 'Page-footer']
+        if category == 'Picture':
+            if not (want_full or want_nohf):
+                continue
+            if picture_refs is not None and i in picture_refs:
+                image_base64 = picture_refs[i]
+            else:
+                x1, y1, x2, y2 = [int(coord) for coord in cell['bbox']]
+                image_crop = image.crop((x1, y1, x2, y2))
+                image_base64 = encode_image_for_transport(image_crop, image_encoding)
+            rendered = f"![]({image_base64})"
+        else:
+            if not (want_full or (not is_hf and (want_nohf or want_text))):
+                continue
+            text = cell.get(text_key, "")
+            if category == 'Formula':
+                rendered = get_formula_in_markdown(text)
+            else:
+                rendered = f"{clean_text(text)}"
+
+        if want_full:
+            items['full'].append(rendered)
+        if not is_hf:
+            if want_nohf:
+                items['nohf'].append(rendered)
+            if want_text and category != 'Picture':
+                items['text'].append(rendered)
+
+    return {variant: '\n\n'.join(text_items) for variant, text_items in items.items()}
+
+
+def layoutjson2md(image: Image.Image, cells: list, text_key: str = 'text', no_page_hf: bool = False, image_encoding: str = 'png', picture_refs: dict = None) -> str:
     """
     Converts a layout JSON format to Markdown.
     
     In the layout JSON, formulas are LaTeX, tables are HTML, and text is Markdown.
+    Use `layoutjson2md_variants` when more than one variant of the same page is needed.
     
     Args:
         image: A PIL Image object.
         cells: A list of dictionaries, each representing a layout cell.
         text_key: The key for the text field in the cell dictionary.
         no_page_header_footer: If True, skips page headers and footers.
+        image_encoding: Encoding of the inlined picture crops, one of TRANSPORT_ENCODINGS.
+        picture_refs: Optional {cell index: image reference} from `encode_pictures`; when
+            given, pictures are not cropped again.
         
     Returns:
         str: The text in Markdown format.
     """
-    text_items = []
-
-    for i, cell in enumerate(cells):
-        x1, y1, x2, y2 = [int(coord) for coord in cell['bbox']]
-        text = cell.get(text_key, "")
-        
-        if no_page_hf and cell['category'] in ['Page-header', 'Page-footer']:
-            continue
-        
-        if cell['category'] == 'Picture':
-            image_crop = image.crop((x1, y1, x2, y2))
-            image_base64 = PILimage_to_base64(image_crop)
-            text_items.append(f"![]({image_base64})")
-        elif cell['category'] == 'Formula':
-            text_items.append(get_formula_in_markdown(text))
-        else:            
-            text = clean_text(text)
-            text_items.append(f"{text}")
-
-    markdown_text = '\n\n'.join(text_items)
-    return markdown_text
+    variant = 'nohf' if no_page_hf else 'full'
+    return layoutjson2md_variants(
+        image, cells, text_key=text_key, variants=(variant,), image_encoding=image_encoding, picture_refs=picture_refs,
+    )[variant]
 
 
 def fix_streamlit_formulas(md: str) -> str:
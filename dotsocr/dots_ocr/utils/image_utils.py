@@ -4,9 +4,10 @@ from PIL import Image
 from typing import Tuple
 import os
 from dots_ocr.utils.consts import IMAGE_FACTOR, MIN_PIXELS, MAX_PIXELS
-from dots_ocr.utils.doc_utils import fitz_doc_to_image
+from dots_ocr.utils.doc_utils import fitz_doc_to_image, MAX_RENDER_SIZE
 from io import BytesIO
 import fitz
+import numpy as np
 import requests
 import copy
 
@@ -64,13 +65,48 @@ def smart_resize(
 
 
 
-def PILimage_to_base64(image, format='PNG'):
+def PILimage_to_base64(image, format='PNG', **save_kwargs):
     buffered = BytesIO()
-    image.save(buffered, format=format)
+    image.save(buffered, format=format, **save_kwargs)
     base64_str = base64.b64encode(buffered.getvalue()).decode('utf-8')
     return f"data:image/{format.lower()};base64,{base64_str}"
 
 
+# Transport encodings for images sent to the model: name -> (PIL format, save kwargs)
+# png:      lossless, PIL default compression (the historical behaviour)
+# png-fast: lossless, lowest zlib level, several times cheaper to encode
+# jpeg/webp: high quality lossy, smallest request bodies
+# raw:      uncompressed BMP, no compression cost at all; any PIL based server (vLLM, transformers) decodes it
+TRANSPORT_ENCODINGS = {
+    'png': ('PNG', {}),
+    'png-fast': ('PNG', {'compress_level': 1}),
+    'jpeg': ('JPEG', {'quality': 95, 'subsampling': 0}),
+    'webp': ('WEBP', {'quality': 95, 'method': 0}),
+    'raw': ('BMP', {}),
+}
+
+
+def encode_image_for_transport(image, encoding='png'):
+    """
+    Encodes a PIL image as a data url according to a transport encoding policy.
+
+    Args:
+        image: A PIL Image, or an already encoded data url which is returned as is.
+        encoding: One of TRANSPORT_ENCODINGS.
+
+    Returns:
+        str: The data url.
+    """
+    if isinstance(image, str) and image.startswith("data:image"):
+        return image
+    if encoding not in TRANSPORT_ENCODINGS:
+        raise ValueError(f"unknown image encoding {encoding}, supported encodings are {list(TRANSPORT_ENCODINGS)}")
+    format, save_kwargs = TRANSPORT_ENCODINGS[encoding]
+    if format in ('JPEG', 'BMP') and image.mode not in ('RGB', 'L'):
+        image = to_rgb(image)
+    return PILimage_to_base64(image, format=format, **save_kwargs)
+
+
 def to_rgb(pil_image: Image.Image) -> Image.Image:
     if pil_image.mode == 'RGBA':
         white_background = Image.new("RGB", pil_image.size, (255, 255, 255))
@@ -139,6 +175,34 @@ def fetch_image(
 
     return image
 
+REGION_PAD_RATIO = 0.1   # padding around a cropped region, as a fraction of its smaller side
+REGION_MIN_PAD = 8       # at least this many pixels of padding
+
+
+def crop_region(image, bbox, pad_ratio=REGION_PAD_RATIO, min_pad=REGION_MIN_PAD):
+    """
+    Crops a padded region out of an image.
+
+    The padding keeps the strokes touching the bbox edges and gives the model some
+    background around the text; the crop is clamped to the image.
+
+    Args:
+        image: The PIL image the bbox refers to.
+        bbox: [x1, y1, x2, y2] in the coordinates of `image`.
+
+    Returns:
+        tuple: (crop, crop_box) with crop_box the [x1, y1, x2, y2] of the crop in `image`.
+    """
+    x1, y1, x2, y2 = [float(v) for v in bbox]
+    pad = max(min_pad, pad_ratio * min(x2 - x1, y2 - y1))
+    left = max(0, math.floor(x1 - pad))
+    top = max(0, math.floor(y1 - pad))
+    right = min(image.width, max(left + 1, math.ceil(x2 + pad)))
+    bottom = min(image.height, max(top + 1, math.ceil(y2 + pad)))
+    crop_box = [left, top, right, bottom]
+    return image.crop(crop_box), crop_box
+
+
 def get_input_dimensions(
     image: Image.Image,
     min_pixels: int,
@@ -167,21 +231,96 @@ def get_input_dimensions(
     return input_width, input_height
 
 
+def _load_image_bytes(image):
+    _, file_ext = os.path.splitext(image)
+    assert file_ext in {'.jpg', '.jpeg', '.png'}
+
+    if image.startswith("http://") or image.startswith("https://"):
+        with requests.get(image, stream=True) as response:
+            response.raise_for_status()
+            return response.content
+    with open(image, 'rb') as f:
+        return f.read()
+
+
+# MuPDF resolution handling when an image is wrapped into a pdf page
+FITZ_DEFAULT_DPI = 96
+FITZ_SANE_DPI = 72
+FITZ_INSANE_DPI = 4800
+
+
+def _fitz_image_resolution(dpi, image_format):
+    """Returns the (xres, yres) MuPDF assigns to an image with the given dpi metadata."""
+    if not dpi or not dpi[0]:
+        return FITZ_DEFAULT_DPI, FITZ_DEFAULT_DPI
+
+    def _sanitize(res):
+        res = int(round(float(res)))
+        return res if FITZ_SANE_DPI <= res <= FITZ_INSANE_DPI else FITZ_SANE_DPI
+
+    xres = _sanitize(dpi[0])
+    if image_format == 'PNG':  # MuPDF only honours the x resolution of pngs
+        return xres, xres
+    return xres, _sanitize(dpi[1] or dpi[0])
+
+
+def _fitz_pixmap_length(pixels, res, zoom):
+    # page size in points and pixmap size follow MuPDF's float32 math and fz_round_rect
+    points = np.float32(pixels * 72 / res)
+    return int(math.ceil(float(np.float32(points * np.float32(zoom))) - 0.001))
+
+
+def get_fitz_target_size(width, height, xres, yres, target_dpi=200):
+    """Returns the (width, height) the png -> pdf -> pixmap round-trip renders an image to."""
+    zoom = target_dpi / 72
+    target_width = _fitz_pixmap_length(width, xres, zoom)
+    target_height = _fitz_pixmap_length(height, yres, zoom)
+    if target_width > MAX_RENDER_SIZE or target_height > MAX_RENDER_SIZE:
+        target_width = _fitz_pixmap_length(width, xres, 1.0)
+        target_height = _fitz_pixmap_length(height, yres, 1.0)
+    return target_width, target_height
+
+
 def get_image_by_fitz_doc(image, target_dpi=200):
-    # get image through fitz, to get target dpi image, mainly for higher image
+    """
+    Resamples an image to the target dpi.
+
+    Produces the same output size as rendering the image through a one page pdf with
+    fitz (see `get_image_by_fitz_roundtrip`), but resizes once with a Lanczos filter
+    instead of encoding to png, wrapping it into a pdf and rasterizing it again.
+    The source dpi comes from the file metadata of paths and urls; PIL images are
+    handed to fitz without metadata, which MuPDF treats as 96 dpi.
+
+    Args:
+        image: A PIL Image, or a local path / url of a jpg or png file.
+        target_dpi: The target dpi.
+
+    Returns:
+        PIL.Image: The resampled RGB image.
+    """
     if not isinstance(image, Image.Image):
         assert isinstance(image, str)
-        _, file_ext = os.path.splitext(image)
-        assert file_ext in {'.jpg', '.jpeg', '.png'}
+        image = Image.open(BytesIO(_load_image_bytes(image)))
+        xres, yres = _fitz_image_resolution(image.info.get('dpi', None), image.format)
+    else:
+        xres, yres = FITZ_DEFAULT_DPI, FITZ_DEFAULT_DPI
+
+    target_size = get_fitz_target_size(image.width, image.height, xres, yres, target_dpi=target_dpi)
+    if image.format == 'JPEG':
+        # let the jpeg decoder downscale by a power of two while staying above the target size
+        image.draft('RGB', target_size)
+    image = to_rgb(image)
+    if image.size == target_size:
+        return image
+    return image.resize(target_size, resample=Image.LANCZOS)
 
-        if image.startswith("http://") or image.startswith("https://"):
-            with requests.get(image, stream=True) as response:
-                response.raise_for_status()
-                data_bytes = response.content
-        else:
-            with open(image, 'rb') as f:
-                data_bytes = f.read()
 
+def get_image_by_fitz_roundtrip(image, target_dpi=200):
+    # get image through fitz, to get target dpi image, mainly for higher image
+    # reference implementation of get_image_by_fitz_doc: png -> pdf -> pixmap
+    if not isinstance(image, Image.Image):
+        assert isinstance(image, str)
+        data_bytes = _load_image_bytes(image)
         image = Image.open(BytesIO(data_bytes))
     else:
         data_bytes = BytesIO()
@@ -1,5 +1,6 @@
-from PIL import Image
+from PIL import Image, ImageDraw, ImageFont
 from typing import Dict, List
+import numpy as np
 
 import fitz
 from io import BytesIO
@@ -112,6 +113,78 @@ def draw_layout_on_image(image, cells, resized_height=None, resized_width=None,
     return Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
 
 
+def _load_label_font(size):
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:  # Pillow < 10.1 has no sized default font
+        return ImageFont.load_default()
+
+
+def draw_layout_on_image_pil(image, cells, resized_height=None, resized_width=None, fill_bbox=True, draw_bbox=True):
+    """
+    Same drawing as `draw_layout_on_image`, rendered with NumPy/PIL directly on the pixels
+    instead of building and rasterizing a one page fitz document.
+
+    Args:
+        image: The source PIL Image.
+        cells: A list of cells containing bounding box information.
+        resized_height: The resized height.
+        resized_width: The resized width.
+        fill_bbox: Whether to fill the bounding box.
+        draw_bbox: Whether to draw the bounding box.
+
+    Returns:
+        PIL.Image: The image with drawings.
+    """
+    original_width, original_height = image.size
+    pixels = np.array(image.convert("RGB"), dtype=np.float32)
+    boxes = []
+    for i, cell in enumerate(cells):
+        bbox = cell['bbox']
+        layout_type = cell['category']
+        x0, y0, x1, y1 = bbox[0], bbox[1], bbox[2], bbox[3]
+        if resized_height and resized_width:
+            scale_x = resized_width / original_width
+            scale_y = resized_height / original_height
+            x0, y0 = int(bbox[0] / scale_x), int(bbox[1] / scale_y)
+            x1, y1 = int(bbox[2] / scale_x), int(bbox[3] / scale_y)
+        color = dict_layout_type_to_color.get(layout_type, (0, 128, 0, 256))[:3]
+        boxes.append((i, layout_type, color, (int(x0), int(y0), int(x1), int(y1))))
+
+        if draw_bbox and fill_bbox:
+            # 30% opacity fill, blended only over the box region
+            region = pixels[max(int(y0), 0):max(int(y1), 0), max(int(x0), 0):max(int(x1), 0)]
+            region *= 0.7
+            region += np.array(color, dtype=np.float32) * 0.3
+
+    image_with_layout = Image.fromarray(pixels.round().astype(np.uint8))
+    draw = ImageDraw.Draw(image_with_layout)
+    font = _load_label_font(20)
+    for order, layout_type, color, (x0, y0, x1, y1) in boxes:
+        if draw_bbox and not fill_bbox:
+            draw.rectangle((x0, y0, x1, y1), outline=color, width=1)
+        # label at the right of the top right corner, like fitz insert_text at (x1, y0 + 20)
+        draw.text((x1, y0 + 20), f"{order}_{layout_type}", fill=color, font=font, anchor="ls")
+    return image_with_layout
+
+
+def render_layout_image(origin_image, layout_info_path, save_path, renderer="fitz"):
+    """
+    Renders the layout overlay of a page on demand from its saved layout json.
+
+    Pages whose model output could not be parsed saved the raw response instead of
+    cells, for those the plain page image is written.
+    """
+    with open(layout_info_path, 'r', encoding="utf-8") as f:
+        cells = json.load(f)
+    image_with_layout = origin_image
+    if isinstance(cells, list) and cells and all(isinstance(c, dict) and 'bbox' in c for c in cells):
+        draw = draw_layout_on_image_pil if renderer == "pil" else draw_layout_on_image
+        image_with_layout = draw(origin_image, cells)
+    image_with_layout.save(save_path)
+    return save_path
+
+
 def pre_process_bboxes(
     origin_image,
     bboxes,
@@ -121,7 +194,8 @@ def pre_process_bboxes(
     min_pixels: int = 3136, 
     max_pixels: int = 11289600
 ):
-    assert isinstance(bboxes, list) and len(bboxes) > 0 and isinstance(bboxes[0], list)
+    """Maps bboxes from origin_image coordinates to the model input coordinates, all regions at once."""
+    assert isinstance(bboxes, (list, np.ndarray)) and len(bboxes) > 0 and len(bboxes[0]) == 4
     min_pixels = min_pixels or MIN_PIXELS
     max_pixels = max_pixels or MAX_PIXELS
     original_width, original_height = origin_image.size
@@ -131,17 +205,9 @@ def pre_process_bboxes(
     scale_x = original_width / input_width
     scale_y = original_height / input_height
 
-    bboxes_out = []
-    for bbox in bboxes:
-        bbox_resized = [
-            int(float(bbox[0]) / scale_x), 
-            int(float(bbox[1]) / scale_y),
-            int(float(bbox[2]) / scale_x), 
-            int(float(bbox[3]) / scale_y)
-        ]
-        bboxes_out.append(bbox_resized)
-    
-    return bboxes_out
+    # truncation towards zero, like int() per coordinate
+    scales = np.array([scale_x, scale_y, scale_x, scale_y])
+    return (np.asarray(bboxes, dtype=np.float64) / scales).astype(np.int64).tolist()
 
 def post_process_cells(
     origin_image: Image.Image, 
@@ -192,6 +258,16 @@ def post_process_cells(
     
     return cells_out
 
+def offset_cells(cells, dx, dy):
+    """Shifts the cell bboxes by (dx, dy), e.g. from the coordinates of a crop into those of its page."""
+    cells_out = []
+    for cell in cells:
+        x1, y1, x2, y2 = cell['bbox']
+        cell_copy = cell.copy()
+        cell_copy['bbox'] = [x1 + dx, y1 + dy, x2 + dx, y2 + dy]
+        cells_out.append(cell_copy)
+    return cells_out
+
 def is_legal_bbox(cells):
     for cell in cells:
         bbox = cell['bbox']
@@ -221,7 +297,7 @@ def post_process_output(response, prompt_mode, origin_image, input_image, min_pi
         json_load_failed = True
 
     if json_load_failed:
-        cleaner = OutputCleaner()
+        cleaner = OutputCleaner(verbose=False)
         response_clean = cleaner.clean_model_output(cells)
         if isinstance(response_clean, list):
             response_clean = "\n\n".join([cell['text'] for cell in response_clean if 'text' in cell])
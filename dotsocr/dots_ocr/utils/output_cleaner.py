@@ -1,9 +1,9 @@
 #!/usr/bin/env python3
 """
-Data Cleaning Script - Cleans all data using a simplified regex method and saves the results
+Data Cleaning Script - Cleans all data with a single-pass tolerant scanner and saves the results
 
 Features:
-1. Cleans all cases using a simplified regex method.
+1. Cleans all cases with a single-pass tolerant scanner (the former regex method is kept for comparison).
 2. Saves the cleaned data for each case.
 3. Ensures the relative order of dicts remains unchanged.
 4. Generates a before-and-after cleaning report.
@@ -18,6 +18,25 @@ from collections import Counter
 import traceback
 
 
+# Repetition criteria shared by the cleaner and the streaming detector:
+# a category-text pair is a loop artifact once it occurs this many times,
+# a bbox as soon as it occurs a second time.
+CATEGORY_TEXT_MIN_REPEATS = 5
+BBOX_MIN_REPEATS = 2
+# consecutive repeated cells after which a streamed generation is considered looping
+STREAM_MAX_REPEATED_RUN = 8
+
+_JSON_SPECIALS = re.compile(r'[{}"\\]')
+_DECODER = json.JSONDecoder(strict=False)  # raw control characters in texts are tolerated
+_CELL_START = '{"bbox"'   # how a cell object starts in a layout response
+# a cell the decoder rejects, typically for unescaped quotes in its text
+_BROKEN_CELL = re.compile(
+    r'\{\s*"bbox"\s*:\s*(\[[^\]]*\])\s*,\s*"category"\s*:\s*"([^"]*)"\s*(?:,\s*"text"\s*:\s*"(.*)"\s*)?\}\s*\Z',
+    re.DOTALL,
+)
+_UNESCAPED_QUOTE = re.compile(r'(?<!\\)"')
+
+
 @dataclass
 class CleanedData:
     """Data structure for cleaned data"""
@@ -30,21 +49,31 @@ class CleanedData:
 
 
 class OutputCleaner:
-    """Data Cleaner - Based on a simplified regex method"""
+    """
+    Data Cleaner - Recovers the cells of broken layout responses
+
+    Args:
+        verbose: Print the cleaning steps; the parser cleans quietly.
+    """
     
-    def __init__(self):
-        # Simplified regular expression patterns
+    def __init__(self, verbose=True):
+        self.verbose = verbose
+        # Simplified regular expression patterns of the regex cleaner (clean_string_data_regex)
         self.dict_pattern = re.compile(r'\{[^{}]*?"bbox"\s*:\s*\[[^\]]*?\][^{}]*?\}', re.DOTALL)
         self.bbox_pattern = re.compile(r'"bbox"\s*:\s*\[([^\]]+)\]')
         self.missing_delimiter_pattern = re.compile(r'\}\s*\{(?!")')
         
         self.cleaned_results: List[CleanedData] = []
+
+    def _log(self, message):
+        if self.verbose:
+            print(message)
     
     def clean_list_data(self, data: List[Dict], case_id: int) -> CleanedData:
         """Cleans list-type data"""
         
-        print(f"🔧 Cleaning List data - Case {case_id}")
-        print(f"  Original items: {len(data)}")
+        self._log(f"🔧 Cleaning List data - Case {case_id}")
+        self._log(f"  Original items: {len(data)}")
         
         cleaned_data = []
         operations = {
@@ -65,7 +94,7 @@ class OutputCleaner:
                 
                 # Check bbox length - core logic
                 if isinstance(bbox, list) and len(bbox) == 3:
-                    print(f"  ⚠️ Item {i}: bbox has only 3 coordinates. Removing bbox, keeping category and text.")
+                    self._log(f"  ⚠️ Item {i}: bbox has only 3 coordinates. Removing bbox, keeping category and text.")
                     # Keep only category and text, ensuring order is preserved
                     new_item = {}
                     if 'category' in item:
@@ -83,7 +112,7 @@ class OutputCleaner:
                     cleaned_data.append(item.copy())
                     continue
                 else:
-                    print(f"  ❌ Item {i}: Abnormal bbox format, skipping.")
+                    self._log(f"  ❌ Item {i}: Abnormal bbox format, skipping.")
                     operations['removed_items'] += 1
                     continue
             else:
@@ -95,7 +124,7 @@ class OutputCleaner:
                     operations['removed_items'] += 1
         
         operations['final_count'] = len(cleaned_data)
-        print(f"  ✅ Cleaning complete: {len(cleaned_data)} items, {operations['bbox_fixes']} bbox fixes, {operations['removed_items']} items removed")
+        self._log(f"  ✅ Cleaning complete: {len(cleaned_data)} items, {operations['bbox_fixes']} bbox fixes, {operations['removed_items']} items removed")
         
         return CleanedData(
             case_id=case_id,
@@ -107,10 +136,150 @@ class OutputCleaner:
         )
     
     def clean_string_data(self, data_str: str, case_id: int) -> CleanedData:
-        """Cleans string-type data"""
+        """
+        Cleans string-type data in a single pass.
+
+        A valid json list is returned as is. Otherwise the complete cell objects are cut
+        out of the response by `_scan_dicts`, which handles missing delimiters, exact
+        duplicates and a truncated tail on the way; when not one object is complete, the
+        truncated one is salvaged by `_handle_single_incomplete_dict`.
+        """
+        
+        self._log(f"🔧 Cleaning String data - Case {case_id}")
+        self._log(f"  Original length: {len(data_str):,}")
+        
+        operations = {
+            'type': 'str',
+            'original_length': len(data_str),
+            'delimiter_fixes': 0,
+            'tail_truncated': False,
+            'truncated_length': len(data_str),
+            'duplicate_dicts_removed': 0,
+            'invalid_dicts': 0,
+            'repaired_dicts': 0,
+            'final_objects': 0
+        }
+        
+        final_data = None
+        # a response cut by the token cap cannot be a json list, skip the full parse that would fail at its end
+        if data_str.rstrip().endswith(']'):
+            try:
+                final_data = json.loads(data_str)
+            except ValueError:
+                pass
+        if isinstance(final_data, list):
+            success = True
+        else:
+            final_data, partial = self._scan_dicts(data_str, operations)
+            if partial is not None:
+                operations['tail_truncated'] = True
+                if not final_data:
+                    final_data = self._handle_single_incomplete_dict('[' + partial) or []
+            success = bool(final_data)
+        
+        operations['final_objects'] = len(final_data)
+        if success:
+            self._log(f"  ✅ Cleaning complete: {len(final_data)} objects")
+        else:
+            self._log(f"  ❌ Cleaning failed: no object recovered")
+        return CleanedData(
+            case_id=case_id,
+            original_type='str',
+            original_length=operations['original_length'],
+            cleaned_data=final_data,
+            cleaning_operations=operations,
+            success=success
+        )
+
+    def _scan_dicts(self, text: str, operations: Dict[str, Any]) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Cuts the dict objects out of a response in one forward pass.
+
+        Each '{' is tried as the start of an object with the C decoder, which also returns
+        where the object ends; the scan resumes there, so whatever lies between objects
+        (missing or extra delimiters, brackets) does not matter. The text from a start that
+        fails to the next object that decodes (or the next '{"bbox"') is one broken cell,
+        left to `_repair_dict`; at the end of the response it is the truncated tail. Exact
+        repeats of an object are counted and dropped as they are met.
+
+        Returns:
+            tuple: (dicts in order, the unfinished object at the end or None)
+        """
+        dicts = []
+        seen = set()
+        find, decode = text.find, _DECODER.raw_decode
+        broken_start, prev_end, prev_str = None, None, None
+        pos = find('{')
+        while pos != -1:
+            if prev_str is not None and broken_start is None and text.startswith(prev_str, pos):
+                # a looping model repeats the same cell over and over, skipped without decoding
+                operations['duplicate_dicts_removed'] += 1
+                prev_end = pos + len(prev_str)
+                pos = find('{', prev_end)
+                continue
+            try:
+                dict_obj, end = decode(text, pos)
+            except ValueError:
+                if broken_start is None:
+                    broken_start = pos
+                elif text.startswith(_CELL_START, pos):
+                    # the next cell is broken too
+                    repaired = self._repair_dict(text[broken_start:pos], operations)
+                    if repaired is not None:
+                        dicts.append(repaired)
+                    broken_start = pos
+                pos = find('{', pos + 1)
+                continue
+            if broken_start is not None:
+                repaired = self._repair_dict(text[broken_start:pos], operations)
+                if repaired is not None:
+                    dicts.append(repaired)
+                broken_start = None
+            elif prev_end is not None and find(',', prev_end, pos) == -1:
+                operations['delimiter_fixes'] += 1
+            prev_end = end
+            dict_str = prev_str = text[pos:end]
+            if dict_str in seen:
+                operations['duplicate_dicts_removed'] += 1
+            elif isinstance(dict_obj, dict):
+                seen.add(dict_str)
+                dicts.append(dict_obj)
+            pos = find('{', end)
+        if broken_start is not None:
+            repaired = self._repair_dict(text[broken_start:], operations, tail=True)
+            if repaired is None:
+                operations['truncated_length'] = prev_end or 0
+                return dicts, text[broken_start:]
+            dicts.append(repaired)
+        return dicts, None
+
+    def _repair_dict(self, dict_str: str, operations: Dict[str, Any], tail=False) -> Optional[Dict]:
+        """
+        Rebuilds a cell the decoder rejects for unescaped quotes in its text, e.g. '"text": "said "hi""'.
+        A tail that cannot be rebuilt is the truncated last cell rather than an invalid one.
+        """
+        match = _BROKEN_CELL.match(dict_str.rstrip(' \t\r\n,]'))
+        if match is not None:
+            try:
+                dict_obj = {'bbox': json.loads(match.group(1)), 'category': match.group(2)}
+                if match.group(3) is not None:
+                    dict_obj['text'] = _DECODER.decode('"' + _UNESCAPED_QUOTE.sub(r'\\"', match.group(3)) + '"')
+                operations['repaired_dicts'] += 1
+                return dict_obj
+            except ValueError:
+                pass
+        if not tail:
+            operations['invalid_dicts'] += 1
+        return None
+    
+    def clean_string_data_regex(self, data_str: str, case_id: int) -> CleanedData:
+        """
+        Cleans string-type data with the former regex passes, kept as the reference of
+        tools/benchmark_output_cleaner.py.
+        """
         
-        print(f"🔧 Cleaning String data - Case {case_id}")
-        print(f"  Original length: {len(data_str):,}")
+        self._log(f"🔧 Cleaning String data - Case {case_id}")
+        self._log(f"  Original length: {len(data_str):,}")
         
         operations = {
             'type': 'str',
@@ -144,7 +313,7 @@ class OutputCleaner:
             
             if final_data is not None:
                 operations['final_objects'] = len(final_data)
-                print(f"  ✅ Cleaning complete: {len(final_data)} objects")
+                self._log(f"  ✅ Cleaning complete: {len(final_data)} objects")
                 
                 return CleanedData(
                     case_id=case_id,
@@ -158,7 +327,7 @@ class OutputCleaner:
                 raise Exception("Could not parse the cleaned data")
                 
         except Exception as e:
-            print(f"  ❌ Cleaning failed: {e}")
+            self._log(f"  ❌ Cleaning failed: {e}")
             return CleanedData(
                 case_id=case_id,
                 original_type='str',
@@ -181,7 +350,7 @@ class OutputCleaner:
         text = self.missing_delimiter_pattern.sub(replace_delimiter, text)
         
         if fixes > 0:
-            print(f"    ✅ Fixed {fixes} missing delimiters")
+            self._log(f"    ✅ Fixed {fixes} missing delimiters")
         
         return text, fixes
     
@@ -200,7 +369,7 @@ class OutputCleaner:
             
             # If there is only one dict object, do not truncate to avoid deleting the only object
             if bbox_count <= 1:
-                print(f"    ⚠️ Only {bbox_count} dict objects found, skipping truncation to avoid deleting all content")
+                self._log(f"    ⚠️ Only {bbox_count} dict objects found, skipping truncation to avoid deleting all content")
                 return text, False
             
             # Find the position of the last '{"bbox":'
@@ -214,7 +383,7 @@ class OutputCleaner:
                 if truncated_text.endswith(','):
                     truncated_text = truncated_text[:-1]
                 
-                print(f"    ✂️ Truncated the last incomplete element, length reduced from {len(text):,} to {len(truncated_text):,}")
+                self._log(f"    ✂️ Truncated the last incomplete element, length reduced from {len(text):,} to {len(truncated_text):,}")
                 return truncated_text, True
         
         return text, False
@@ -228,7 +397,7 @@ class OutputCleaner:
         if not dict_matches:
             return text, 0
         
-        print(f"    📊 Found {len(dict_matches)} dict objects")
+        self._log(f"    📊 Found {len(dict_matches)} dict objects")
         
         # Deduplication while preserving order: only keep the first occurrence of a dict
         unique_dicts = []
@@ -247,10 +416,10 @@ class OutputCleaner:
         if total_duplicates > 0:
             # Reconstruct the JSON array, preserving the original order
             new_text = '[' + ', '.join(unique_dicts) + ']'
-            print(f"    ✅ Removed {total_duplicates} duplicate dicts, keeping {len(unique_dicts)} unique dicts (order preserved)")
+            self._log(f"    ✅ Removed {total_duplicates} duplicate dicts, keeping {len(unique_dicts)} unique dicts (order preserved)")
             return new_text, total_duplicates
         else:
-            print(f"    ✅ No duplicate dict objects found")
+            self._log(f"    ✅ No duplicate dict objects found")
             return text, 0
     
     def _ensure_json_format(self, text: str) -> str:
@@ -276,7 +445,7 @@ class OutputCleaner:
             if isinstance(data, list):
                 return data
         except json.JSONDecodeError as e:
-            print(f"    ❌ JSON parsing failed: {e}")
+            self._log(f"    ❌ JSON parsing failed: {e}")
             
             # fallback1: Extract valid dict objects
             valid_dicts = []
@@ -290,7 +459,7 @@ class OutputCleaner:
                     continue
             
             if valid_dicts:
-                print(f"    ✅ Extracted {len(valid_dicts)} valid dicts")
+                self._log(f"    ✅ Extracted {len(valid_dicts)} valid dicts")
                 return valid_dicts
             
             # fallback2: Special handling for a single incomplete dict
@@ -337,21 +506,21 @@ class OutputCleaner:
             if text_content:
                 fixed_dict["text"] = text_content
             
-            print(f"    🔧 Special fix: single incomplete dict → {fixed_dict}")
+            self._log(f"    🔧 Special fix: single incomplete dict → {fixed_dict}")
             return [fixed_dict]
             
         except Exception as e:
-            print(f"    ❌ Special fix failed: {e}")
+            self._log(f"    ❌ Special fix failed: {e}")
             return None
     
     def remove_duplicate_category_text_pairs_and_bbox(self, data_list: List[dict], case_id: int) -> List[dict]:
         """Removes duplicate category-text pairs and duplicate bboxes"""
         
         if not data_list or len(data_list) <= 1:
-            print(f"    📊 Data length {len(data_list)} <= 1, skipping deduplication check")
+            self._log(f"    📊 Data length {len(data_list)} <= 1, skipping deduplication check")
             return data_list
         
-        print(f"    📊 Original data length: {len(data_list)}")
+        self._log(f"    📊 Original data length: {len(data_list)}")
         
         # 1. Count occurrences and positions of each category-text pair
         category_text_pairs = {}
@@ -378,27 +547,29 @@ class OutputCleaner:
         
         # 3a. Process category-text pairs that appear 5 or more times
         for pair_key, positions in category_text_pairs.items():
-            if len(positions) >= 5:
+            if len(positions) >= CATEGORY_TEXT_MIN_REPEATS:
                 category, text = pair_key
                 # Keep the first occurrence, remove subsequent duplicates
                 positions_to_remove = positions[1:]
                 duplicates_to_remove.update(positions_to_remove)
                 
-                print(f"    🔍 Found duplicate category-text pair: category='{category}', first 50 chars of text='{text[:50]}...'")
-                print(f"        Count: {len(positions)}, removing at positions: {positions_to_remove}")
+                if self.verbose:  # the position lists of a looping response are long
+                    self._log(f"    🔍 Found duplicate category-text pair: category='{category}', first 50 chars of text='{text[:50]}...'")
+                    self._log(f"        Count: {len(positions)}, removing at positions: {positions_to_remove}")
         
         # 3b. Process bboxes that appear 2 or more times
         for bbox_key, positions in bbox_pairs.items():
-            if len(positions) >= 2:
+            if len(positions) >= BBOX_MIN_REPEATS:
                 # Keep the first occurrence, remove subsequent duplicates
                 positions_to_remove = positions[1:]
                 duplicates_to_remove.update(positions_to_remove)
                 
-                print(f"    🔍 Found duplicate bbox: {list(bbox_key)}")
-                print(f"        Count: {len(positions)}, removing at positions: {positions_to_remove}")
+                if self.verbose:
+                    self._log(f"    🔍 Found duplicate bbox: {list(bbox_key)}")
+                    self._log(f"        Count: {len(positions)}, removing at positions: {positions_to_remove}")
         
         if not duplicates_to_remove:
-            print(f"    ✅ No category-text pairs or bboxes found exceeding the duplication threshold")
+            self._log(f"    ✅ No category-text pairs or bboxes found exceeding the duplication threshold")
             return data_list
         
         # 4. Remove duplicate items from the original data (preserving order)
@@ -410,8 +581,8 @@ class OutputCleaner:
             else:
                 removed_count += 1
         
-        print(f"    ✅ Deduplication complete: Removed {removed_count} duplicate items")
-        print(f"    📊 Cleaned data length: {len(cleaned_data)}")
+        self._log(f"    ✅ Deduplication complete: Removed {removed_count} duplicate items")
+        self._log(f"    📊 Cleaned data length: {len(cleaned_data)}")
         
         return cleaned_data
 
@@ -576,6 +747,10 @@ class OutputCleaner:
                     details.append(f"Tail truncation: -{reduction:,} chars")
                 if ops['duplicate_dicts_removed'] > 0:
                     details.append(f"Duplicates removed: {ops['duplicate_dicts_removed']}")
+                if ops['repaired_dicts'] > 0:
+                    details.append(f"Repaired: {ops['repaired_dicts']}")
+                if ops['invalid_dicts'] > 0:
+                    details.append(f"Invalid dicts dropped: {ops['invalid_dicts']}")
                 if details:
                     report.append(f"    - {', '.join(details)}")
             report.append("")
@@ -597,6 +772,106 @@ class OutputCleaner:
         print(f"\n{chr(10).join(report)}")
 
 
+class StreamingRepetitionDetector:
+    """
+    Incremental scanner of a layout response streamed token by token.
+
+    Complete cells are cut out of the stream with a small brace/string state machine
+    (each character is scanned once) and checked with the criteria of
+    `OutputCleaner.remove_duplicate_category_text_pairs_and_bbox`: a cell is repeated
+    when its bbox was already emitted, or when its category-text pair reaches
+    `CATEGORY_TEXT_MIN_REPEATS` occurrences. The cleaner would drop all of them, so once
+    `max_repeated_run` consecutive cells are repeated the model is looping and the rest
+    of the generation can be cancelled.
+
+    Args:
+        max_repeated_run: Consecutive repeated cells that stop the generation.
+    """
+
+    def __init__(self, max_repeated_run=STREAM_MAX_REPEATED_RUN):
+        self.max_repeated_run = max_repeated_run
+        self.cells = 0
+        self.repeated_cells = 0
+        self.repeated_run = 0
+        self.reason = None
+        self._bbox_counts = Counter()
+        self._pair_counts = Counter()
+        self._depth = 0
+        self._in_string = False
+        self._skip_next = False
+        self._cell_parts = []
+
+    def feed(self, delta: str) -> bool:
+        """Consumes the next piece of the response, returns True once the generation should stop."""
+        if self.reason is not None or not delta:
+            return self.reason is not None
+        i, n = 0, len(delta)
+        part_start = 0 if self._depth else None
+        if self._skip_next:  # escaped character split from its backslash
+            i, self._skip_next = 1, False
+        while i < n:
+            m = _JSON_SPECIALS.search(delta, i)
+            if m is None:
+                break
+            j = m.start()
+            ch = delta[j]
+            i = j + 1
+            if self._in_string:
+                if ch == '\\':
+                    if i < n:
+                        i += 1
+                    else:
+                        self._skip_next = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = self._depth > 0
+            elif ch == '{':
+                if self._depth == 0:
+                    part_start = j
+                self._depth += 1
+            elif ch == '}' and self._depth:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._add_cell("".join(self._cell_parts) + delta[part_start:i])
+                    self._cell_parts = []
+                    part_start = None
+                    if self.reason is not None:
+                        return True
+        if self._depth:
+            self._cell_parts.append(delta[part_start:])
+        return False
+
+    def _add_cell(self, cell_str):
+        try:
+            cell = json.loads(cell_str)
+        except ValueError:
+            return  # malformed cell, left to the cleaner
+        if not isinstance(cell, dict):
+            return
+        self.cells += 1
+        repeated = False
+        try:
+            bbox = cell.get('bbox')
+            if isinstance(bbox, list) and len(bbox) > 0:
+                key = tuple(bbox)
+                self._bbox_counts[key] += 1
+                repeated = self._bbox_counts[key] >= BBOX_MIN_REPEATS
+            if 'category' in cell and 'text' in cell:
+                key = (cell.get('category', ''), cell.get('text', ''))
+                self._pair_counts[key] += 1
+                repeated = repeated or self._pair_counts[key] >= CATEGORY_TEXT_MIN_REPEATS
+        except TypeError:  # unhashable values, not a regular cell
+            return
+        if repeated:
+            self.repeated_cells += 1
+            self.repeated_run += 1
+        else:
+            self.repeated_run = 0
+        if self.repeated_run >= self.max_repeated_run:
+            self.reason = f"{self.repeated_run} consecutive repeated cells after {self.cells} cells"
+
+
 def main():
     """Main function"""
     
@@ -0,0 +1,127 @@
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+from PIL import Image
+
+
+ANALYSIS_SIZE = 256           # pages are analyzed on a thumbnail of at most this size
+INK_LEVEL = 160               # gray level below which a pixel counts as ink
+BLANK_INK_COVERAGE = 0.001    # pages with less ink than this fraction are blank
+HASH_SIZE = 16                # dhash of HASH_SIZE * HASH_SIZE bits
+DUPLICATE_MAX_DISTANCE = 4    # max hamming distance between the hashes of duplicate pages
+DUPLICATE_PIXEL_DELTA = 48    # hash candidates are confirmed on the thumbnails: pixels differing by more
+DUPLICATE_MAX_CHANGED = 0.0003  # than this gray delta must stay below this fraction (a changed word exceeds it)
+
+
+def page_thumbnail(image: Image.Image, size=ANALYSIS_SIZE) -> np.ndarray:
+    """Returns a downsampled grayscale array of the page."""
+    thumbnail = image.convert('L')
+    thumbnail.thumbnail((size, size), Image.Resampling.BOX)
+    return np.asarray(thumbnail)
+
+
+def ink_coverage(gray: np.ndarray, ink_level=INK_LEVEL) -> float:
+    """Fraction of dark pixels; isolated specks (scanner noise) are ignored."""
+    ink = gray < ink_level
+    # a pixel only counts if one of its 4-neighbours is ink as well
+    neighbours = np.zeros_like(ink)
+    neighbours[1:, :] |= ink[:-1, :]
+    neighbours[:-1, :] |= ink[1:, :]
+    neighbours[:, 1:] |= ink[:, :-1]
+    neighbours[:, :-1] |= ink[:, 1:]
+    return float((ink & neighbours).mean())
+
+
+def thumbnails_match(a: np.ndarray, b: np.ndarray, pixel_delta=DUPLICATE_PIXEL_DELTA, max_changed=DUPLICATE_MAX_CHANGED) -> bool:
+    if a.shape != b.shape:
+        return False
+    changed = np.abs(a.astype(np.int16) - b.astype(np.int16)) > pixel_delta
+    return float(changed.mean()) <= max_changed
+
+
+def dhash(gray: np.ndarray, hash_size=HASH_SIZE) -> int:
+    """Difference hash: compares horizontally adjacent pixels of a (hash_size+1) x hash_size thumbnail."""
+    small = np.asarray(Image.fromarray(gray).resize((hash_size + 1, hash_size), Image.Resampling.BOX), dtype=np.int16)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+class PageGroups:
+    """
+    Pre-inference analysis of the pages of one document: flags blank pages and groups
+    visually identical pages, so that inference runs once per group.
+
+    The first page of a group is its leader. `analyze` is called by the page workers in
+    any order; leaders publish their result with `set_response` (or `set_error`), the
+    parser publishes (response, recovered cells), and duplicates wait for it with
+    `response_future(leader)` and fan it out.
+
+    Args:
+        skip_blank: Flag blank pages.
+        dedup: Group duplicate pages.
+        blank_coverage: Ink coverage below which a page is blank.
+        max_distance: Max hamming distance between the dhash of duplicate pages.
+    """
+
+    def __init__(self, skip_blank=True, dedup=True, blank_coverage=BLANK_INK_COVERAGE, max_distance=DUPLICATE_MAX_DISTANCE):
+        self.skip_blank = skip_blank
+        self.dedup = dedup
+        self.blank_coverage = blank_coverage
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        self._leaders = []     # (size, hash, thumbnail, page_idx)
+        self._futures = {}     # leader page_idx -> Future of the published result
+        self.stats = {'pages': 0, 'blank': 0, 'duplicates': 0, 'groups': 0}
+
+    def analyze(self, page_idx, image):
+        """
+        Returns:
+            dict: {'ink_coverage': float, 'blank': bool, 'duplicate_of': leader page index or None}
+        """
+        gray = page_thumbnail(image)
+        coverage = ink_coverage(gray)
+        info = {'ink_coverage': round(coverage, 6), 'blank': False, 'duplicate_of': None}
+        with self._lock:
+            self.stats['pages'] += 1
+        if self.skip_blank and coverage < self.blank_coverage:
+            info['blank'] = True
+            with self._lock:
+                self.stats['blank'] += 1
+            return info
+        if not self.dedup:
+            return info
+
+        page_hash = dhash(gray)
+        with self._lock:
+            for size, leader_hash, leader_gray, leader_idx in self._leaders:
+                if (size == image.size and bin(page_hash ^ leader_hash).count('1') <= self.max_distance
+                        and thumbnails_match(gray, leader_gray)):
+                    info['duplicate_of'] = leader_idx
+                    self.stats['duplicates'] += 1
+                    return info
+            self._leaders.append((image.size, page_hash, gray, page_idx))
+            self._futures[page_idx] = Future()
+            self.stats['groups'] += 1
+        return info
+
+    def response_future(self, leader_idx) -> Future:
+        with self._lock:
+            return self._futures[leader_idx]
+
+    def set_response(self, leader_idx, response):
+        future = self._futures.get(leader_idx)
+        if future is not None and not future.done():
+            future.set_result(response)
+
+    def set_error(self, leader_idx, error):
+        future = self._futures.get(leader_idx)
+        if future is not None and not future.done():
+            future.set_exception(error)
+
+    def summary(self):
+        stats = self.stats
+        return (
+            f"page analysis: {stats['blank']} blank pages skipped, "
+            f"{stats['duplicates']} duplicate pages reused the result of one of {stats['groups']} distinct pages"
+        )
@@ -0,0 +1,99 @@
+import math
+
+import numpy as np
+from PIL import Image
+
+from dots_ocr.utils.consts import MIN_PIXELS, MAX_PIXELS
+from dots_ocr.utils.page_analysis import INK_LEVEL
+
+
+BUDGET_ANALYSIS_HEIGHT = 1024   # row profiles are computed on a grayscale copy of this height
+TEXT_ROW_INK = 0.002            # rows with a larger ink fraction belong to a text line
+MAX_LINE_HEIGHT = 0.05          # taller bands (pictures, ruled tables, merged columns) count as several lines
+
+# output token estimate: text tokens plus json/html markup per line and per cell, with a safety factor
+CHARS_PER_FULL_LINE = 90
+CHARS_PER_TOKEN = 3.0
+TOKENS_PER_LINE_MARKUP = 4
+LINES_PER_CELL = 3
+TOKENS_PER_CELL = 30
+TOKEN_SAFETY_FACTOR = 2.0
+MIN_COMPLETION_TOKENS = 1024
+TOKEN_ROUNDING = 256
+
+# resolution: the median text line should be about this many pixels tall in the model input
+TARGET_LINE_HEIGHT_PX = 28
+MIN_BUDGET_PIXELS = 1024 * 1024
+
+
+def text_line_profile(image: Image.Image, height=BUDGET_ANALYSIS_HEIGHT):
+    """
+    Finds the text line bands of a page from its horizontal ink projection.
+
+    Returns:
+        list: (band height, horizontal ink extent) per band, both as fractions of the page height / width.
+    """
+    gray = image.convert('L')
+    width = max(1, round(gray.width * height / gray.height))
+    gray = np.asarray(gray.resize((width, height), Image.Resampling.BOX))
+    ink = gray < INK_LEVEL
+    text_rows = ink.mean(axis=1) > TEXT_ROW_INK
+    bands = []
+    start = None
+    for y, is_text in enumerate(np.append(text_rows, False)):
+        if is_text and start is None:
+            start = y
+        elif not is_text and start is not None:
+            if y - start >= 2:  # a single row is a rule or noise
+                columns = np.flatnonzero(ink[start:y].any(axis=0))
+                bands.append(((y - start) / height, (columns[-1] - columns[0] + 1) / width))
+            start = None
+    return bands
+
+
+def estimate_page_budget(image: Image.Image, text_chars=None, max_completion_tokens=16384, min_pixels=None, max_pixels=None):
+    """
+    Per-page output token cap and resolution target.
+
+    The token estimate counts the text lines of the page (taller bands count as several lines)
+    and their ink extent, or the text layer character count when larger, and adds the json
+    markup of the cells, times `TOKEN_SAFETY_FACTOR`. The pixel target scales the page so that
+    its median text line is `TARGET_LINE_HEIGHT_PX` tall; it only ever lowers `max_pixels`.
+
+    Args:
+        image: The page image.
+        text_chars: Characters of the pdf text layer of the page, if known.
+        max_completion_tokens: The configured cap, never exceeded.
+        min_pixels, max_pixels: The configured bounds.
+
+    Returns:
+        dict: {'max_completion_tokens', 'max_pixels', 'lines', 'est_chars', 'text_chars', 'line_height'}
+    """
+    bands = text_line_profile(image)
+    normal = [h for h, _ in bands if h <= MAX_LINE_HEIGHT]
+    line_height = float(np.median(normal)) if normal else None
+    lines, est_chars = 0, 0.0
+    for band_height, extent in bands:
+        band_lines = max(1, round(band_height / line_height)) if line_height and band_height > MAX_LINE_HEIGHT else 1
+        lines += band_lines
+        est_chars += band_lines * extent * CHARS_PER_FULL_LINE
+    chars = max(est_chars, text_chars or 0)
+
+    tokens = chars / CHARS_PER_TOKEN + lines * TOKENS_PER_LINE_MARKUP + (lines / LINES_PER_CELL + 1) * TOKENS_PER_CELL
+    tokens = math.ceil(tokens * TOKEN_SAFETY_FACTOR / TOKEN_ROUNDING) * TOKEN_ROUNDING
+    tokens = min(max_completion_tokens, max(MIN_COMPLETION_TOKENS, tokens))
+
+    upper = max_pixels or MAX_PIXELS
+    budget_pixels = upper
+    if line_height:
+        input_height = TARGET_LINE_HEIGHT_PX / line_height
+        needed = int(input_height * input_height * image.width / image.height)
+        budget_pixels = min(upper, max(needed, MIN_BUDGET_PIXELS, min_pixels or MIN_PIXELS))
+    return {
+        'max_completion_tokens': tokens,
+        'max_pixels': budget_pixels,
+        'lines': lines,
+        'est_chars': int(est_chars),
+        'text_chars': text_chars,
+        'line_height': round(line_height, 4) if line_height else None,
+    }
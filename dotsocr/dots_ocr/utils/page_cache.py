@@ -0,0 +1,227 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+
+
+def make_page_cache_key(image, prompt, **params):
+    """
+    Hashes a model input: the preprocessed page image plus the prompt and everything
+    else that changes the response (user_hint, model name, sampling params, ...).
+
+    Args:
+        image: The preprocessed PIL image actually sent to the model.
+        prompt: The final prompt.
+        params: Other request parameters, must be json serializable.
+
+    Returns:
+        str: A sha256 hex digest.
+    """
+    h = hashlib.sha256()
+    h.update(f"{image.mode}:{image.width}x{image.height}\n".encode())
+    h.update(image.tobytes())
+    meta = json.dumps({'prompt': prompt, **params}, sort_keys=True, ensure_ascii=False, default=str)
+    h.update(meta.encode("utf-8"))
+    return h.hexdigest()
+
+
+class PageCache(ABC):
+    """
+    Base class of the page level inference cache: raw model responses keyed by
+    `make_page_cache_key`, evicted least recently used first once the stored
+    responses exceed `max_bytes`.
+
+    Subclasses implement `_get`, `_put` and `_evict`; locking and the hit/miss
+    counters are handled here, so a cache can be shared by all page workers.
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'puts': 0, 'evictions': 0}
+
+    def get(self, key):
+        """Returns the cached response, or None."""
+        with self._lock:
+            response = self._get(key)
+            self.stats['hits' if response is not None else 'misses'] += 1
+            return response
+
+    def put(self, key, response):
+        """Stores a response; failed (None) responses are not cached."""
+        if response is None:
+            return
+        with self._lock:
+            self._put(key, response)
+            self.stats['puts'] += 1
+            if self.max_bytes is not None:
+                self.stats['evictions'] += self._evict(self.max_bytes)
+
+    def summary(self):
+        stats = self.stats
+        lookups = stats['hits'] + stats['misses']
+        hit_rate = stats['hits'] / lookups if lookups else 0.0
+        return (
+            f"page cache: {stats['hits']} hits, {stats['misses']} misses ({hit_rate:.0%}), "
+            f"{stats['puts']} stored, {stats['evictions']} evicted"
+        )
+
+    def close(self):
+        pass
+
+    @abstractmethod
+    def _get(self, key):
+        """Returns the stored response and marks it as recently used, or None."""
+
+    @abstractmethod
+    def _put(self, key, response):
+        """Stores or replaces the response of a key."""
+
+    @abstractmethod
+    def _evict(self, max_bytes):
+        """Drops the least recently used responses until at most `max_bytes` remain, returns how many."""
+
+
+class DirPageCache(PageCache):
+    """
+    Stores each response as `<cache_dir>/<key[:2]>/<key>.txt`; the file mtime is the
+    recency used for eviction. Several processes may share the directory.
+    """
+
+    def __init__(self, cache_dir, max_bytes=None):
+        super().__init__(max_bytes=max_bytes)
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self._total_bytes = sum(size for _, size, _ in self._entries())
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.txt")
+
+    def _entries(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".txt"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, st.st_size, st.st_mtime
+
+    def _get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                response = f.read()
+        except FileNotFoundError:
+            return None
+        os.utime(path)
+        return response
+
+    def _put(self, key, response):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        old_size = os.path.getsize(path) if os.path.exists(path) else 0
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(response)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._total_bytes += os.path.getsize(path) - old_size
+
+    def _evict(self, max_bytes):
+        if self._total_bytes <= max_bytes:
+            return 0
+        evicted = 0
+        # re-scan: other processes may have added or removed entries
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        self._total_bytes = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if self._total_bytes <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._total_bytes -= size
+            evicted += 1
+        return evicted
+
+
+class SQLitePageCache(PageCache):
+    """Stores the responses in one SQLite file, convenient for large caches on a shared volume."""
+
+    def __init__(self, db_path, max_bytes=None):
+        super().__init__(max_bytes=max_bytes)
+        self.db_path = db_path
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS pages_last_access ON pages (last_access)")
+        self._conn.commit()
+
+    def _get(self, key):
+        row = self._conn.execute("SELECT response FROM pages WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._conn.execute("UPDATE pages SET last_access = ? WHERE key = ?", (time.time(), key))
+        self._conn.commit()
+        return row[0]
+
+    def _put(self, key, response):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO pages (key, response, size, last_access) VALUES (?, ?, ?, ?)",
+            (key, response, len(response.encode("utf-8")), time.time()),
+        )
+        self._conn.commit()
+
+    def _evict(self, max_bytes):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        if total <= max_bytes:
+            return 0
+        evicted = 0
+        for key, size in self._conn.execute("SELECT key, size FROM pages ORDER BY last_access").fetchall():
+            if total <= max_bytes:
+                break
+            self._conn.execute("DELETE FROM pages WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        self._conn.commit()
+        return evicted
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def open_page_cache(spec, max_mb=None):
+    """
+    Opens a page cache from a spec string: a directory, or a SQLite file
+    (`sqlite:<path>`, or a path ending with .db/.sqlite).
+
+    Args:
+        spec: The cache location, or an already constructed PageCache which is returned as is.
+        max_mb: Optional size bound of the stored responses in MB.
+    """
+    if spec is None or isinstance(spec, PageCache):
+        return spec
+    max_bytes = int(max_mb * 1024 * 1024) if max_mb else None
+    if spec.startswith("sqlite:"):
+        return SQLitePageCache(spec[len("sqlite:"):], max_bytes=max_bytes)
+    if spec.endswith((".db", ".sqlite", ".sqlite3")):
+        return SQLitePageCache(spec, max_bytes=max_bytes)
+    return DirPageCache(spec, max_bytes=max_bytes)
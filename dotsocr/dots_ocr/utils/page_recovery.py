@@ -0,0 +1,203 @@
+import json
+import math
+
+import numpy as np
+
+from dots_ocr.utils.consts import MAX_PIXELS, REGION_MIN_PIXELS
+from dots_ocr.utils.image_utils import crop_region, fetch_image
+from dots_ocr.utils.layout_utils import post_process_cells, offset_cells
+from dots_ocr.utils.output_cleaner import OutputCleaner
+from dots_ocr.utils.page_analysis import INK_LEVEL
+
+
+RECOVER_ANALYSIS_SIZE = 640   # the ink mask is min-pooled down to at most this size, thin strokes survive
+RECOVER_COVER_PAD = 2         # mask pixels around a salvaged cell that count as covered by it
+RECOVER_MIN_INK = 6           # mask pixels of ink below which an uncovered block is noise
+RECOVER_GAP = 0.02            # blank rows / columns (fraction of the page side) separating two regions
+RECOVER_MAX_REGIONS = 8       # more uncovered blocks are merged down to this many requests
+RECOVER_MIN_TOKENS = 1024     # lower bound of the token cap of a region request
+RECOVER_DUPLICATE_OVERLAP = 0.6  # a recovered cell this much inside a salvaged one is dropped
+
+
+def _valid_bbox(bbox):
+    return (
+        isinstance(bbox, (list, tuple)) and len(bbox) == 4
+        and all(isinstance(v, (int, float)) for v in bbox)
+        and bbox[2] > bbox[0] and bbox[3] > bbox[1]
+    )
+
+
+def parse_cells(response):
+    """The cells of a layout response that is a valid json list of cells, else None."""
+    try:
+        cells = json.loads(response)
+    except (json.JSONDecodeError, TypeError):
+        return None
+    if isinstance(cells, list) and cells and all(isinstance(c, dict) and _valid_bbox(c.get('bbox')) for c in cells):
+        return cells
+    return None
+
+
+def salvage_cells(response):
+    """The complete cells OutputCleaner extracts from a broken layout response (model input coordinates)."""
+    cleaned = OutputCleaner(verbose=False).clean_model_output(response)
+    if not isinstance(cleaned, list):
+        return []
+    return [cell for cell in cleaned if isinstance(cell, dict) and _valid_bbox(cell.get('bbox'))]
+
+
+def _ink_mask(image, size=RECOVER_ANALYSIS_SIZE):
+    """Returns (ink mask, pooling factor); a mask pixel is ink when any pixel of its block is."""
+    gray = np.asarray(image.convert('L'))
+    factor = max(1, math.ceil(max(gray.shape) / size))
+    height, width = gray.shape[0] // factor, gray.shape[1] // factor
+    pooled = gray[:height * factor, :width * factor].reshape(height, factor, width, factor).min(axis=(1, 3))
+    return pooled < INK_LEVEL, factor
+
+
+def _runs(profile, gap):
+    """[start, end) runs of True in a 1d profile, bridging False gaps shorter than `gap`."""
+    runs = []
+    for i in np.flatnonzero(profile):
+        if runs and i - runs[-1][1] < gap:
+            runs[-1][1] = i + 1
+        else:
+            runs.append([i, i + 1])
+    return runs
+
+
+def uncovered_regions(image, bboxes, max_regions=RECOVER_MAX_REGIONS):
+    """
+    Finds the content of a page that the given cells miss.
+
+    The ink outside the cells is cut into horizontal bands at blank rows, then each band
+    into blocks at blank columns (a recursive xy-cut of depth two); tiny blocks are noise.
+
+    Args:
+        image: The page.
+        bboxes: [x1, y1, x2, y2] of the cells already known, in page coordinates.
+
+    Returns:
+        list: [x1, y1, x2, y2] per uncovered region in page coordinates, top to bottom.
+    """
+    ink, factor = _ink_mask(image)
+    height, width = ink.shape
+    pad = RECOVER_COVER_PAD
+    for x1, y1, x2, y2 in bboxes:
+        ink[max(0, int(y1) // factor - pad):math.ceil(y2 / factor) + pad,
+            max(0, int(x1) // factor - pad):math.ceil(x2 / factor) + pad] = False
+
+    regions = []
+    for top, bottom in _runs(ink.any(axis=1), max(1, int(RECOVER_GAP * height))):
+        band = ink[top:bottom]
+        for left, right in _runs(band.any(axis=0), max(1, int(RECOVER_GAP * width))):
+            block = band[:, left:right]
+            if block.sum() < RECOVER_MIN_INK:
+                continue
+            rows = np.flatnonzero(block.any(axis=1))
+            regions.append([left, top + rows[0], right, top + rows[-1] + 1])
+    if len(regions) > max_regions:
+        # consecutive blocks are merged, keeping their top to bottom order
+        groups = np.array_split(np.arange(len(regions)), max_regions)
+        regions = [
+            [min(regions[i][0] for i in g), min(regions[i][1] for i in g), max(regions[i][2] for i in g), max(regions[i][3] for i in g)]
+            for g in groups
+        ]
+    return [
+        [int(x1 * factor), int(y1 * factor), min(image.width, int(x2 * factor)), min(image.height, int(y2 * factor))]
+        for x1, y1, x2, y2 in regions
+    ]
+
+
+def drop_covered(cells, existing, overlap=RECOVER_DUPLICATE_OVERLAP):
+    """Drops the cells lying mostly (`overlap` of their area) inside one of the existing cells."""
+    if not existing or not cells:
+        return cells
+    known = np.asarray([cell['bbox'] for cell in existing], dtype=np.float64)
+    kept = []
+    for cell in cells:
+        x1, y1, x2, y2 = cell['bbox']
+        iw = np.clip(np.minimum(known[:, 2], x2) - np.maximum(known[:, 0], x1), 0, None)
+        ih = np.clip(np.minimum(known[:, 3], y2) - np.maximum(known[:, 1], y1), 0, None)
+        area = max(1, (x2 - x1) * (y2 - y1))
+        if not np.any(iw * ih / area >= overlap):
+            kept.append(cell)
+    return kept
+
+
+class PageRecovery:
+    """
+    Recovery of a page whose layout response is not valid json.
+
+    The complete cells in the response are kept; the page regions they leave uncovered
+    become `requests`: the padded crop of each region with the page prompt and a token
+    cap proportional to its share of the page. `finish` merges their answers.
+
+    Args:
+        origin_image: The page.
+        page: The prepared page the broken response answered (see DotsOCRParser._prepare_page).
+        response: The broken response.
+        max_completion_tokens: Token cap of the page, the region caps are shares of it.
+    """
+
+    def __init__(self, origin_image, page, response, max_completion_tokens):
+        self.origin_image = origin_image
+        self.min_pixels, self.max_pixels = page["min_pixels"], page["max_pixels"] or MAX_PIXELS
+        salvaged = salvage_cells(response)
+        if salvaged:
+            salvaged = post_process_cells(
+                origin_image, salvaged, page["image"].width, page["image"].height,
+                min_pixels=self.min_pixels, max_pixels=self.max_pixels,
+            )
+        self.salvaged = salvaged
+        self.regions = uncovered_regions(origin_image, [cell['bbox'] for cell in salvaged])
+        page_area = origin_image.width * origin_image.height
+        self.requests = []
+        for bbox in self.regions:
+            region, crop_box = crop_region(origin_image, bbox)
+            share = (crop_box[2] - crop_box[0]) * (crop_box[3] - crop_box[1]) / page_area
+            self.requests.append({
+                'image': fetch_image(region, min_pixels=min(REGION_MIN_PIXELS, self.max_pixels), max_pixels=self.max_pixels),
+                'prompt': page["prompt"],
+                'crop_box': crop_box,
+                # twice the share of the page, so a dense region is not cut by its cap
+                'max_completion_tokens': min(max_completion_tokens, max(RECOVER_MIN_TOKENS, int(2 * share * max_completion_tokens))),
+            })
+
+    def _region_cells(self, request, response):
+        if response.strip() == '[]':
+            return []  # nothing the model would transcribe, e.g. a rule or a stain
+        cells = parse_cells(response) or salvage_cells(response)
+        if not cells:
+            return None
+        crop_box = request['crop_box']
+        cells = post_process_cells(
+            self.origin_image.crop(crop_box), cells, request['image'].width, request['image'].height,
+            min_pixels=min(REGION_MIN_PIXELS, self.max_pixels), max_pixels=self.max_pixels,
+        )
+        return offset_cells(cells, crop_box[0], crop_box[1])
+
+    def finish(self, responses):
+        """
+        Args:
+            responses: The response of each request, None for a request that failed.
+
+        Returns:
+            tuple: (cells in page coordinates, recovery stats for the page result)
+        """
+        recovered, failed = [], 0
+        for request, response in zip(self.requests, responses):
+            cells = self._region_cells(request, response) if response is not None else None
+            if cells is None:
+                failed += 1
+                continue
+            recovered.extend(cells)
+        recovered = drop_covered(recovered, self.salvaged)
+        stats = {
+            'salvaged': len(self.salvaged),
+            'regions': len(self.requests),
+            'recovered': len(recovered),
+            'failed_regions': failed,
+        }
+        return self.salvaged + recovered, stats
+
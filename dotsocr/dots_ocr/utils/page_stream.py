@@ -0,0 +1,153 @@
+import sys
+import time
+import threading
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def get_current_rss_mb():
+    """Returns the current resident set size of this process in MB, or None if unknown."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            rss_pages = int(f.read().split()[1])
+        return rss_pages * (resource.getpagesize() if resource else 4096) / (1024 * 1024)
+    except Exception:
+        return None
+
+
+def get_peak_rss_mb():
+    """Returns the peak resident set size of this process in MB, or None if unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":  # bytes on macOS, KB elsewhere
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+class BoundedPageStream:
+    """
+    Feeds rendered pages to a worker pool while keeping only a bounded number of
+    them resident in memory.
+
+    The wrapped iterator is advanced lazily, so a page is rendered only when a
+    slot is free: at most `max_pages` pages (in flight + lookahead) exist at any
+    time, and rendering also pauses while the resident pixels exceed `max_bytes`.
+    Consumers must call `release(page_idx)` once a page has been processed.
+
+    Args:
+        pages: An iterator of (page_idx, PIL.Image) tuples, e.g. `iter_images_from_pdf`.
+        max_pages: Maximum number of rendered pages resident at the same time.
+        max_bytes: Optional soft limit on the resident pixel bytes.
+    """
+
+    def __init__(self, pages, max_pages, max_bytes=None):
+        self._pages = pages
+        self.max_pages = max(1, int(max_pages))
+        self.max_bytes = max_bytes
+        self._cond = threading.Condition()
+        self._resident = {}
+        self._resident_bytes = 0
+        self._closed = False
+        self._start_time = time.perf_counter()
+        self._base_rss_mb = get_current_rss_mb()
+        self.stats = {
+            'pages_rendered': 0,
+            'render_seconds': 0.0,
+            'first_page_seconds': None,
+            'peak_resident_pages': 0,
+            'peak_resident_mb': 0.0,
+            'peak_rss_mb': self._base_rss_mb,
+        }
+
+    def _has_slot(self):
+        if self._closed or not self._resident:
+            return True
+        if len(self._resident) >= self.max_pages:
+            return False
+        return self.max_bytes is None or self._resident_bytes < self.max_bytes
+
+    def _sample_rss(self):
+        rss = get_current_rss_mb()
+        if rss is not None and (self.stats['peak_rss_mb'] is None or rss > self.stats['peak_rss_mb']):
+            self.stats['peak_rss_mb'] = rss
+
+    def __iter__(self):
+        pages = iter(self._pages)
+        while True:
+            with self._cond:
+                self._cond.wait_for(self._has_slot)
+                if self._closed:
+                    return
+            t0 = time.perf_counter()
+            try:
+                page_idx, image = next(pages)
+            except StopIteration:
+                return
+            nbytes = image.width * image.height * len(image.getbands())
+            with self._cond:
+                self._resident[page_idx] = nbytes
+                self._resident_bytes += nbytes
+                self.stats['pages_rendered'] += 1
+                self.stats['render_seconds'] += time.perf_counter() - t0
+                if self.stats['first_page_seconds'] is None:
+                    self.stats['first_page_seconds'] = time.perf_counter() - self._start_time
+                self.stats['peak_resident_pages'] = max(self.stats['peak_resident_pages'], len(self._resident))
+                self.stats['peak_resident_mb'] = max(self.stats['peak_resident_mb'], self._resident_bytes / (1024 * 1024))
+                self._sample_rss()
+            yield page_idx, image
+
+    def release(self, page_idx):
+        """Marks a page as processed so that the next page can be rendered."""
+        with self._cond:
+            nbytes = self._resident.pop(page_idx, 0)
+            self._resident_bytes -= nbytes
+            self._sample_rss()
+            self._cond.notify_all()
+
+    def close(self):
+        """Stops rendering further pages and wakes up a blocked producer."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def summary(self):
+        stats = self.stats
+        peak_rss = stats['peak_rss_mb']
+        return (
+            f"rendered {stats['pages_rendered']} pages in {stats['render_seconds']:.2f}s, "
+            f"first page after {stats['first_page_seconds'] or 0:.2f}s, "
+            f"peak resident pages {stats['peak_resident_pages']}/{self.max_pages} "
+            f"({stats['peak_resident_mb']:.1f} MB pixels), "
+            f"peak rss {'n/a' if peak_rss is None else f'{peak_rss:.1f} MB'}"
+        )
+
+
+class PageReorderBuffer:
+    """
+    Turns page results arriving in completion order into page order.
+
+    `push` returns the results that became contiguous, holding back the ones that
+    arrive ahead of a slower earlier page.
+    """
+
+    def __init__(self, first_page=0):
+        self._next = first_page
+        self._pending = {}
+
+    def push(self, result):
+        self._pending[result['page_no']] = result
+        ready = []
+        while self._next in self._pending:
+            ready.append(self._pending.pop(self._next))
+            self._next += 1
+        return ready
+
+    def flush(self):
+        """Returns the held back results in page order, e.g. when a page is missing."""
+        ready = [self._pending[page_no] for page_no in sorted(self._pending)]
+        self._pending.clear()
+        return ready
@@ -0,0 +1,145 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+
+MANIFEST_VERSION = 1
+MANIFEST_NAME = "_resume_manifest.json"
+PAGE_LOG_NAME = "_resume_pages.jsonl"
+
+
+def sha1_of_file(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _write_json_atomic(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _outputs_exist(result):
+    return all(
+        os.path.exists(result[key])
+        for key in ('layout_info_path', 'md_content_path', 'md_content_nohf_path', 'text_content_path')
+        if result.get(key)
+    )
+
+
+class ParseManifest:
+    """
+    Checkpoint of a document parse in its save_dir, used to resume an interrupted run.
+
+    The manifest (`_resume_manifest.json`, written atomically) records the input hash,
+    the prompt and the parameters that change the output. Every finished page is
+    appended to `_resume_pages.jsonl` as {"page_no", "status": "done", "result"} or
+    {"page_no", "status": "failed", "error"}, so a crash loses at most the line being
+    written. When the input or the parameters differ from the previous run, the
+    checkpoint is discarded and the document is parsed from scratch.
+
+    Args:
+        save_dir: The save_dir of the document.
+        input_path: The parsed file.
+        prompt_mode: The prompt mode.
+        params: Other parameters the outputs depend on, json serializable.
+    """
+
+    def __init__(self, save_dir, input_path, prompt_mode, params):
+        self.save_dir = save_dir
+        self.manifest_path = os.path.join(save_dir, MANIFEST_NAME)
+        self.log_path = os.path.join(save_dir, PAGE_LOG_NAME)
+        self.header = {
+            'version': MANIFEST_VERSION,
+            'input_path': os.path.abspath(input_path),
+            'input_sha1': sha1_of_file(input_path),
+            'prompt_mode': prompt_mode,
+            'params': json.loads(json.dumps(params, default=str)),
+        }
+        self._lock = threading.Lock()
+        self._log = None
+        self.completed = {}
+        self.failed = {}
+
+    def load(self):
+        """
+        Loads the previous checkpoint if it matches this run.
+
+        Returns:
+            dict: {page_no: result} of the pages that completed and whose output files still exist.
+        """
+        previous = None
+        if os.path.exists(self.manifest_path):
+            try:
+                with open(self.manifest_path, "r", encoding="utf-8") as f:
+                    previous = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"resume: unreadable manifest ({e}), starting from scratch")
+        same_run = previous is not None and all(
+            previous.get(key) == self.header[key] for key in ('version', 'input_sha1', 'prompt_mode', 'params')
+        )
+        if previous is not None and not same_run:
+            print("resume: input or parameters changed since the last run, starting from scratch")
+
+        if same_run and os.path.exists(self.log_path):
+            with open(self.log_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line of a crashed run
+                    page_no = entry['page_no']
+                    if entry['status'] == 'done':
+                        self.completed[page_no] = entry['result']
+                        self.failed.pop(page_no, None)
+                    else:
+                        self.completed.pop(page_no, None)
+                        self.failed[page_no] = entry.get('error')
+            missing = [page_no for page_no, result in self.completed.items() if not _outputs_exist(result)]
+            for page_no in missing:
+                del self.completed[page_no]
+            if missing:
+                print(f"resume: outputs of {len(missing)} completed pages are missing, they will be parsed again")
+
+        # start a new log holding only the pages still valid, so it does not grow across restarts
+        _write_json_atomic(self.manifest_path, {**self.header, 'started_at': time.time(), 'finished': False})
+        tmp_path = f"{self.log_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for page_no in sorted(self.completed):
+                f.write(json.dumps({'page_no': page_no, 'status': 'done', 'result': self.completed[page_no]}, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.log_path)
+        self._log = open(self.log_path, "a", encoding="utf-8")
+        return dict(self.completed)
+
+    def record(self, result):
+        """Appends a finished page; results with an 'error' key are recorded as failed."""
+        if 'error' in result:
+            entry = {'page_no': result['page_no'], 'status': 'failed', 'error': result['error']}
+        else:
+            entry = {'page_no': result['page_no'], 'status': 'done', 'result': result}
+        with self._lock:
+            self._log.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._log.flush()
+            if entry['status'] == 'done':
+                self.completed[result['page_no']] = result
+                self.failed.pop(result['page_no'], None)
+            else:
+                self.failed[result['page_no']] = result['error']
+
+    def close(self, finished=True):
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+        _write_json_atomic(self.manifest_path, {
+            **self.header,
+            'finished': finished and not self.failed,
+            'completed_pages': len(self.completed),
+            'failed_pages': sorted(self.failed),
+        })
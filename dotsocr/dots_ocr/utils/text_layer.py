@@ -0,0 +1,311 @@
+import re
+import statistics
+import threading
+
+import fitz
+
+from dots_ocr.utils.doc_utils import SupportedPdfParseMethod, get_pdf_page_range
+
+
+# A page is parsed from its text layer only when it looks born-digital:
+MIN_TEXT_CHARS = 50           # enough visible characters
+MAX_BAD_GLYPH_RATIO = 0.02    # U+FFFD / private use / control characters (broken ToUnicode maps)
+MAX_INVISIBLE_RATIO = 0.5     # invisible text is the OCR layer of a scan
+MAX_IMAGE_COVERAGE = 0.6      # page area covered by raster images
+MIN_PICTURE_AREA = 0.01       # smaller images (bullets, rules, logos) are not emitted as Picture cells
+
+# Content the text layer cannot express in the model's schema (LaTeX formulas, HTML tables)
+# is left to the model.
+MATH_FONT_PATTERN = re.compile(r'CMMI|CMSY|CMEX|CMBSY|MSAM|MSBM|Math|STIX|Symbol|MTMI|MTSY|Euclid|rsfs', re.IGNORECASE)
+
+LIST_ITEM_PATTERN = re.compile(r'^\s*([•◦▪▫●○■□\-–\*·]|\(?\d{1,3}[\.\)]|\(?[a-zA-Z][\.\)]|[ivxIVX]{1,4}[\.\)])\s+')
+CAPTION_PATTERN = re.compile(r'^\s*(Figure|Fig\.|Table|Tab\.|Chart|图|表)\s*[\dA-Z一二三四五六七八九十]', re.IGNORECASE)
+CJK_PATTERN = re.compile(r'[　-〿぀-ヿ㐀-䶿一-鿿가-힯＀-￯]')
+
+
+def _is_bad_glyph(ch):
+    code = ord(ch)
+    return ch == '�' or 0xE000 <= code <= 0xF8FF or (code < 32 and ch not in '\t\n\r')
+
+
+def _rect_area(bbox):
+    x0, y0, x1, y1 = bbox
+    return max(0.0, x1 - x0) * max(0.0, y1 - y0)
+
+
+def _join_lines(lines):
+    text = ""
+    for line in lines:
+        line = re.sub(r'\s+', ' ', line).strip()
+        if not line:
+            continue
+        if not text:
+            text = line
+        elif text.endswith('-') and line[:1].islower():
+            text = text[:-1] + line  # de-hyphenate
+        elif CJK_PATTERN.match(text[-1]) or CJK_PATTERN.match(line[0]):
+            text += line
+        else:
+            text += " " + line
+    return text
+
+
+def _make_block(lines):
+    """lines: [(bbox, text, sizes, bold)] of one paragraph."""
+    sizes = [size for _, _, line_sizes, _ in lines for size in line_sizes]
+    text = _join_lines([text for _, text, _, _ in lines])
+    if not text:
+        return None
+    return {
+        'bbox': [
+            min(bbox[0] for bbox, _, _, _ in lines), min(bbox[1] for bbox, _, _, _ in lines),
+            max(bbox[2] for bbox, _, _, _ in lines), max(bbox[3] for bbox, _, _, _ in lines),
+        ],
+        'text': text,
+        'size': max(sizes) if sizes else 0.0,
+        'bold': all(bold for _, _, _, bold in lines),
+        'chars': len(sizes),
+        'lines': len(lines),
+    }
+
+
+def _blocks(page_dict):
+    """
+    Returns the text blocks of a page as dicts with bbox, text, size, bold, chars and lines.
+    A block whose lines start with list markers is split into one block per list item.
+    """
+    blocks = []
+    for block in page_dict.get('blocks', []):
+        if block.get('type') != 0:
+            continue
+        group = []
+        for line in block.get('lines', []):
+            spans = [span for span in line.get('spans', []) if span.get('text')]
+            if not spans:
+                continue
+            text = "".join(span['text'] for span in spans)
+            sizes = [span['size'] for span in spans for _ in range(len(span['text'].strip()))]
+            bold = all(span['flags'] & 16 or 'bold' in span['font'].lower() for span in spans)
+            if group and LIST_ITEM_PATTERN.match(text):
+                blocks.append(_make_block(group))
+                group = []
+            group.append((line['bbox'], text, sizes, bold))
+        if group:
+            blocks.append(_make_block(group))
+    return [block for block in blocks if block]
+
+
+def classify_pdf_page(page, detect_tables=True):
+    """
+    Decides whether a pdf page can be parsed from its embedded text layer.
+
+    Args:
+        page: A pymupdf page.
+        detect_tables: Also route pages with ruled tables to the model (uses `page.find_tables`,
+            about 10-50 ms per page).
+
+    Returns:
+        dict: {'method': SupportedPdfParseMethod, 'reason': str, plus the measured statistics}
+    """
+    page_area = _rect_area(page.rect) or 1.0
+    info = {'chars': 0, 'bad_glyph_ratio': 0.0, 'invisible_ratio': 0.0, 'image_coverage': 0.0}
+
+    visible, invisible, bad = 0, 0, 0
+    for span in page.get_texttrace():
+        chars = [chr(c[0]) for c in span['chars'] if c[0] > 0 and not chr(c[0]).isspace()]
+        if span['type'] == 3 or span['opacity'] == 0:
+            invisible += len(chars)
+            continue
+        visible += len(chars)
+        bad += sum(1 for ch in chars if _is_bad_glyph(ch))
+    info['chars'] = visible
+    info['bad_glyph_ratio'] = bad / visible if visible else 0.0
+    info['invisible_ratio'] = invisible / (visible + invisible) if visible + invisible else 0.0
+    info['image_coverage'] = min(1.0, sum(
+        _rect_area(fitz.Rect(image['bbox']) & page.rect) for image in page.get_image_info()
+    ) / page_area)
+
+    def decide(method, reason):
+        info.update({'method': method, 'reason': reason})
+        return info
+
+    if info['invisible_ratio'] > MAX_INVISIBLE_RATIO:
+        return decide(SupportedPdfParseMethod.OCR, 'invisible text layer')
+    if visible < MIN_TEXT_CHARS:
+        return decide(SupportedPdfParseMethod.OCR, 'no text layer')
+    if info['bad_glyph_ratio'] > MAX_BAD_GLYPH_RATIO:
+        return decide(SupportedPdfParseMethod.OCR, 'unmapped glyphs')
+    if info['image_coverage'] > MAX_IMAGE_COVERAGE:
+        return decide(SupportedPdfParseMethod.OCR, 'image page')
+    if any(MATH_FONT_PATTERN.search(font[3]) for font in page.get_fonts()):
+        return decide(SupportedPdfParseMethod.OCR, 'math fonts')
+    if detect_tables and hasattr(page, 'find_tables'):
+        try:
+            if page.find_tables().tables:
+                return decide(SupportedPdfParseMethod.OCR, 'tables')
+        except Exception as e:
+            print(f"table detection failed on page {page.number}: {e}")
+            return decide(SupportedPdfParseMethod.OCR, 'tables')
+    return decide(SupportedPdfParseMethod.TXT, 'text layer')
+
+
+def text_layer_cells(page):
+    """
+    Builds layout cells in the model's schema from the text layer of a pdf page.
+
+    Bboxes are in pdf points; use `scale_cells` to map them onto the rendered image.
+    Categories are assigned heuristically from font sizes, position and text patterns.
+
+    Returns:
+        list: [{'bbox': [x1, y1, x2, y2], 'category': str, 'text': str}, ...] in content order.
+    """
+    page_dict = page.get_text('dict', flags=fitz.TEXT_PRESERVE_IMAGES | fitz.TEXT_DEHYPHENATE)
+    page_width, page_height = page.rect.width, page.rect.height
+    blocks = _blocks(page_dict)
+    sizes = [block['size'] for block in blocks for _ in range(block['chars'])]
+    body_size = statistics.median(sizes) if sizes else 0.0
+
+    cells = []
+    has_title = False
+    for block in page_dict.get('blocks', []):
+        if block.get('type') == 1 and _rect_area(block['bbox']) >= MIN_PICTURE_AREA * page_width * page_height:
+            cells.append({'bbox': list(block['bbox']), 'category': 'Picture', '_y': block['bbox'][1]})
+    for block in blocks:
+        x0, y0, x1, y1 = block['bbox']
+        text, size = block['text'], block['size']
+        short = len(text) < 120 and block['lines'] <= 2
+        if (y1 < 0.07 * page_height or y0 > 0.93 * page_height) and len(text) < 100:
+            category = 'Page-header' if y1 < 0.5 * page_height else 'Page-footer'
+        elif CAPTION_PATTERN.match(text) and len(text) < 300:
+            category = 'Caption'
+        elif body_size and size >= 1.6 * body_size and short and not has_title and page.number == 0:
+            category = 'Title'
+            has_title = True
+            text = f"# {text}"
+        elif body_size and short and (size >= 1.15 * body_size or (block['bold'] and block['lines'] == 1)):
+            category = 'Section-header'
+            text = f"## {text}"
+        elif LIST_ITEM_PATTERN.match(text):
+            category = 'List-item'
+        elif body_size and size <= 0.85 * body_size and y0 > 0.75 * page_height:
+            category = 'Footnote'
+        else:
+            category = 'Text'
+        cells.append({'bbox': [x0, y0, x1, y1], 'category': category, 'text': text, '_y': y0})
+
+    # pictures are placed in reading order by their top edge, text keeps the content stream order
+    text_cells = [cell for cell in cells if cell['category'] != 'Picture']
+    for picture in (cell for cell in cells if cell['category'] == 'Picture'):
+        index = next((i for i, cell in enumerate(text_cells) if cell['_y'] > picture['_y']), len(text_cells))
+        text_cells.insert(index, picture)
+    for cell in text_cells:
+        del cell['_y']
+    return text_cells
+
+
+def scale_cells(cells, page_width, page_height, image_width, image_height):
+    """Maps cell bboxes from pdf points to pixels of the rendered page image."""
+    scale_x, scale_y = image_width / page_width, image_height / page_height
+    scaled = []
+    for cell in cells:
+        x0, y0, x1, y1 = cell['bbox']
+        bbox = [
+            max(0, min(image_width, int(x0 * scale_x))),
+            max(0, min(image_height, int(y0 * scale_y))),
+            max(0, min(image_width, int(round(x1 * scale_x)))),
+            max(0, min(image_height, int(round(y1 * scale_y)))),
+        ]
+        scaled.append({**cell, 'bbox': bbox})
+    return scaled
+
+
+def analyze_pdf_page(page, method='auto', detect_tables=True):
+    """
+    Classifies one pdf page and extracts its cells when it is parsed from the text layer.
+
+    Args:
+        method: 'auto' classifies the page, 'txt' uses the text layer whenever the page has one.
+        detect_tables: See `classify_pdf_page`.
+
+    Returns:
+        dict: {'method', 'reason', statistics..., 'page_width', 'page_height', 'cells' (txt pages only)}
+    """
+    if method == 'txt':
+        has_text = bool(page.get_text('text').strip())
+        info = {
+            'method': SupportedPdfParseMethod.TXT if has_text else SupportedPdfParseMethod.OCR,
+            'reason': 'forced' if has_text else 'no text layer',
+        }
+    else:
+        info = classify_pdf_page(page, detect_tables=detect_tables)
+    info['page_width'], info['page_height'] = page.rect.width, page.rect.height
+    if info['method'] == SupportedPdfParseMethod.TXT:
+        info['cells'] = text_layer_cells(page)
+        if not info['cells']:
+            info.update({'method': SupportedPdfParseMethod.OCR, 'reason': 'no text blocks'})
+    return info
+
+
+def analyze_pdf_text_layer(pdf_file, method='auto', start_page_id=0, end_page_id=None, detect_tables=True):
+    """
+    Classifies every page of a pdf, see `analyze_pdf_page`.
+
+    Returns:
+        dict: {page index: page info}
+    """
+    with fitz.open(pdf_file) as doc:
+        return {
+            index: analyze_pdf_page(doc[index], method=method, detect_tables=detect_tables)
+            for index in get_pdf_page_range(doc, start_page_id, end_page_id)
+        }
+
+
+class PdfTextLayer:
+    """
+    Lazy text layer analysis of a pdf for the parser.
+
+    A page is classified the first time it is asked for, by the stage that renders or
+    parses it, so only the pages being parsed are analysed and the first request is not
+    held up by a pass over the whole document. PyMuPDF documents are not thread safe:
+    the pages are analysed one at a time on a document of their own.
+
+    Args:
+        pdf_file: Path of the pdf.
+        method: See `analyze_pdf_page`.
+    """
+
+    def __init__(self, pdf_file, method='auto', detect_tables=True):
+        self.pdf_file = pdf_file
+        self.method = method
+        self.detect_tables = detect_tables
+        self._doc = None
+        self._pages = {}
+        self._lock = threading.Lock()
+
+    def get(self, index, default=None):
+        """The info of page `index` (see `analyze_pdf_page`), analysed on first use."""
+        with self._lock:
+            info = self._pages.get(index)
+            if info is None:
+                if self._doc is None:
+                    self._doc = fitz.open(self.pdf_file)
+                if not 0 <= index < self._doc.page_count:
+                    return default
+                info = self._pages[index] = analyze_pdf_page(self._doc[index], method=self.method, detect_tables=self.detect_tables)
+            return info
+
+    def __len__(self):
+        """The number of pages analysed so far."""
+        return len(self._pages)
+
+    def summary(self):
+        with self._lock:
+            pages = len(self._pages)
+            txt_pages = sum(1 for info in self._pages.values() if info['method'] == SupportedPdfParseMethod.TXT)
+        return f"text layer: {txt_pages}/{pages} pages parsed from the pdf text layer, {pages - txt_pages} sent to the model"
+
+    def close(self):
+        with self._lock:
+            doc, self._doc = self._doc, None
+        if doc is not None:
+            doc.close()
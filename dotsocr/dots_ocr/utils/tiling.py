@@ -0,0 +1,155 @@
+import math
+import threading
+
+import numpy as np
+
+from dots_ocr.utils.doc_utils import MAX_RENDER_SIZE
+from dots_ocr.utils.layout_utils import offset_cells
+
+
+TILE_THRESHOLD = MAX_RENDER_SIZE  # pages larger than this (in either dimension) are tiled
+TILE_SIZE = 2560                  # side of a tile in rendered pixels
+TILE_OVERLAP = 256                # overlap of neighbouring tiles, larger than a text line
+TILE_MAX_RENDER_SIZE = 14000      # tiled pages are rendered at full dpi up to this size, scaled down beyond
+EDGE_MARGIN = 8                   # a cell this close to an inner tile edge is probably cut by it
+DEDUP_OVERLAP = 0.6               # cells of two tiles sharing this fraction of the smaller one are duplicates
+
+
+def _tile_starts(length, tile, overlap):
+    if length <= tile:
+        return [0]
+    count = math.ceil((length - overlap) / (tile - overlap))
+    step = (length - tile) / (count - 1)
+    return [round(i * step) for i in range(count)]
+
+
+def plan_tiles(width, height, tile_size=TILE_SIZE, overlap=TILE_OVERLAP):
+    """
+    Splits a page into overlapping tiles of at most tile_size, spread evenly so that
+    neighbouring tiles overlap by at least `overlap` pixels.
+
+    Returns:
+        list: [x1, y1, x2, y2] per tile in row-major order.
+    """
+    assert 0 <= overlap < tile_size, "overlap should be smaller than tile_size"
+    tile_w, tile_h = min(tile_size, width), min(tile_size, height)
+    return [
+        [x, y, x + tile_w, y + tile_h]
+        for y in _tile_starts(height, tile_h, overlap)
+        for x in _tile_starts(width, tile_w, overlap)
+    ]
+
+
+def _is_cut(bbox, box, width, height, margin):
+    """Whether a cell (tile coordinates) touches an edge of its tile that lies inside the page."""
+    x1, y1, x2, y2 = bbox
+    tile_w, tile_h = box[2] - box[0], box[3] - box[1]
+    return (
+        (box[0] > 0 and x1 <= margin) or (box[1] > 0 and y1 <= margin)
+        or (box[2] < width and x2 >= tile_w - margin) or (box[3] < height and y2 >= tile_h - margin)
+    )
+
+
+def merge_tile_cells(boxes, tile_cells, width, height, edge_margin=EDGE_MARGIN, dedup_overlap=DEDUP_OVERLAP):
+    """
+    Merges the cells of the tiles of a page into page coordinates.
+
+    A cell seen by two tiles (they share `dedup_overlap` of the smaller bbox) is kept
+    once: the copy not cut by an inner tile edge, else the larger one. The merged cells
+    keep the tile order, then the order of the model within each tile.
+
+    Args:
+        boxes: [x1, y1, x2, y2] of each tile in the page.
+        tile_cells: The cells of each tile, in tile coordinates.
+
+    Returns:
+        tuple: (cells, number of dropped duplicates)
+    """
+    candidates = []
+    for tile_idx, (box, cells) in enumerate(zip(boxes, tile_cells)):
+        for cell_idx, cell in enumerate(offset_cells(cells or [], box[0], box[1])):
+            cut = _is_cut(cells[cell_idx]['bbox'], box, width, height, edge_margin)
+            x1, y1, x2, y2 = cell['bbox']
+            area = max(0, x2 - x1) * max(0, y2 - y1)
+            candidates.append((cut, -area, tile_idx, cell_idx, cell))
+    # best copies first: uncut, then larger
+    candidates.sort(key=lambda c: c[:2])
+
+    kept = []
+    kept_boxes = np.zeros((0, 4))
+    kept_tiles = np.zeros(0, dtype=np.int64)
+    for cut, neg_area, tile_idx, cell_idx, cell in candidates:
+        bbox = np.asarray(cell['bbox'], dtype=np.float64)
+        if len(kept):
+            iw = np.clip(np.minimum(kept_boxes[:, 2], bbox[2]) - np.maximum(kept_boxes[:, 0], bbox[0]), 0, None)
+            ih = np.clip(np.minimum(kept_boxes[:, 3], bbox[3]) - np.maximum(kept_boxes[:, 1], bbox[1]), 0, None)
+            kept_areas = (kept_boxes[:, 2] - kept_boxes[:, 0]) * (kept_boxes[:, 3] - kept_boxes[:, 1])
+            smaller = np.maximum(np.minimum(kept_areas, -neg_area), 1)
+            # cells of the same tile are distinct by definition
+            if np.any((iw * ih / smaller >= dedup_overlap) & (kept_tiles != tile_idx)):
+                continue
+        kept.append((tile_idx, cell_idx, cell))
+        kept_boxes = np.vstack([kept_boxes, bbox])
+        kept_tiles = np.append(kept_tiles, tile_idx)
+    kept.sort(key=lambda k: k[:2])
+    return [cell for _, _, cell in kept], len(candidates) - len(kept)
+
+
+class TiledPage:
+    """
+    An oversized page split into overlapping tiles that are parsed like pages.
+
+    Workers parse the tiles in any order and report them with `add`; the one adding
+    the last tile gets True back and merges the page with `merge`.
+
+    Args:
+        image: The page rendered at full resolution.
+    """
+
+    def __init__(self, image, tile_size=TILE_SIZE, overlap=TILE_OVERLAP):
+        self.image = image
+        self.boxes = plan_tiles(image.width, image.height, tile_size, overlap)
+        self.cells = [None] * len(self.boxes)
+        self.errors = {}
+        self.filtered = []
+        # a tile raised an unexpected error, the page was reported failed by that worker
+        self.aborted = False
+        self._remaining = len(self.boxes)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def tile_image(self, tile_idx):
+        return self.image.crop(self.boxes[tile_idx])
+
+    @property
+    def done(self):
+        return self._remaining == 0
+
+    def add(self, tile_idx, cells=None, error=None, filtered=False, abort=False):
+        """Records the cells (tile coordinates) or the error of a tile, returns True for the last tile."""
+        with self._lock:
+            self.aborted = self.aborted or abort
+            if error is not None:
+                self.errors[tile_idx] = error
+            else:
+                self.cells[tile_idx] = cells
+                if filtered:
+                    self.filtered.append(tile_idx)
+            self._remaining -= 1
+            return self._remaining == 0
+
+    def merge(self):
+        """
+        Returns:
+            tuple: (cells in page coordinates, tiling stats for the page result)
+        """
+        cells, duplicates = merge_tile_cells(self.boxes, self.cells, self.image.width, self.image.height)
+        stats = {
+            'tiles': len(self.boxes),
+            'failed': sorted(self.errors),
+            'filtered': sorted(self.filtered),
+            'duplicates': duplicates,
+        }
+        return cells, stats
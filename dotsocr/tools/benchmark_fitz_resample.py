@@ -0,0 +1,84 @@
+"""
+Parity and latency check of `get_image_by_fitz_doc` (direct resampling) against the
+png -> pdf -> pixmap round-trip it replaces (`get_image_by_fitz_roundtrip`).
+
+Every case must produce exactly the same output size; the pixel difference is
+reported as the mean absolute error on 0-255. Cases cover PIL inputs and png/jpg
+files with and without dpi metadata, including the oversized 72 dpi fallback.
+
+    python tools/benchmark_fitz_resample.py
+    python tools/benchmark_fitz_resample.py demo/demo_image1.jpg --random 200
+"""
+from argparse import ArgumentParser
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from dots_ocr.utils.image_utils import get_image_by_fitz_doc, get_image_by_fitz_roundtrip
+
+
+def synthetic_page(width, height, seed=0):
+    rng = random.Random(seed)
+    image = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(image)
+    for _ in range(40):
+        x, y = rng.randrange(width), rng.randrange(height)
+        draw.text((x, y), "dots.ocr 0123456789", fill=(0, 0, 0))
+        draw.rectangle((x, y, x + rng.randrange(1, 200), y + rng.randrange(1, 40)), outline=(rng.randrange(255), 0, 0))
+    return image
+
+
+def make_cases(tmp_dir, inputs, num_random):
+    cases = [(path, path) for path in inputs]
+    cases.append(("pil 1700x2250", synthetic_page(1700, 2250)))
+    cases.append(("pil 1000x777", synthetic_page(1000, 777)))
+    rng = random.Random(1234)
+    dpis = [None, (72, 72), (96, 96), (150, 150), (200, 100), (300, 300), (600, 600), (50, 50), (5000, 5000), (300.6, 300.6)]
+    for i in range(num_random):
+        width, height = rng.randrange(100, 4000), rng.randrange(100, 4000)
+        fmt = rng.choice(['png', 'jpg'])
+        dpi = rng.choice(dpis)
+        path = os.path.join(tmp_dir, f"case_{i}.{fmt}")
+        save_kwargs = {'dpi': dpi} if dpi else {}
+        synthetic_page(width, height, seed=i).save(path, **save_kwargs)
+        cases.append((f"{fmt} {width}x{height} dpi={dpi}", path))
+    return cases
+
+
+def timed(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    out = fn(*args, **kwargs)
+    return out, time.perf_counter() - t0
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('inputs', type=str, nargs='*')
+    parser.add_argument('--dpi', type=int, default=200)
+    parser.add_argument('--random', type=int, default=40, help="number of random synthetic files")
+    args = parser.parse_args()
+
+    mismatches = 0
+    total_old, total_new = 0.0, 0.0
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, image in make_cases(tmp_dir, args.inputs, args.random):
+            old, t_old = timed(get_image_by_fitz_roundtrip, image, target_dpi=args.dpi)
+            new, t_new = timed(get_image_by_fitz_doc, image, target_dpi=args.dpi)
+            total_old += t_old
+            total_new += t_new
+            same_size = old.size == new.size
+            mismatches += not same_size
+            mae = np.abs(np.asarray(old, dtype=np.int16) - np.asarray(new, dtype=np.int16)).mean() if same_size else float('nan')
+            print(f"{'OK ' if same_size else 'BAD'} {name:<36} {str(old.size):>14} {str(new.size):>14}  "
+                  f"mae {mae:5.2f}  fitz {t_old * 1000:7.1f}ms  direct {t_new * 1000:7.1f}ms")
+
+    print(f"\nsize mismatches: {mismatches}")
+    print(f"total fitz round-trip {total_old:.2f}s, direct {total_new:.2f}s, speedup {total_old / total_new:.2f}x")
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,111 @@
+"""
+Benchmark batched generation of the transformers backend.
+
+The same pages are run through GenerationBatcher at every batch size, fed by as many
+worker threads as the batch size (like the parser in hf mode), and the pages/s and
+generated tokens/s are reported. By default the model is the tiny random-weight config
+of tools/hf_tiny_model.py, whose generations rarely stop early, so every page produces
+about --max_new_tokens tokens; --full loads the real weights instead.
+
+    python tools/benchmark_hf_batch.py --pages 16 --batch_sizes 1 2 4 8
+    python tools/benchmark_hf_batch.py demo/demo_pdf1.pdf --full --max_new_tokens 1024
+"""
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+import os
+import sys
+import time
+
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from dots_ocr.model.hf_inference import build_hf_messages, generate_hf_batch, GenerationBatcher
+from dots_ocr.utils.doc_utils import load_images_from_pdf
+from dots_ocr.utils.image_utils import fetch_image
+from dots_ocr.utils.prompts import dict_promptmode_to_prompt
+from hf_tiny_model import load_tiny_hf_model, default_weights_dir
+
+
+def synthetic_pages(count, size=(896, 1152)):
+    pages = []
+    for i in range(count):
+        image = Image.new('RGB', size, 'white')
+        draw = ImageDraw.Draw(image)
+        for line in range(20):
+            draw.text((40, 40 + line * 50), f"page {i} line {line} " + "lorem ipsum " * 6, fill='black')
+        pages.append(image)
+    return pages
+
+
+def load_pages(inputs, count, max_pixels):
+    if not inputs:
+        images = synthetic_pages(count)
+    else:
+        images = []
+        for path in inputs:
+            images.extend(load_images_from_pdf(path) if path.lower().endswith('.pdf') else [Image.open(path)])
+        images = (images * (count // len(images) + 1))[:count]
+    return [fetch_image(image, max_pixels=max_pixels) for image in images]
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('inputs', type=str, nargs='*', help="pdfs/images, synthetic pages by default")
+    parser.add_argument('--pages', type=int, default=16)
+    parser.add_argument('--batch_sizes', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--max_new_tokens', type=int, default=128)
+    parser.add_argument('--max_pixels', type=int, default=1024 * 1024)
+    parser.add_argument('--prompt_mode', type=str, default="prompt_layout_all_en")
+    parser.add_argument('--model_dir', type=str, default=None)
+    parser.add_argument('--full', action='store_true', help="load the real weights instead of the tiny config")
+    parser.add_argument('--device', type=str, default="cuda")
+    args = parser.parse_args()
+
+    import torch
+    from qwen_vl_utils import process_vision_info
+
+    model_dir = args.model_dir or str(default_weights_dir())
+    if args.full:
+        from transformers import AutoModelForCausalLM, AutoProcessor
+        model = AutoModelForCausalLM.from_pretrained(
+            model_dir, attn_implementation="sdpa", torch_dtype=torch.bfloat16, trust_remote_code=True,
+        ).to(args.device).eval()
+        processor = AutoProcessor.from_pretrained(model_dir, trust_remote_code=True, use_fast=True)
+        processor.tokenizer.padding_side = "left"
+    else:
+        model, processor = load_tiny_hf_model(model_dir, device=args.device)
+
+    prompt = dict_promptmode_to_prompt[args.prompt_mode]
+    pages = load_pages(args.inputs, args.pages, args.max_pixels)
+    tokens = {'generated': 0}
+
+    def generate_batch(requests):
+        messages_list = [build_hf_messages(image, prompt) for image in requests]
+        responses = generate_hf_batch(
+            model, processor, process_vision_info, messages_list, [args.max_new_tokens] * len(requests), device=args.device,
+        )
+        tokens['generated'] += sum(len(processor.tokenizer(r).input_ids) for r in responses)
+        return responses
+
+    # warm-up, so kernels and allocator pools do not count against batch size 1
+    generate_batch(pages[:1])
+
+    print(f"{len(pages)} pages, max_new_tokens {args.max_new_tokens}, {'full' if args.full else 'tiny'} model on {args.device}")
+    print(f"{'batch':>5} {'seconds':>8} {'pages/s':>8} {'tokens/s':>9} {'calls':>6} {'speedup':>8}")
+    baseline = None
+    for batch_size in args.batch_sizes:
+        batcher = GenerationBatcher(generate_batch, max_batch_size=batch_size)
+        tokens['generated'] = 0
+        if args.device.startswith('cuda'):
+            torch.cuda.synchronize()
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(batch_size) as pool:
+            list(pool.map(batcher.submit, pages))
+        seconds = time.perf_counter() - t0
+        batcher.close()
+        rate = len(pages) / seconds
+        baseline = baseline or rate
+        print(f"{batch_size:>5} {seconds:>8.2f} {rate:>8.2f} {tokens['generated'] / seconds:>9.1f} "
+              f"{batcher.stats['batches']:>6} {rate / baseline:>7.2f}x")
@@ -0,0 +1,73 @@
+"""
+Benchmark the cpu path of the transformers backend in generated tokens/s.
+
+Each configuration (dtype, dynamic int8 quantization, intra-op thread count) builds the
+tiny random-weight config of tools/hf_tiny_model.py on the cpu and generates
+--max_new_tokens tokens for the same pages, one page per generate as in the parser's
+default hf mode. No real weights are loaded, so it runs on any cpu node that has the
+DotsOCR config and processor files.
+
+    python tools/benchmark_hf_cpu.py --threads 1 4 8 --pages 4
+    python tools/benchmark_hf_cpu.py --dtypes float32 bfloat16 --no_int8
+"""
+from argparse import ArgumentParser
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from dots_ocr.model.hf_inference import build_hf_messages, generate_hf_batch, quantize_int8
+from dots_ocr.utils.image_utils import fetch_image
+from dots_ocr.utils.prompts import dict_promptmode_to_prompt
+from hf_tiny_model import load_tiny_hf_model, default_weights_dir
+from benchmark_hf_batch import synthetic_pages
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--pages', type=int, default=4)
+    parser.add_argument('--max_new_tokens', type=int, default=64)
+    parser.add_argument('--max_pixels', type=int, default=512 * 512)
+    parser.add_argument('--threads', type=int, nargs='+', default=[os.cpu_count() or 1])
+    parser.add_argument('--dtypes', type=str, nargs='+', default=['float32'])
+    parser.add_argument('--no_int8', action='store_true', help="skip the dynamic int8 variant")
+    parser.add_argument('--vision_attn', type=str, default='sdpa', help="vision tower attention: sdpa, eager or eager_v2")
+    parser.add_argument('--model_dir', type=str, default=None)
+    args = parser.parse_args()
+
+    import torch
+    from qwen_vl_utils import process_vision_info
+
+    model_dir = args.model_dir or str(default_weights_dir())
+    prompt = dict_promptmode_to_prompt["prompt_layout_all_en"]
+    pages = [fetch_image(image, max_pixels=args.max_pixels) for image in synthetic_pages(args.pages)]
+
+    variants = [(dtype, False) for dtype in args.dtypes]
+    if not args.no_int8:
+        variants.append(('float32', True))
+
+    print(f"{len(pages)} pages of {pages[0].size}, max_new_tokens {args.max_new_tokens}, tiny model on cpu")
+    print(f"{'dtype':<10} {'int8':>5} {'threads':>8} {'s/page':>8} {'tokens/s':>9}")
+    for dtype, int8 in variants:
+        model, processor = load_tiny_hf_model(
+            model_dir, torch_dtype=getattr(torch, dtype), device="cpu",
+            attn_implementation="sdpa", vision_attn_implementation=args.vision_attn,
+        )
+        if int8:
+            model = quantize_int8(model)
+        for threads in args.threads:
+            torch.set_num_threads(threads)
+            # warm-up page, not timed
+            generate_hf_batch(model, processor, process_vision_info, [build_hf_messages(pages[0], prompt)], [8])
+            generated = 0
+            t0 = time.perf_counter()
+            with torch.inference_mode():
+                for page in pages:
+                    response = generate_hf_batch(
+                        model, processor, process_vision_info, [build_hf_messages(page, prompt)], [args.max_new_tokens],
+                    )[0]
+                    generated += len(processor.tokenizer(response).input_ids)
+            seconds = time.perf_counter() - t0
+            print(f"{dtype:<10} {'yes' if int8 else 'no':>5} {threads:>8} {seconds / len(pages):>8.2f} {generated / seconds:>9.1f}")
@@ -0,0 +1,93 @@
+"""
+Micro-benchmark of the markdown generation of a parsed page: two `layoutjson2md`
+calls (full and no header/footer, each cropping and encoding the pictures again)
+against one `layoutjson2md_variants` traversal sharing the rendered cells.
+
+The pages are synthetic and formula/picture heavy; the outputs of both paths must
+be identical, the script exits with 1 otherwise.
+
+    python tools/benchmark_markdown_render.py
+    python tools/benchmark_markdown_render.py --cells 300 --pictures 20 --repeat 20
+"""
+from argparse import ArgumentParser
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw
+
+from dots_ocr.utils.format_transformer import layoutjson2md, layoutjson2md_variants
+
+
+FORMULAS = [
+    r"\frac{a}{b} + \sum_{i=1}^{n} x_i^2",
+    r"$$E = mc^2$$",
+    r"\[ \int_0^1 f(x) \, dx \]",
+    r"\documentclass{article}\usepackage{amsmath}\begin{document}\alpha + \beta\end{document}",
+    r"$x$ and $y$ are inline",
+]
+
+
+def synthetic_page(num_cells, num_pictures, width=1700, height=2200, seed=0):
+    rng = random.Random(seed)
+    image = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(image)
+    for _ in range(200):
+        x, y = rng.randrange(width), rng.randrange(height)
+        draw.rectangle((x, y, x + rng.randrange(5, 300), y + rng.randrange(5, 200)), fill=tuple(rng.randrange(256) for _ in range(3)))
+
+    cells = [{'bbox': [20, 10, 800, 50], 'category': 'Page-header', 'text': 'header'}]
+    picture_ids = set(rng.sample(range(num_cells), num_pictures))
+    for i in range(num_cells):
+        x1, y1 = rng.randrange(width - 400), rng.randrange(height - 400)
+        bbox = [x1, y1, x1 + rng.randrange(50, 400), y1 + rng.randrange(20, 400)]
+        if i in picture_ids:
+            cells.append({'bbox': bbox, 'category': 'Picture'})
+        elif i % 2:
+            cells.append({'bbox': bbox, 'category': 'Formula', 'text': rng.choice(FORMULAS)})
+        else:
+            cells.append({'bbox': bbox, 'category': 'Text', 'text': f"  `$paragraph {i}$` with some text  "})
+    cells.append({'bbox': [20, height - 50, 800, height - 10], 'category': 'Page-footer', 'text': 'footer'})
+    return image, cells
+
+
+def timed(fn, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        out = fn()
+    return out, (time.perf_counter() - t0) / repeat
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--cells', type=int, default=120)
+    parser.add_argument('--pictures', type=int, default=12)
+    parser.add_argument('--pages', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--image_encoding', type=str, default='png')
+    args = parser.parse_args()
+
+    mismatches = 0
+    total_old, total_new = 0.0, 0.0
+    for page in range(args.pages):
+        image, cells = synthetic_page(args.cells, args.pictures, seed=page)
+        (full, nohf), t_old = timed(lambda: (
+            layoutjson2md(image, cells, image_encoding=args.image_encoding),
+            layoutjson2md(image, cells, no_page_hf=True, image_encoding=args.image_encoding),
+        ), args.repeat)
+        contents, t_new = timed(lambda: layoutjson2md_variants(
+            image, cells, variants=('full', 'nohf'), image_encoding=args.image_encoding,
+        ), args.repeat)
+        same = contents['full'] == full and contents['nohf'] == nohf
+        mismatches += not same
+        total_old += t_old
+        total_new += t_new
+        print(f"{'OK ' if same else 'BAD'} page {page}  {len(cells)} cells  "
+              f"two calls {t_old * 1000:8.1f}ms  single pass {t_new * 1000:8.1f}ms  speedup {t_old / t_new:5.2f}x")
+
+    print(f"\noutput mismatches: {mismatches}")
+    print(f"total two calls {total_old:.3f}s, single pass {total_new:.3f}s, speedup {total_old / total_new:.2f}x")
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,132 @@
+"""
+Benchmark the single-pass cleaner against the former regex cleaner on broken layout responses.
+
+A synthetic corpus of degenerate outputs is built for each target length: truncated
+responses, loops repeating one cell or one category-text pair until the token cap,
+missing delimiters between cells, unescaped quotes and formula braces inside texts. Each
+response is cleaned as the parser does (string cleaning, then the category-text / bbox
+deduplication) by OutputCleaner.clean_string_data and by clean_string_data_regex.
+Reported per case: the best time of --repeat runs and the recovered cells, with how many
+of them are exactly the expected ones (the complete, well-formed cells of the response
+after the same deduplication).
+
+The scanner is ahead on every case; the closest are loop_text and formulas at 100k
+characters (1.1-1.3x): most of their time is the category-text / bbox deduplication both
+cleaners share, and on formulas the scanner repairs the cells with unescaped quotes, so it
+hands more cells to it. A truncated response skips the full json parse (it cannot end with
+']'), which used to fail at its very end and cost as much as the scan itself. The timings
+are in milliseconds, use a larger --repeat when the machine is busy.
+
+    python tools/benchmark_output_cleaner.py
+    python tools/benchmark_output_cleaner.py --lengths 20000 100000 --repeat 3 --verbose
+"""
+from argparse import ArgumentParser
+import contextlib
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dots_ocr.utils.output_cleaner import OutputCleaner
+
+
+WORDS = "the of layout model page table figure text formula header footer caption section list item".split()
+
+
+def random_cell(rng, index, text=None):
+    x, y = rng.randrange(0, 1500), index * 24 % 2000
+    return {
+        'bbox': [x, y, x + rng.randrange(40, 600), y + rng.randrange(12, 60)],
+        'category': rng.choice(['Text', 'Title', 'List-item', 'Caption']),
+        'text': text if text is not None else ' '.join(rng.choice(WORDS) for _ in range(rng.randrange(3, 30))),
+    }
+
+
+def build_case(kind, length, rng):
+    """Returns (response, well-formed cells complete in the response)."""
+    cells, parts, size, i = [], [], 1, 0
+    loop_cell = None
+    while size < length:
+        if kind == 'loop_cell' and i >= 20:
+            loop_cell = loop_cell or random_cell(rng, i)
+            cell = loop_cell
+        elif kind == 'loop_text' and i >= 20:
+            cell = random_cell(rng, i, text="the same line over and over")
+            cell['category'] = 'Text'
+        elif kind in ('braces', 'formulas'):
+            cell = random_cell(rng, i, text=r"\frac{a_{i}}{b} + \sqrt{x^{2}}" if i % 3 == 0 else None)
+        else:
+            cell = random_cell(rng, i)
+        part = json.dumps(cell, ensure_ascii=False)
+        if kind in ('quotes', 'formulas') and i % 20 == 5:
+            part = part[:-2] + ' "quoted" word"}'  # an unescaped quote pair in the text
+        else:
+            cells.append(cell)
+        parts.append(part)
+        size += len(part) + 2
+        i += 1
+    sep = '' if kind == 'missing_delimiters' else ', '
+    response = '[' + sep.join(parts)
+    # cut inside the last cell, as the token cap does
+    last = parts[-1]
+    response = response[:len(response) - len(last) + rng.randrange(1, len(last) - 1)]
+    cells = cells[:-1] if parts[-1] == json.dumps(cells[-1], ensure_ascii=False) else cells
+    return response, cells
+
+
+def clean(cleaner, response, regex):
+    result = (cleaner.clean_string_data_regex if regex else cleaner.clean_string_data)(response, 0)
+    if result.success and result.cleaned_data:
+        return cleaner.remove_duplicate_category_text_pairs_and_bbox(result.cleaned_data, 0)
+    return result.cleaned_data
+
+
+def timed(cleaner, response, repeat):
+    """Best seconds and recovered cells of each cleaner; the two alternate so that load changes hit both."""
+    best, cells = {}, {}
+    for _ in range(repeat):
+        for name, regex in (('regex', True), ('scan', False)):
+            t0 = time.perf_counter()
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                cells[name] = clean(cleaner, response, regex)
+            seconds = time.perf_counter() - t0
+            best[name] = min(best.get(name, seconds), seconds)
+    return best, cells
+
+
+def matching(cells, expected):
+    keys = {json.dumps(cell, sort_keys=True) for cell in expected}
+    return sum(isinstance(cell, dict) and json.dumps(cell, sort_keys=True) in keys for cell in cells)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--lengths', type=int, nargs='+', default=[10000, 50000, 100000], help="response lengths in characters")
+    parser.add_argument('--kinds', type=str, nargs='+',
+                        default=['truncated', 'loop_cell', 'loop_text', 'missing_delimiters', 'quotes', 'braces', 'formulas'])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--verbose', action='store_true', help="time the cleaners with their logging on (to /dev/null)")
+    args = parser.parse_args()
+
+    cleaner = OutputCleaner(verbose=args.verbose)
+    print(f"{'case':<20} {'chars':>7} {'expected':>9} | {'regex ms':>9} {'cells':>6} {'ok':>6} | {'scan ms':>8} {'cells':>6} {'ok':>6} | {'speedup':>7}")
+    totals = {'regex': 0.0, 'scan': 0.0}
+    for kind in args.kinds:
+        for length in args.lengths:
+            rng = random.Random(f"{args.seed}-{kind}-{length}")
+            response, cells = build_case(kind, length, rng)
+            expected = OutputCleaner(verbose=False).remove_duplicate_category_text_pairs_and_bbox(cells, 0)
+            row = {}
+            best, recovered = timed(cleaner, response, args.repeat)
+            for name in ('regex', 'scan'):
+                totals[name] += best[name]
+                row[name] = (best[name] * 1000, len(recovered[name]), matching(recovered[name], expected))
+            print(f"{kind:<20} {len(response):>7} {len(expected):>9} | "
+                  f"{row['regex'][0]:>9.2f} {row['regex'][1]:>6} {row['regex'][2]:>6} | "
+                  f"{row['scan'][0]:>8.2f} {row['scan'][1]:>6} {row['scan'][2]:>6} | "
+                  f"{row['regex'][0] / max(row['scan'][0], 1e-9):>6.1f}x")
+    print(f"total: regex {totals['regex'] * 1000:.1f} ms, scan {totals['scan'] * 1000:.1f} ms")
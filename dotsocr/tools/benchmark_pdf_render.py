@@ -0,0 +1,63 @@
+"""
+Compare pdf rasterization throughput of the serial path (`iter_images_from_pdf`)
+with the multi-process shared-memory path (`PdfRasterizer`).
+
+    python tools/benchmark_pdf_render.py demo/demo_pdf1.pdf --dpi 200 --workers 2 4 8 --repeat 10
+"""
+from argparse import ArgumentParser
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz
+
+from dots_ocr.utils.doc_utils import iter_images_from_pdf, PdfRasterizer
+
+
+def repeat_pdf(pdf_file, repeat, save_path):
+    src = fitz.open(pdf_file)
+    doc = fitz.open()
+    for _ in range(repeat):
+        doc.insert_pdf(src)
+    doc.save(save_path)
+    return save_path
+
+
+def run(pages, name):
+    t0 = time.perf_counter()
+    count = 0
+    for _, image in pages:
+        count += 1
+        del image
+    elapsed = time.perf_counter() - t0
+    print(f"{name:<24} {count:>5} pages  {elapsed:8.2f}s  {count / elapsed:8.2f} pages/s")
+    return count / elapsed
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('pdf', type=str)
+    parser.add_argument('--dpi', type=int, default=200)
+    parser.add_argument('--workers', type=int, nargs='+', default=[2, 4])
+    parser.add_argument('--chunk_size', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=1, help="concatenate the pdf n times to get a longer document")
+    args = parser.parse_args()
+
+    pdf_file = args.pdf
+    if args.repeat > 1:
+        pdf_file = repeat_pdf(args.pdf, args.repeat, os.path.join(os.path.dirname(os.path.abspath(args.pdf)), "_benchmark_render.pdf"))
+
+    try:
+        serial = run(iter_images_from_pdf(pdf_file, dpi=args.dpi), "serial")
+        for num_workers in args.workers:
+            rasterizer = PdfRasterizer(num_workers=num_workers, chunk_size=args.chunk_size)
+            # the first pass includes process start-up, the second one runs on warm workers
+            run(rasterizer.iter_images(pdf_file, dpi=args.dpi), f"process x{num_workers} (cold)")
+            speed = run(rasterizer.iter_images(pdf_file, dpi=args.dpi), f"process x{num_workers} (warm)")
+            rasterizer.close()
+            print(f"{'':<24} speedup vs serial: {speed / serial:.2f}x")
+    finally:
+        if pdf_file != args.pdf:
+            os.remove(pdf_file)
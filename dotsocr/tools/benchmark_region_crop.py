@@ -0,0 +1,129 @@
+"""
+Benchmark crop mode against full-page grounding for region OCR.
+
+Every region of the page is read twice through DotsOCRParser.parse_regions: grounded
+on the whole smart_resized page (prompt_grounding_ocr + bbox) and as its padded crop
+(prompt_ocr). Reported per mode: the visual tokens of the model input (one per 28x28
+pixels after the 2x2 patch merge), the wall time and mean region latency, and the text
+agreement between the two modes (difflib ratio, 1.0 for identical answers).
+
+The regions are the text cells of a layout json of the page (--layout_json, e.g. one
+written by the parser), or a grid of horizontal bands by default. Without --port a
+fake vLLM server is started in process; it answers every request alike, so latency
+then only reflects the encoding and transfer cost and agreement is meaningless.
+
+    python tools/benchmark_region_crop.py demo/demo_image1.jpg --regions 16
+    python tools/benchmark_region_crop.py page.jpg --layout_json output/page/page.json --port 8000
+"""
+from argparse import ArgumentParser
+import difflib
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from dots_ocr.parser import DotsOCRParser, REOCR_CATEGORIES
+from dots_ocr.utils.consts import IMAGE_FACTOR
+from dots_ocr.utils.image_utils import fetch_image
+from fake_vllm_server import start_fake_server
+
+
+def visual_tokens(image):
+    return (image.height // IMAGE_FACTOR) * (image.width // IMAGE_FACTOR)
+
+
+def band_regions(image, count):
+    """`count` horizontal bands over the middle 80% of the page width."""
+    height = image.height / (count + 1)
+    x1, x2 = int(image.width * 0.1), int(image.width * 0.9)
+    return [[x1, int(height * (i + 0.5)), x2, int(height * (i + 1.5))] for i in range(count)]
+
+
+def load_regions(path, count):
+    with open(path, encoding='utf-8') as f:
+        cells = json.load(f)
+    return [cell['bbox'] for cell in cells if cell.get('category') in REOCR_CATEGORIES][:count]
+
+
+def run(dots_parser, image, bboxes, crop):
+    """Returns (visual tokens, wall seconds, mean region seconds, results) of one mode."""
+    origin_image = fetch_image(image)
+    requests = dots_parser._prepare_regions(origin_image, bboxes, crop=crop)
+    if crop:
+        tokens = sum(
+            visual_tokens(dots_parser._prepare_page(origin_image, "prompt_grounding_ocr", bbox=bbox, crop=True)["image"])
+            for bbox in bboxes
+        )
+    else:
+        # the vision tower encodes the whole page again for every region request
+        page = dots_parser._prepare_page(origin_image, "prompt_grounding_ocr", bbox=bboxes[0], crop=False)
+        tokens = visual_tokens(page["image"]) * len(requests)
+
+    region_seconds = []
+    inference = dots_parser._inference
+
+    def _timed(*args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return inference(*args, **kwargs)
+        finally:
+            region_seconds.append(time.perf_counter() - t0)
+
+    dots_parser._inference = _timed
+    t0 = time.perf_counter()
+    try:
+        results = dots_parser.parse_regions(origin_image, bboxes, crop=crop)
+    finally:
+        dots_parser._inference = inference
+    wall = time.perf_counter() - t0
+    return tokens, wall, sum(region_seconds) / len(region_seconds), results
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('image', type=str)
+    parser.add_argument('--layout_json', type=str, default=None, help="take the regions from the text cells of this layout json")
+    parser.add_argument('--regions', type=int, default=16)
+    parser.add_argument('--ip', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=None, help="vLLM server port, a fake server in process by default")
+    parser.add_argument('--model_name', type=str, default='model')
+    parser.add_argument('--num_thread', type=int, default=8)
+    parser.add_argument('--image_encoding', type=str, default='png')
+    args = parser.parse_args()
+
+    server = None
+    port = args.port
+    if port is None:
+        server, _ = start_fake_server(latency=0.05)
+        port = server.server_address[1]
+
+    image = fetch_image(args.image)
+    bboxes = load_regions(args.layout_json, args.regions) if args.layout_json else band_regions(image, args.regions)
+    assert bboxes, "no text regions found"
+    dots_parser = DotsOCRParser(
+        ip=args.ip, port=port, model_name=args.model_name, num_thread=args.num_thread,
+        image_encoding=args.image_encoding, request_retries=0,
+    )
+
+    print(f"{len(bboxes)} regions of a {image.width}x{image.height} page, {args.num_thread} threads"
+          + ("" if args.port else ", fake server"))
+    print(f"{'mode':<10} {'visual tokens':>14} {'per region':>11} {'wall s':>8} {'region s':>9}")
+    outputs = {}
+    for name, crop in (("page", False), ("crop", True)):
+        tokens, wall, mean, results = run(dots_parser, image, bboxes, crop)
+        outputs[name] = results
+        print(f"{name:<10} {tokens:>14} {tokens / len(bboxes):>11.0f} {wall:>8.2f} {mean:>9.3f}")
+
+    ratios = [
+        difflib.SequenceMatcher(None, page.get('text', ''), crop.get('text', '')).ratio()
+        for page, crop in zip(outputs['page'], outputs['crop'])
+    ]
+    failed = sum('error' in r for results in outputs.values() for r in results)
+    print(f"text agreement: mean {sum(ratios) / len(ratios):.3f}, min {min(ratios):.3f}, "
+          f"{sum(r == 1.0 for r in ratios)}/{len(ratios)} identical, {failed} failed requests")
+    dots_parser.close()
+    if server is not None:
+        server.shutdown()
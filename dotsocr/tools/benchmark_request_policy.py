@@ -0,0 +1,90 @@
+"""
+Benchmark the request policy (timeouts, retries, hedging) against the fake vLLM server.
+
+A fake server with latency jitter, injected 503s and stalled requests is started in
+process; the same page requests are then sent through RequestPolicy configurations
+without retries, with retries, and with retries plus hedging. Requests go through
+`acall` (hedging is async only, the loser is cancelled), at most --concurrency at a time.
+For each one it reports the failed pages and the p50/p95/p99/max page latency.
+
+    python tools/benchmark_request_policy.py --requests 200 --concurrency 8 --stall_rate 0.03
+"""
+from argparse import ArgumentParser
+import asyncio
+import os
+import sys
+import time
+
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from dots_ocr.model.inference import ainference_with_vllm, aclose_async_clients
+from dots_ocr.model.request_policy import RequestPolicy, RequestFailedError
+from fake_vllm_server import start_fake_server
+
+
+def quantile(samples, q):
+    return samples[min(len(samples) - 1, int(q * len(samples)))] if samples else float('nan')
+
+
+async def run(policy, port, image, requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _page():
+        async with semaphore:
+            t0 = time.perf_counter()
+            try:
+                await policy.acall(lambda timeout: ainference_with_vllm(
+                    image, "ocr", ip='127.0.0.1', port=port, timeout=timeout, max_retries=0,
+                ))
+                ok = True
+            except RequestFailedError:
+                ok = False
+            return ok, time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    outcomes = await asyncio.gather(*(_page() for _ in range(requests)))
+    wall = time.perf_counter() - t0
+    await aclose_async_clients()
+    latencies = sorted(seconds for ok, seconds in outcomes if ok)
+    failed = sum(1 for ok, _ in outcomes if not ok)
+    return failed, latencies, wall
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--jitter', type=float, default=0.1)
+    parser.add_argument('--fail_rate', type=float, default=0.05)
+    parser.add_argument('--stall_rate', type=float, default=0.03)
+    parser.add_argument('--stall_seconds', type=float, default=10.0)
+    parser.add_argument('--timeout', type=float, default=5.0, help="per attempt timeout of the policies")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    image = Image.new('RGB', (64, 64), 'white')
+    configs = [
+        ("single attempt", dict(timeout=args.timeout, max_retries=0)),
+        ("retries", dict(timeout=args.timeout, max_retries=2, backoff=0.1)),
+        ("retries + hedge", dict(timeout=args.timeout, max_retries=2, backoff=0.1, hedge=True)),
+    ]
+    print(f"{args.requests} requests, concurrency {args.concurrency}, latency {args.latency}+/-{args.jitter}s, "
+          f"{args.fail_rate:.0%} 503s, {args.stall_rate:.0%} stalls of {args.stall_seconds}s, timeout {args.timeout}s")
+    print(f"{'policy':<16} {'failed':>7} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'max s':>7} {'wall s':>7} {'attempts':>9} {'hedges':>7}")
+    for name, kwargs in configs:
+        # a fresh server per policy, with the same seed, sees the same failure sequence
+        server, _ = start_fake_server(
+            latency=args.latency, jitter=args.jitter, fail_rate=args.fail_rate,
+            stall_rate=args.stall_rate, stall_seconds=args.stall_seconds, seed=args.seed,
+        )
+        policy = RequestPolicy(**kwargs)
+        failed, latencies, wall = asyncio.run(run(policy, server.server_address[1], image, args.requests, args.concurrency))
+        stats = policy.stats
+        print(f"{name:<16} {failed:>7} {quantile(latencies, 0.5):>7.2f} {quantile(latencies, 0.95):>7.2f} "
+              f"{quantile(latencies, 0.99):>7.2f} {latencies[-1] if latencies else float('nan'):>7.2f} {wall:>7.2f} "
+              f"{stats['attempts']:>9} {stats['hedges']:>7}")
+        server.shutdown()
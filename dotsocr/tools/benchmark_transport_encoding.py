@@ -0,0 +1,90 @@
+"""
+Benchmark the image transport encodings used for model requests.
+
+For every encoding in TRANSPORT_ENCODINGS this reports the mean encode time and
+payload size over a fixed sample set (the pages of the given pdfs/images, rendered
+and resized exactly like the parser does). With --ip/--port it also sends every
+sample to a vLLM server and checks whether the OCR output equals the one obtained
+with the default png encoding.
+
+    python tools/benchmark_transport_encoding.py demo/demo_pdf1.pdf demo/demo_image1.jpg
+    python tools/benchmark_transport_encoding.py demo/demo_pdf1.pdf --ip localhost --port 8000
+"""
+from argparse import ArgumentParser
+import difflib
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dots_ocr.utils.consts import image_extensions
+from dots_ocr.utils.doc_utils import load_images_from_pdf
+from dots_ocr.utils.image_utils import fetch_image, encode_image_for_transport, TRANSPORT_ENCODINGS
+from dots_ocr.utils.prompts import dict_promptmode_to_prompt
+
+
+def load_samples(paths, dpi):
+    samples = []
+    for path in paths:
+        ext = os.path.splitext(path)[1].lower()
+        if ext == '.pdf':
+            images = load_images_from_pdf(path, dpi=dpi)
+        elif ext in image_extensions:
+            images = [fetch_image(path)]
+        else:
+            raise ValueError(f"unsupported sample {path}")
+        # same preprocessing as the parser with default min/max pixels: rgb, no resize
+        samples.extend(fetch_image(image) for image in images)
+    return samples
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('inputs', type=str, nargs='+')
+    parser.add_argument('--dpi', type=int, default=200)
+    parser.add_argument('--encodings', type=str, nargs='+', default=list(TRANSPORT_ENCODINGS))
+    parser.add_argument('--ip', type=str, default=None, help="vLLM server ip, enables the OCR equality check")
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--model_name', type=str, default="model")
+    parser.add_argument('--prompt_mode', type=str, default="prompt_layout_all_en")
+    args = parser.parse_args()
+
+    samples = load_samples(args.inputs, args.dpi)
+    print(f"{len(samples)} samples, sizes: {sorted(set(s.size for s in samples))}")
+
+    reference = None
+    if args.ip:
+        from dots_ocr.model.inference import inference_with_vllm
+        prompt = dict_promptmode_to_prompt[args.prompt_mode]
+
+        def ocr(encoding):
+            return [
+                inference_with_vllm(
+                    sample, prompt, ip=args.ip, port=args.port, model_name=args.model_name,
+                    temperature=0.0, top_p=1.0, image_encoding=encoding,
+                ) or ""
+                for sample in samples
+            ]
+        reference = ocr('png')
+
+    print(f"{'encoding':<10} {'encode ms':>10} {'payload KB':>11} {'vs png':>7} {'equal':>7} {'similarity':>11}")
+    png_size = None
+    for encoding in args.encodings:
+        times, sizes = [], []
+        for sample in samples:
+            t0 = time.perf_counter()
+            url = encode_image_for_transport(sample, encoding)
+            times.append(time.perf_counter() - t0)
+            sizes.append(len(url))
+        mean_ms = sum(times) / len(times) * 1000
+        mean_kb = sum(sizes) / len(sizes) / 1024
+        if encoding == 'png':
+            png_size = mean_kb
+        ratio = f"{mean_kb / png_size:.2f}" if png_size else "-"
+        equal, similarity = "-", "-"
+        if reference is not None:
+            outputs = ocr(encoding)
+            equal = f"{sum(a == b for a, b in zip(outputs, reference))}/{len(samples)}"
+            similarity = f"{sum(difflib.SequenceMatcher(None, a, b).ratio() for a, b in zip(outputs, reference)) / len(samples):.4f}"
+        print(f"{encoding:<10} {mean_ms:>10.1f} {mean_kb:>11.1f} {ratio:>7} {equal:>7} {similarity:>11}")
@@ -0,0 +1,152 @@
+"""
+A minimal OpenAI compatible chat completions server standing in for vLLM.
+
+It answers every request with the same layout json after a random latency and can
+inject failures (503) and stalls, so request handling (timeouts, retries, hedging,
+streaming) can be exercised without a GPU. GET /metrics returns the request counters.
+
+    python tools/fake_vllm_server.py --port 8000 --latency 0.5 --jitter 0.2 --fail_rate 0.05 --stall_rate 0.02
+"""
+from argparse import ArgumentParser
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import json
+import random
+import threading
+import time
+
+
+DEFAULT_RESPONSE = [
+    {"bbox": [10, 10, 200, 60], "category": "Title", "text": "# Hello"},
+    {"bbox": [10, 80, 600, 140], "category": "Text", "text": "A paragraph served by the fake server."},
+    {"bbox": [10, 160, 400, 200], "category": "Formula", "text": "$$x^2$$"},
+    {"bbox": [10, 980, 400, 1010], "category": "Page-footer", "text": "1"},
+]
+
+
+class FakeServerState:
+    """Latency and failure model of the server, and its counters."""
+
+    def __init__(self, latency=0.2, jitter=0.0, fail_rate=0.0, stall_rate=0.0, stall_seconds=30.0, response=None, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+        self.content = json.dumps(response or DEFAULT_RESPONSE, ensure_ascii=False)
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.metrics = {'requests': 0, 'failed': 0, 'stalled': 0, 'completed': 0}
+
+    def draw(self):
+        """Returns ('fail' | 'stall' | 'ok', seconds to wait) for a new request."""
+        with self.lock:
+            self.metrics['requests'] += 1
+            r = self.random.random()
+            delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+            if r < self.fail_rate:
+                self.metrics['failed'] += 1
+                return 'fail', delay / 2
+            if r < self.fail_rate + self.stall_rate:
+                self.metrics['stalled'] += 1
+                return 'stall', self.stall_seconds
+            return 'ok', delay
+
+    def count(self, key):
+        with self.lock:
+            self.metrics[key] += 1
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('content-type', 'application/json')
+            self.send_header('content-length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.rstrip('/') in ('/health', ''):
+                self._send_json(200, {'status': 'ok'})
+            else:
+                with state.lock:
+                    self._send_json(200, dict(state.metrics))
+
+        def do_POST(self):
+            length = int(self.headers.get('content-length', 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+            outcome, delay = state.draw()
+            try:
+                time.sleep(delay)
+                if outcome == 'fail':
+                    self._send_json(503, {'error': {'message': 'injected failure', 'type': 'server_error'}})
+                    return
+                if request.get('stream'):
+                    self._stream(request)
+                else:
+                    self._send_json(200, {
+                        'id': 'fake', 'object': 'chat.completion', 'created': int(time.time()), 'model': request.get('model', 'model'),
+                        'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': state.content}}],
+                        'usage': {'prompt_tokens': 1, 'completion_tokens': len(state.content) // 4, 'total_tokens': 1 + len(state.content) // 4},
+                    })
+                state.count('completed')
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # the client gave up (timeout, or a hedged request that lost)
+
+        def _stream(self, request):
+            self.send_response(200)
+            self.send_header('content-type', 'text/event-stream')
+            self.send_header('connection', 'close')
+            self.end_headers()
+            self.close_connection = True
+            content = state.content
+            step = 32
+            for i, start in enumerate(range(0, len(content), step)):
+                chunk = {
+                    'id': 'fake', 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': request.get('model', 'model'),
+                    'choices': [{'index': 0, 'delta': {'content': content[start:start + step]}, 'finish_reason': None}],
+                    'usage': {'prompt_tokens': 1, 'completion_tokens': i + 1, 'total_tokens': i + 2},
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+            done = {'id': 'fake', 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': request.get('model', 'model'),
+                    'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]}
+            self.wfile.write(f"data: {json.dumps(done)}\n\ndata: [DONE]\n\n".encode())
+            self.wfile.flush()
+
+    return Handler
+
+
+def start_fake_server(port=0, **kwargs):
+    """Starts the server in a daemon thread, returns (server, state); server.server_address[1] is the port."""
+    state = FakeServerState(**kwargs)
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.2, help="mean seconds per request")
+    parser.add_argument('--jitter', type=float, default=0.0, help="uniform +/- jitter of the latency")
+    parser.add_argument('--fail_rate', type=float, default=0.0, help="fraction of requests answered with a 503")
+    parser.add_argument('--stall_rate', type=float, default=0.0, help="fraction of requests stalling for --stall_seconds")
+    parser.add_argument('--stall_seconds', type=float, default=30.0)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), make_handler(FakeServerState(
+        latency=args.latency, jitter=args.jitter, fail_rate=args.fail_rate,
+        stall_rate=args.stall_rate, stall_seconds=args.stall_seconds, seed=args.seed,
+    )))
+    server.daemon_threads = True
+    print(f"fake vllm server on http://127.0.0.1:{args.port}/v1")
+    server.serve_forever()
@@ -0,0 +1,68 @@
+"""
+A tiny random-weight DotsOCR model for benchmarks of the transformers backend.
+
+The architecture code, the processor and the config come from the DotsOCR weights
+directory (`DOTS_WEIGHTS_DIR` or dotsocr/weights/DotsOCR, only its small files are read);
+the config is shrunk to a few narrow layers and the model is built with random weights,
+so no checkpoint has to be loaded and the numbers only measure the inference path.
+"""
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dots_ocr.model.hf_inference import resolve_hf_dtype
+
+
+TINY_CONFIG = {
+    'hidden_size': 256,
+    'intermediate_size': 512,
+    'num_hidden_layers': 2,
+    'num_attention_heads': 4,
+    'num_key_value_heads': 2,
+}
+TINY_VISION_CONFIG = {
+    'embed_dim': 128,
+    'intermediate_size': 256,
+    'num_hidden_layers': 2,
+    'num_attention_heads': 4,
+}
+
+
+def default_weights_dir():
+    env_dir = os.environ.get("DOTS_WEIGHTS_DIR")
+    if env_dir:
+        return Path(env_dir).expanduser().resolve()
+    return Path(__file__).resolve().parent.parent / "weights" / "DotsOCR"
+
+
+def load_tiny_hf_model(model_dir=None, torch_dtype=None, device="cuda", attn_implementation="sdpa", vision_attn_implementation=None):
+    """
+    Returns (model, processor) with the DotsOCR architecture shrunk to `TINY_CONFIG`.
+
+    The processor's tokenizer is left padded, as in the parser. `torch_dtype` defaults to
+    the parser's choice for `device` (bfloat16 on gpu, float32 on cpu).
+    """
+    import torch
+    from transformers import AutoConfig, AutoModelForCausalLM, AutoProcessor
+
+    model_dir = str(model_dir or default_weights_dir())
+    config = AutoConfig.from_pretrained(model_dir, trust_remote_code=True)
+    for key, value in TINY_CONFIG.items():
+        setattr(config, key, value)
+    for key, value in TINY_VISION_CONFIG.items():
+        setattr(config.vision_config, key, value)
+    # the vision merger projects into the language model width
+    config.vision_config.hidden_size = config.hidden_size
+    config.vision_config.attn_implementation = vision_attn_implementation or attn_implementation
+    config._attn_implementation = attn_implementation
+
+    torch.manual_seed(0)
+    model = AutoModelForCausalLM.from_config(
+        config, trust_remote_code=True, torch_dtype=torch_dtype or resolve_hf_dtype(None, device),
+    )
+    model = model.to(device).eval()
+    processor = AutoProcessor.from_pretrained(model_dir, trust_remote_code=True, use_fast=True)
+    processor.tokenizer.padding_side = "left"
+    return model, processor